@@ -1,10 +1,65 @@
 # -*- coding: utf-8
 """APIs to add suggestions to exceptions."""
-from didyoumean_internal import add_suggestions_to_exception
+from didyoumean_internal import add_suggestions_to_exception, configure,\
+    get_suggester_stats, SUGGESTER_SINKS
 import functools
 import sys
 
 
+def didyoumean_configure(**settings):
+    """Configure the way suggestions are computed by all the APIs.
+
+    Available settings are:
+     - time_budget: maximum time (in seconds) spent to compute suggestions
+        for an exception, None for no limit (default).
+     - lazy: whether suggestions are computed only when the exception is
+        converted to string (displayed, logged, etc) so that nothing is
+        computed for exceptions which are handled, False by default.
+     - instrumentation: whether statistics are recorded for each function
+        providing suggestions (see didyoumean_stats), False by default.
+     - attribute_cache_size: maximum number of (type, attribute) pairs for
+        which suggestions are kept in cache, 256 by default (0 to disable).
+     - top_k: number of suggestions kept, ranked by score (similarity for
+        typos), None for all the suggestions in the order they are found
+        (default). Sources which can not provide better suggestions are
+        then skipped.
+     - all_frames: whether names and functions are also looked up in the
+        namespaces of the caller frames from the traceback (each namespace
+        being searched once), False by default.
+    The previous values of the settings changed are returned.
+    """
+    return configure(**settings)
+
+
+def didyoumean_stats(reset=False):
+    """Get statistics about the functions providing suggestions.
+
+    Statistics are recorded only when instrumentation is enabled (see
+    didyoumean_configure). They are returned as a dict mapping the name of
+    each function to a dict with: calls, matches (calls where the error
+    message matched), match_rate, match_time, suggestion_time (in seconds)
+    and suggestions (number of suggestions yielded).
+    If `reset` is set, statistics are cleared.
+    """
+    return get_suggester_stats(reset)
+
+
+def didyoumean_add_stats_sink(callback):
+    """Add a callback called for each call of a function providing suggestions.
+
+    When instrumentation is enabled (see didyoumean_configure), the callback
+    is called with a SuggesterRecord (namedtuple with name, error_type,
+    matched, match_time, suggestion_time and suggestions), for instance to
+    forward it to a metrics system.
+    """
+    SUGGESTER_SINKS.append(callback)
+
+
+def didyoumean_remove_stats_sink(callback):
+    """Remove a callback added with didyoumean_add_stats_sink."""
+    SUGGESTER_SINKS.remove(callback)
+
+
 def didyoumean_decorator(func):
     """Decorator to add suggestions to exceptions.
 
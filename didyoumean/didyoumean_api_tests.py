@@ -1,12 +1,31 @@
 # -*- coding: utf-8
 """Unit tests for didyoumean APIs."""
 from didyoumean_api import didyoumean_decorator, didyoumean_contextmanager,\
-    didyoumean_postmortem, didyoumean_enablehook, didyoumean_disablehook
+    didyoumean_postmortem, didyoumean_enablehook, didyoumean_disablehook,\
+    didyoumean_configure, didyoumean_stats, didyoumean_add_stats_sink,\
+    didyoumean_remove_stats_sink
 from didyoumean_common_tests import TestWithStringFunction,\
     get_exception, no_exception, NoFileIoError, unittest_module
+from shutil import rmtree
 import contextlib
+import subprocess
 import sys
 import os
+import tempfile
+
+#: Modules slow to import which must only be imported when an exception is
+# processed (and not when didyoumean is imported)
+SLOW_MODULES = ['inspect', 'difflib', 're', 'multiprocessing',
+                'concurrent.futures', 'pkgutil', 'hashlib', 'numpy']
+if sys.version_info < (3, 8):
+    SLOW_MODULES.remove('re')  # imported by threading
+
+#: Maximum time (in seconds) spent importing the didyoumean modules
+# themselves (excluding the modules they import), with compiled files
+# available. It is about a few milliseconds: the budget is generous so
+# that it holds on slow CI machines while catching the work which would
+# be done at import time instead of when an exception is processed.
+IMPORT_TIME_BUDGET = 0.05
 
 
 class ApiTest(TestWithStringFunction):
@@ -122,6 +141,100 @@ class DecoratorTest(unittest_module.TestCase, ApiTest):
         my_func()
 
 
+class TimeBudgetTest(unittest_module.TestCase, ApiTest):
+    """Tests about the didyoumean decorator with an exhausted time budget.
+
+    Suggestions requiring an analysis are not found and the other
+    suggesters stop after their first suggestion.
+    """
+
+    def run_with_api(self, code):
+        """Run code with didyoumean decorator and no time budget."""
+        @didyoumean_decorator
+        def my_func():
+            no_exception(code)
+        previous = didyoumean_configure(time_budget=-1)
+        try:
+            my_func()
+        finally:
+            didyoumean_configure(**previous)
+
+    def test_api_suggestion(self):
+        """Check the case with a suggestion (not found)."""
+        type_ = NameError
+        sugg = ""
+        code = 'babar = 0\nbaba'
+        self.check_sugg_added(code, type_, sugg)
+
+    def test_api_syntax(self):
+        """Check the case with syntax error suggestion (not found)."""
+        type_ = SyntaxError
+        sugg = ""
+        code = 'return'
+        self.check_sugg_added(code, type_, sugg, True)
+
+
+class InstrumentationTest(unittest_module.TestCase, ApiTest):
+    """Tests about the didyoumean decorator with instrumentation."""
+
+    def run_with_api(self, code):
+        """Run code with didyoumean decorator and instrumentation."""
+        @didyoumean_decorator
+        def my_func():
+            no_exception(code)
+        previous = didyoumean_configure(instrumentation=True)
+        try:
+            my_func()
+        finally:
+            didyoumean_configure(**previous)
+
+    def test_stats(self):
+        """Statistics are available and sent to the sinks."""
+        records = []
+        didyoumean_stats(reset=True)
+        didyoumean_add_stats_sink(records.append)
+        try:
+            self.test_api_suggestion()
+        finally:
+            didyoumean_remove_stats_sink(records.append)
+        name = 'didyoumean_internal.suggest_name_not_defined'
+        stats = didyoumean_stats(reset=True)
+        self.assertTrue(stats[name]['calls'] >= 1)
+        self.assertTrue(stats[name]['matches'] >= 1)
+        self.assertTrue(stats[name]['suggestions'] >= 1)
+        self.assertTrue(name in [r.name for r in records])
+        self.assertTrue(all(r.error_type == 'NameError' for r in records))
+        self.assertEqual(didyoumean_stats(), {})
+
+
+class LazyDecoratorTest(unittest_module.TestCase, ApiTest):
+    """Tests about the didyoumean decorator in lazy mode."""
+
+    def run_with_api(self, code):
+        """Run code with didyoumean decorator in lazy mode."""
+        @didyoumean_decorator
+        def my_func():
+            no_exception(code)
+        previous = didyoumean_configure(lazy=True)
+        try:
+            my_func()
+        finally:
+            didyoumean_configure(**previous)
+
+
+class LazyContextManagerTest(unittest_module.TestCase, ApiTest):
+    """Tests about the didyoumean context manager in lazy mode."""
+
+    def run_with_api(self, code):
+        """Run code with didyoumean context manager in lazy mode."""
+        previous = didyoumean_configure(lazy=True)
+        try:
+            with didyoumean_contextmanager():
+                no_exception(code)
+        finally:
+            didyoumean_configure(**previous)
+
+
 class ContextManagerTest(unittest_module.TestCase, ApiTest):
     """Tests about the didyoumean context manager."""
 
@@ -284,6 +397,58 @@ class IPythonHookTest(unittest_module.TestCase, HookTest):
             shell = None
 
 
+class ImportTimeTest(unittest_module.TestCase):
+    """Tests about the time needed to import didyoumean."""
+
+    def setUp(self):
+        """Create a temporary directory for the compiled files."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        rmtree(self.directory)
+
+    def get_import_times(self, code='import didyoumean_api'):
+        """Run code in a new interpreter with '-X importtime'.
+
+        Compiled files are written to (and read from) the temporary
+        directory. Import times are returned as a dict mapping the name of
+        each module imported to its own import time (in seconds).
+        """
+        env = dict(os.environ)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        env['PYTHONPYCACHEPREFIX'] = self.directory
+        proc = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        _, err = proc.communicate()
+        self.assertEqual(proc.returncode, 0, err)
+        times = dict()
+        for line in err.splitlines():
+            fields = line.split(':', 1)[-1].split('|')
+            if len(fields) == 3 and fields[0].strip().isdigit():
+                times[fields[2].strip()] = int(fields[0]) / 1000000.
+        return times
+
+    @unittest_module.skipIf(sys.version_info < (3, 7),
+                            "-X importtime is not available")
+    def test_import_time(self):
+        """Slow modules are not imported and the time budget is met."""
+        startup_modules = self.get_import_times('pass')
+        times = self.get_import_times()  # also writes the compiled files
+        self.assertTrue('didyoumean_internal' in times)
+        for name in SLOW_MODULES:
+            if name not in startup_modules:
+                self.assertFalse(name in times, name)
+        own_time = min(
+            sum(t for name, t in self.get_import_times().items()
+                if name.startswith('didyoumean'))
+            for _ in range(3))
+        self.assertTrue(own_time < IMPORT_TIME_BUDGET, own_time)
+
+
 if __name__ == '__main__':
     print(sys.version_info)
     unittest_module.main()
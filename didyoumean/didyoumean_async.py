@@ -0,0 +1,135 @@
+# -*- coding: utf-8
+"""APIs to add suggestions to exceptions in asyncio code.
+
+Suggestions are computed in the default executor of the event loop so
+that the analysis (going through the namespaces, the classes, importing
+modules, etc) does not block the loop.
+"""
+from didyoumean_internal import add_suggestions_to_exception, warm_up
+import functools
+import sys
+try:
+    import asyncio
+except ImportError:  # Python 2
+    asyncio = None
+
+# The 'async' syntax can not be parsed before Python 3.5 whereas this module
+# gets imported on all versions (by the tests discovery for instance): the
+# coroutine functions of the decorator are defined by the code below,
+# compiled at import time with the line numbers of this file.
+DECORATOR_LINE = sys._getframe().f_lineno + 1
+DECORATOR_CODE = '''def get_decorated(func):
+    """Get the coroutine function returned by the decorator."""
+    async def decorated(*args, **kwargs):
+        """Coroutine function returned by the decorator."""
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            type_, value, traceback = sys.exc_info()
+            try:
+                future = get_running_loop().run_in_executor(
+                    None, add_suggestions_to_exception,
+                    type_, value, traceback)
+            except RuntimeError:  # executor is shut down
+                future = None
+                add_suggestions_to_exception(
+                    type_, value, traceback, lazy=True)
+            if future is not None:
+                try:
+                    await future
+                except (Exception, asyncio.CancelledError):
+                    pass  # the original exception is raised anyway
+            raise
+    return decorated
+'''
+
+
+def get_running_loop():
+    """Get the running event loop (from a coroutine or a callback)."""
+    # asyncio.get_running_loop is missing before Python 3.7
+    return getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+
+
+def compile_decorator_code():
+    """Get the function defined by DECORATOR_CODE (None without asyncio)."""
+    if asyncio is None or sys.version_info < (3, 5):
+        return None
+    namespace = globals()
+    code = '\n' * (DECORATOR_LINE - 1) + DECORATOR_CODE
+    exec(compile(code, __file__, 'exec'), namespace)
+    return namespace['get_decorated']
+
+
+get_decorated = compile_decorator_code()
+
+
+def didyoumean_async_decorator(func):
+    """Decorator to add suggestions to exceptions from a coroutine function.
+
+    To use it, decorate one of the coroutine functions called, for instance
+    'main()':
+    @didyoumean_async_decorator
+    async def main():
+        some_code
+    """
+    return functools.wraps(func)(get_decorated(func))
+
+
+def call_exception_handler(loop, context, prev_handler):
+    """Call an exception handler (the default one if None)."""
+    if prev_handler is None:
+        loop.default_exception_handler(context)
+    else:
+        prev_handler(loop, context)
+
+
+def didyoumean_loop_exception_handler(loop, context, prev_handler=None):
+    """Exception handler for event loops adding suggestions to exceptions.
+
+    Suggestions are computed in the default executor and the previous
+    handler is then called from the loop. If the loop is not running
+    anymore, suggestions are added lazily (they are computed when the
+    exception is displayed) and the previous handler is called directly.
+    """
+    value = context.get('exception')
+    if value is None:
+        call_exception_handler(loop, context, prev_handler)
+        return
+    args = (type(value), value, value.__traceback__)
+    future = None
+    if loop.is_running():
+        try:
+            future = loop.run_in_executor(
+                None, add_suggestions_to_exception, *args)
+        except RuntimeError:  # executor is shut down
+            pass
+    if future is None:
+        add_suggestions_to_exception(*args, lazy=True)
+        call_exception_handler(loop, context, prev_handler)
+    else:
+        future.add_done_callback(
+            lambda _: call_exception_handler(loop, context, prev_handler))
+
+
+def didyoumean_enable_loop_hook(loop=None):
+    """Set the exception handler of an event loop to add suggestions.
+
+    The loop defaults to the running loop. The data reused from one
+    exception to another is precomputed in the default executor: the
+    corresponding future is returned.
+    """
+    if loop is None:
+        loop = get_running_loop()
+    loop.set_exception_handler(functools.partial(
+        didyoumean_loop_exception_handler,
+        prev_handler=loop.get_exception_handler()))
+    return loop.run_in_executor(None, warm_up)
+
+
+def didyoumean_disable_loop_hook(loop=None):
+    """Restore the exception handler of an event loop."""
+    if loop is None:
+        loop = get_running_loop()
+    handler = loop.get_exception_handler()
+    if getattr(handler, 'func', None) is didyoumean_loop_exception_handler:
+        loop.set_exception_handler(handler.keywords['prev_handler'])
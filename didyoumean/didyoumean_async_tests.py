@@ -0,0 +1,148 @@
+# -*- coding: utf-8
+"""Unit tests for didyoumean asyncio APIs."""
+from didyoumean_async import didyoumean_async_decorator,\
+    didyoumean_loop_exception_handler, didyoumean_enable_loop_hook,\
+    didyoumean_disable_loop_hook
+from didyoumean_api_tests import ApiTest
+from didyoumean_common_tests import get_exception, no_exception,\
+    unittest_module
+import functools
+import sys
+try:
+    import asyncio
+except ImportError:  # Python 2
+    asyncio = None
+
+# asyncio.run and asyncio.get_running_loop are missing before Python 3.7
+SKIP_ASYNC_TESTS = sys.version_info < (3, 7)
+
+
+def get_coroutine_function(source, func_name, **namespace):
+    """Get a coroutine function defined by some source code.
+
+    The 'async' syntax can not be parsed before Python 3.5 whereas this
+    module gets imported on all versions by the tests discovery.
+    """
+    namespace['asyncio'] = asyncio
+    exec(source, namespace)
+    return namespace[func_name]
+
+
+@unittest_module.skipIf(SKIP_ASYNC_TESTS, "asyncio.run is not available")
+class AsyncDecoratorTest(unittest_module.TestCase, ApiTest):
+    """Tests about the didyoumean decorator for coroutine functions."""
+
+    def run_with_api(self, code):
+        """Run code with didyoumean decorator for coroutine functions."""
+        my_func = didyoumean_async_decorator(get_coroutine_function(
+            'async def my_func():\n'
+            '    await asyncio.sleep(0)\n'
+            '    no_exception(code)\n',
+            'my_func', no_exception=no_exception, code=code))
+        asyncio.run(my_func())
+
+    def check_original_exception(self, run_suggestions):
+        """Check that the original exception is raised by the decorator."""
+        my_func = didyoumean_async_decorator(get_coroutine_function(
+            'async def my_func():\n'
+            '    raise ValueError("original")\n',
+            'my_func'))
+        main = get_coroutine_function(
+            'async def main():\n'
+            '    loop = asyncio.get_running_loop()\n'
+            '    prev_run = loop.run_in_executor\n'
+            '    loop.run_in_executor = partial(run_suggestions, loop)\n'
+            '    try:\n'
+            '        await my_func()\n'
+            '    finally:\n'
+            '        loop.run_in_executor = prev_run\n',
+            'main', my_func=my_func, run_suggestions=run_suggestions,
+            partial=functools.partial)
+        with self.assertRaisesRegex(ValueError, '^original$'):
+            asyncio.run(main())
+
+    def test_executor_shut_down(self):
+        """The original exception is raised if the executor is shut down."""
+        def run_suggestions(loop, executor, func, *args):
+            raise RuntimeError('cannot schedule new futures after shutdown')
+        self.check_original_exception(run_suggestions)
+
+    def test_suggestions_failing(self):
+        """The original exception is raised if the suggestions fail."""
+        def run_suggestions(loop, executor, func, *args):
+            future = loop.create_future()
+            future.set_exception(RuntimeError('changed size'))
+            return future
+        self.check_original_exception(run_suggestions)
+
+    def test_cancelled_suggestions(self):
+        """The original exception is raised if suggestions are cancelled."""
+        def run_suggestions(loop, executor, func, *args):
+            future = loop.create_future()
+            future.cancel()
+            return future
+        self.check_original_exception(run_suggestions)
+
+
+@unittest_module.skipIf(SKIP_ASYNC_TESTS, "asyncio.run is not available")
+class LoopHookTest(unittest_module.TestCase, ApiTest):
+    """Tests about the exception handler for event loops."""
+
+    def run_with_api(self, code):
+        """Run code in a callback of an event loop with the handler set.
+
+        The exception passed to the previous handler is raised.
+        """
+        contexts = []
+
+        def prev_handler(loop, context):
+            contexts.append(context)
+            loop.stop()
+
+        def run_code():
+            no_exception(code)
+            loop.stop()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.set_exception_handler(prev_handler)
+            loop.run_until_complete(didyoumean_enable_loop_hook(loop))
+            loop.call_soon(run_code)
+            loop.run_forever()
+            didyoumean_disable_loop_hook(loop)
+            self.assertTrue(loop.get_exception_handler() is prev_handler)
+        finally:
+            loop.close()
+        if contexts:
+            raise contexts[0]['exception']
+
+    def test_loop_not_running(self):
+        """Suggestions are added lazily when the loop is not running."""
+        contexts = []
+
+        def prev_handler(loop, context):
+            contexts.append((context, str(context['exception'])))
+        _, value, _ = get_exception('babar = 0\nbaba')
+        loop = asyncio.new_event_loop()
+        try:
+            didyoumean_loop_exception_handler(
+                loop, {'exception': value}, prev_handler)
+        finally:
+            loop.close()
+        self.assertEqual(len(contexts), 1)
+        self.assertTrue(contexts[0][1].endswith(
+            ". Did you mean 'babar' (local)?"))
+
+    def test_no_exception_in_context(self):
+        """Contexts without exception are passed to the previous handler."""
+        contexts = []
+
+        def prev_handler(loop, context):
+            contexts.append(context)
+        context = {'message': 'some message'}
+        didyoumean_loop_exception_handler(None, context, prev_handler)
+        self.assertEqual(contexts, [context])
+
+
+if __name__ == '__main__':
+    print(sys.version_info)
+    unittest_module.main()
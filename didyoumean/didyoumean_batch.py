@@ -0,0 +1,256 @@
+# -*- coding: utf-8
+"""Offline analysis of the exceptions found in log files.
+
+Usage: python didyoumean_batch.py [options] [file ...]
+
+Exception lines (for instance "NameError: name 'maths' is not defined")
+are extracted from the files (or from the standard input) and the
+suggestions which do not depend on the frame where the exception was thrown
+(typos on keywords/builtins, standard module names, special cases, syntax
+alternatives, removed builtins, etc) are computed. Each exception line with
+suggestions is printed (as "<file>:<line number>:<line><suggestions>").
+
+Some of these suggestions depend on the environment of the analysis rather
+than on the one where the exceptions were thrown: the modules which can be
+imported (module names, missing imports) and the types defined (attributes
+of the types named in the messages). The analysis is then expected to run
+with the same interpreter and packages as the application.
+
+Files are processed in chunks of lines so that memory usage does not depend
+on their size and chunks are analysed in parallel by a pool of processes.
+"""
+from didyoumean_internal import AnalysisContext, get_suggestion_functions,\
+    get_suggestions_within_budget, get_suggestion_string, STAND_MODULES
+import didyoumean_re as re
+import didyoumean_symbols as symbols
+import argparse
+import gzip
+import io
+import itertools
+import multiprocessing
+import sys
+from collections import OrderedDict, deque
+
+#: Regex to find an exception in a line of log: (name of the type with its
+# optional module prefix, name of the type, error message)
+EXCEPTION_LINE_RE = r"\b((?:[A-Za-z_]\w*\.)*" \
+    r"([A-Z]\w*(?:Error|Exception|Exit|Interrupt))): (.+)$"
+
+#: Names of the suggestion functions which do not rely on the frame where
+# the exception was thrown (nor on the file system). Some of them rely on
+# the environment of the analysis: the index of the modules which can be
+# imported (suggest_no_module, suggest_name_not_defined) and the types
+# found by name (suggest_attribute_error), see module docstring
+FRAME_INDEPENDENT_SUGGESTERS = set([
+    'suggest_name_not_defined',
+    'suggest_attribute_error',
+    'suggest_no_module',
+    'suggest_unsubscriptable',
+    'suggest_not_callable',
+    'suggest_obj_does_not_support',
+    'suggest_obj_has_no',
+    'suggest_bad_operand_for_unary',
+    'suggest_integer_type_expected',
+    'suggest_unexpected_keywordarg2',
+    'suggest_zero_len_field',
+    'suggest_time_data_is_wrong',
+    'suggest_outside_func_error',
+    'suggest_future_feature',
+    'suggest_invalid_comp',
+    'suggest_invalid_syntax',
+])
+
+#: Number of lines in each chunk sent to the processes
+CHUNK_SIZE = 10000
+
+#: Maximum number of chunks being processed (or waiting to be written) for
+# each process
+MAX_PENDING_CHUNKS_PER_JOB = 2
+
+#: Maximum number of error messages for which suggestions are kept in cache
+# by each process
+RESULT_CACHE_SIZE = 1024
+
+# Frame with an empty namespace used to run the suggestion functions
+_EMPTY_FRAME = None
+
+# Mapping error type -> frame independent suggestion functions
+_BATCH_FUNCTIONS = dict()
+
+# Mapping (error type name, message) -> suggestions (most recently used last)
+_RESULTS = OrderedDict()
+
+
+def get_empty_frame():
+    """Get a frame whose namespace only contains the builtins."""
+    global _EMPTY_FRAME
+    if _EMPTY_FRAME is None:
+        namespace = {'__name__': '__didyoumean_batch__'}
+        exec("frame = __import__('sys')._getframe()", namespace)
+        _EMPTY_FRAME = namespace.pop('frame')
+    return _EMPTY_FRAME
+
+
+def get_exception_type(type_name):
+    """Get a builtin exception type from its name (None if not found)."""
+    type_ = get_empty_frame().f_builtins.get(type_name)
+    if isinstance(type_, type) and issubclass(type_, BaseException):
+        return type_
+    return None
+
+
+def get_batch_functions(error_type):
+    """Get the frame independent suggestion functions for a type (cached)."""
+    functions = _BATCH_FUNCTIONS.get(error_type)
+    if functions is None:
+        functions = _BATCH_FUNCTIONS[error_type] = [
+            func for func in get_suggestion_functions(error_type)
+            if func.suggester.__name__ in FRAME_INDEPENDENT_SUGGESTERS]
+    return functions
+
+
+def get_suggestions_for_message(type_name, msg, time_budget=None):
+    """Get the suggestions for an error message (cached)."""
+    key = (type_name, msg)
+    suggestions = _RESULTS.pop(key, None)
+    if suggestions is None:
+        type_ = get_exception_type(type_name)
+        if not isinstance(msg, str):  # lines are unicode in Python 2
+            msg = msg.encode('utf-8')
+        try:
+            value = None if type_ is None else type_(msg)
+        except Exception:  # constructor needs more than the message
+            value = None
+        if value is None:
+            suggestions = []
+        else:
+            context = AnalysisContext(value, get_empty_frame(), time_budget)
+            suggestions = itertools.chain.from_iterable(
+                func(context) for func in get_batch_functions(type_))
+            if time_budget is not None:
+                suggestions = get_suggestions_within_budget(
+                    suggestions, context)
+            suggestions = list(suggestions)
+        while len(_RESULTS) >= RESULT_CACHE_SIZE:
+            _RESULTS.popitem(last=False)
+    _RESULTS[key] = suggestions
+    return suggestions
+
+
+def analyse_line(line, time_budget=None):
+    """Get the suggestion string for a line of log ('' if none)."""
+    match = re.compile(EXCEPTION_LINE_RE).search(line)
+    if match is None:
+        return ''
+    _, type_name, msg = match.groups()
+    return get_suggestion_string(
+        get_suggestions_for_message(type_name, msg, time_budget))
+
+
+def analyse_chunk(args):
+    """Get the annotated lines from a chunk.
+
+    The chunk is provided as (filename, time budget, list of
+    (line number, line)) and annotated lines are returned as strings.
+    """
+    filename, time_budget, lines = args
+    res = []
+    for lineno, line in lines:
+        sugg = analyse_line(line, time_budget)
+        if sugg:
+            res.append('{0}:{1}:{2}{3}'.format(filename, lineno, line, sugg))
+    return res
+
+
+def open_log_file(filename):
+    """Open a log file (compressed or not) or the standard input ('-').
+
+    io is used as the builtin open has no `errors` parameter in Python 2
+    (where gzip files need to be buffered to provide `read1`).
+    """
+    if filename == '-':
+        return sys.stdin
+    if filename.endswith('.gz'):
+        return io.TextIOWrapper(
+            io.BufferedReader(gzip.open(filename, 'rb')), errors='replace')
+    return io.open(filename, errors='replace')
+
+
+def get_chunks(filenames, time_budget=None, chunk_size=CHUNK_SIZE):
+    """Yield the chunks of lines from files (see analyse_chunk)."""
+    for filename in filenames:
+        log_file = open_log_file(filename)
+        try:
+            lines = enumerate(
+                (line.rstrip('\r\n') for line in log_file), 1)
+            while True:
+                chunk = list(itertools.islice(lines, chunk_size))
+                if not chunk:
+                    break
+                yield filename, time_budget, chunk
+        finally:
+            if log_file is not sys.stdin:
+                log_file.close()
+
+
+def analyse_chunks(chunks, jobs):
+    """Yield the annotated lines from chunks (in order).
+
+    Chunks are analysed by a pool of processes if `jobs` is greater than
+    one. Only a bounded number of chunks are submitted at a time so that
+    memory usage does not depend on the size of the input. The index of
+    symbols is then built (or loaded) before the pool is created so that
+    the processes do not all build it.
+    """
+    if jobs <= 1:
+        for chunk in chunks:
+            for line in analyse_chunk(chunk):
+                yield line
+        return
+    symbols.get_symbol_index(STAND_MODULES)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(analyse_chunk, (chunk,)))
+            if len(pending) >= jobs * MAX_PENDING_CHUNKS_PER_JOB:
+                for line in pending.popleft().get():
+                    yield line
+        while pending:
+            for line in pending.popleft().get():
+                yield line
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def get_parser():
+    """Get the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Add suggestions to the exceptions found in log files.")
+    parser.add_argument(
+        'files', nargs='*', default=['-'],
+        help="log files, possibly gzipped ('-' for the standard input)")
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+        help="number of processes (default: number of CPUs)")
+    parser.add_argument(
+        '--chunk-size', type=int, default=CHUNK_SIZE,
+        help="number of lines sent at once to a process")
+    parser.add_argument(
+        '--time-budget', type=float, default=None,
+        help="maximum time (in seconds) spent on each error message")
+    return parser
+
+
+def main(args):
+    """Main."""
+    options = get_parser().parse_args(args)
+    chunks = get_chunks(options.files, options.time_budget,
+                        options.chunk_size)
+    for line in analyse_chunks(chunks, options.jobs):
+        print(line)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
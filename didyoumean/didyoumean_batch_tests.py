@@ -0,0 +1,108 @@
+# -*- coding: utf-8
+"""Unit tests for code in didyoumean_batch.py."""
+from didyoumean_batch import analyse_line, get_chunks, analyse_chunks,\
+    get_exception_type, get_batch_functions
+from didyoumean_common_tests import unittest_module
+from shutil import rmtree
+import gzip
+import os
+import sys
+import tempfile
+
+LOG_LINES = [
+    "Traceback (most recent call last):",
+    "NameError: name 'maths' is not defined",
+    "2016-01-01 ERROR NameError: name 'raw_input' is not defined",
+    "ModuleNotFoundError: No module named 'pkgutill'",
+    "AttributeError: 'dict' object has no attribute 'has_key'",
+    "ImportError: cannot import name 'pathh' from 'os'",
+    "builtins.NameError: name 'lenn' is not defined",
+    "CustomError: name 'lenn' is not defined",
+    "FileNotFoundError: [Errno 2] No such file or directory: 'foo'",
+]
+
+EXPECTED = [
+    (3, ". Did you mean 'input' (builtin)?"),
+    (4, ". Did you mean 'pkgutil'?"),
+    (5, ". Did you mean 'key in dict' (has_key is removed)?"),
+    (7, ". Did you mean 'len' (builtin)?"),
+]
+if sys.version_info < (3, 6):  # ModuleNotFoundError does not exist
+    del EXPECTED[1]
+
+
+class AnalyseLineTests(unittest_module.TestCase):
+    """Tests about the analysis of a line of log."""
+
+    def test_analyse_line(self):
+        """Suggestions are found for the exception lines."""
+        for i, line in enumerate(LOG_LINES, 1):
+            self.assertEqual(analyse_line(line), dict(EXPECTED).get(i, ''),
+                             line)
+
+    def test_exception_needing_more_than_message(self):
+        """Lines are skipped when the exception can not be built."""
+        for line in [
+                "UnicodeDecodeError: 'utf-8' codec can't decode byte 0xff "
+                "in position 0: invalid start byte",
+                "UnicodeEncodeError: 'ascii' codec can't encode character "
+                "'\\xe9' in position 0: ordinal not in range(128)"]:
+            self.assertEqual(analyse_line(line), '', line)
+
+    def test_exception_type(self):
+        """Only builtin exception types are retrieved."""
+        self.assertTrue(get_exception_type('NameError') is NameError)
+        self.assertEqual(get_exception_type('len'), None)
+        self.assertEqual(get_exception_type('CustomError'), None)
+
+    def test_frame_dependent_functions_not_run(self):
+        """Functions relying on the frame or the environment are not run."""
+        self.assertEqual(get_batch_functions(OSError), [])
+        self.assertEqual(
+            [f.suggester.__name__ for f in get_batch_functions(ImportError)],
+            ['suggest_no_module'])
+
+
+class AnalyseFilesTests(unittest_module.TestCase):
+    """Tests about the analysis of files (in chunks)."""
+
+    def setUp(self):
+        """Create a temporary directory with log files."""
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'log.txt')
+        with open(self.filename, 'w') as log_file:
+            log_file.write('\n'.join(LOG_LINES) + '\n')
+        self.gz_filename = self.filename + '.gz'
+        with gzip.open(self.gz_filename, 'wb') as log_file:
+            log_file.write(('\n'.join(LOG_LINES) + '\n').encode('utf-8'))
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        rmtree(self.directory)
+
+    def get_expected(self, filename):
+        """Get the expected annotated lines for a file."""
+        return ['{0}:{1}:{2}{3}'.format(filename, i, LOG_LINES[i - 1], sugg)
+                for i, sugg in EXPECTED]
+
+    def test_chunks(self):
+        """Files are split in chunks of lines."""
+        chunks = list(get_chunks([self.filename, self.gz_filename], None, 4))
+        self.assertEqual([len(c[2]) for c in chunks], [4, 4, 1, 4, 4, 1])
+        self.assertEqual(chunks[1][2][0], (5, LOG_LINES[4]))
+        self.assertEqual(chunks[3][0], self.gz_filename)
+
+    def test_analyse_chunks(self):
+        """Results are the same (and in order) with or without processes."""
+        filenames = [self.filename, self.gz_filename]
+        expected = self.get_expected(filenames[0]) + \
+            self.get_expected(filenames[1])
+        for jobs in (1, 2):
+            self.assertEqual(
+                list(analyse_chunks(get_chunks(filenames, None, 2), jobs)),
+                expected)
+
+
+if __name__ == '__main__':
+    print(sys.version_info)
+    unittest_module.main()
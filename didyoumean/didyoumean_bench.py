@@ -0,0 +1,378 @@
+# -*- coding: utf-8
+"""Benchmarks for the didyoumean logic.
+
+Usage: python didyoumean_bench.py [benchmark [size ...]]
+
+Available benchmarks:
+ - fuzzy: fuzzy matching on collections of words of various sizes
+ - pipeline: whole suggestion pipeline on the code snippets from the README
+    examples and from the tests, with namespaces of various sizes. Results
+    are printed as JSON lines.
+ - threads: suggestions computed concurrently by various numbers of threads
+    while suggestion functions get registered
+"""
+from didyoumean_common_tests import unittest_module
+from didyoumean_internal import add_suggestions_to_exception,\
+    get_suggestions_for_exception, register_context_suggestion_for,\
+    unregister_suggestions_for
+import didyoumean_fuzzy as fuzzy
+import difflib
+import json
+import random
+import sys
+import threading
+import timeit
+import warnings
+try:
+    import tracemalloc
+except ImportError:  # Python 2: allocations are not measured
+    tracemalloc = None
+
+
+#: Sizes used by default for the fuzzy matching benchmark
+FUZZY_SIZES = [100, 10000, 1000000]
+
+#: Number of queries used for each size in the fuzzy matching benchmark
+FUZZY_NB_QUERIES = 5
+
+#: Numbers of global variables used by default for the pipeline benchmark
+PIPELINE_SIZES = [10, 1000, 100000]
+
+#: Numbers of extra classes defined for the pipeline benchmark (with the
+# smallest namespace)
+PIPELINE_CLASS_COUNTS = [1000, 10000]
+
+#: Number of times each code snippet is run in the pipeline benchmark
+PIPELINE_NB_RUNS = 5
+
+#: Numbers of threads used by default for the threads benchmark
+THREAD_COUNTS = [1, 8, 64]
+
+#: Number of exceptions handled by each thread in the threads benchmark
+THREAD_NB_EXCEPTIONS = 200
+
+#: Code defining the namespace used for the threads benchmark
+THREAD_SETUP = """
+class Foo(object):
+    def bar(self):
+        pass
+
+def func(foo, bar):
+    pass
+
+babar = Foo()
+"""
+
+#: Code snippets run in the threads benchmark
+THREAD_SNIPPETS = [
+    "baba",
+    "babar.baar()",
+    "func(fooo=1, bar=2)",
+    "import maths",
+    "[0].appendd(1)",
+    "babar.bar(1)",
+]
+
+# Words used to generate identifiers looking like real-life ones
+IDENTIFIER_PARTS = [
+    'add', 'all', 'append', 'arg', 'args', 'attr', 'base', 'buffer', 'build',
+    'cache', 'call', 'check', 'child', 'class', 'clear', 'close', 'code',
+    'config', 'connect', 'context', 'copy', 'count', 'create', 'data',
+    'default', 'delete', 'dict', 'dir', 'do', 'encode', 'entry', 'error',
+    'event', 'exc', 'file', 'filter', 'find', 'first', 'flag', 'format',
+    'frame', 'func', 'get', 'handle', 'handler', 'has', 'hook', 'id', 'index',
+    'info', 'init', 'input', 'is', 'item', 'items', 'iter', 'key', 'keys',
+    'last', 'len', 'line', 'list', 'load', 'lock', 'log', 'make', 'map',
+    'match', 'max', 'message', 'min', 'mode', 'module', 'name', 'new', 'next',
+    'node', 'num', 'obj', 'open', 'option', 'output', 'parse', 'path', 'pop',
+    'port', 'prefix', 'process', 'query', 'read', 'record', 'ref', 'remove',
+    'request', 'reset', 'result', 'run', 'save', 'scope', 'send', 'set',
+    'size', 'start', 'state', 'stop', 'str', 'stream', 'suffix', 'table',
+    'task', 'test', 'text', 'thread', 'time', 'token', 'tree', 'type',
+    'update', 'user', 'value', 'values', 'var', 'view', 'wait', 'word',
+    'write',
+]
+
+
+def generate_identifiers(size, rand):
+    """Generate `size` distinct identifiers."""
+    words = set()
+    while len(words) < size:
+        nb_parts = rand.randint(1, 4)
+        words.add('_'.join(rand.choice(IDENTIFIER_PARTS)
+                           for _ in range(nb_parts)))
+    return sorted(words)
+
+
+def generate_typo(word, rand):
+    """Generate a typo on a word (insertion, deletion or substitution)."""
+    pos = rand.randrange(len(word))
+    char = rand.choice('abcdefghijklmnopqrstuvwxyz')
+    return rand.choice([
+        word[:pos] + char + word[pos:],
+        word[:pos] + word[pos + 1:],
+        word[:pos] + char + word[pos + 1:],
+    ])
+
+
+def bench_fuzzy(sizes, nb_queries=FUZZY_NB_QUERIES):
+    """Compare difflib and the BK-tree based index for various sizes."""
+    rand = random.Random(0)
+    print("{0:>10} {1:>12} {2:>14} {3:>14} {4:>8}".format(
+        'size', 'build (s)', 'bktree (s/q)', 'difflib (s/q)', 'same'))
+    for size in sizes:
+        words = generate_identifiers(size, rand)
+        queries = [generate_typo(rand.choice(words), rand)
+                   for _ in range(nb_queries)]
+        start = timeit.default_timer()
+        index = fuzzy.FuzzyIndex(words)
+        build = timeit.default_timer() - start
+        start = timeit.default_timer()
+        res_index = [index.get_close_matches(q, 3, 0.7) for q in queries]
+        query_index = (timeit.default_timer() - start) / nb_queries
+        start = timeit.default_timer()
+        res_difflib = [difflib.get_close_matches(q, words, 3, 0.7)
+                       for q in queries]
+        query_difflib = (timeit.default_timer() - start) / nb_queries
+        print("{0:>10} {1:>12.4f} {2:>14.6f} {3:>14.6f} {4:>8}".format(
+            size, build, query_index, query_difflib,
+            str(res_index == res_difflib)))
+
+
+def get_readme_snippets():
+    """Get the code snippets from the README examples."""
+    import readme_examples
+    return [code
+            for _, examples in sorted(readme_examples.EXAMPLES.items())
+            for _, codes in sorted(examples.items())
+            for code in codes]
+
+
+def get_sugg_tests_snippets():
+    """Get the code snippets expected to throw in the suggestion tests.
+
+    Tests are run with `throws` and `runs` replaced so that the snippets
+    are recorded (only for the current environment) instead of being run.
+    """
+    import didyoumean_sugg_tests as sugg_tests
+    snippets = []
+
+    def throws(self, code, error_info,
+               sugg=None, version_range=None, interpreters=None):
+        env_range = sugg_tests.PythonEnvRange(version_range, interpreters)
+        if env_range.contains_current_env():
+            snippets.append(code)
+
+    def runs(self, code, version_range=None, interpreters=None):
+        pass
+    test_class = sugg_tests.GetSuggestionsTests
+    previous = test_class.throws, test_class.runs
+    test_class.throws, test_class.runs = throws, runs
+    try:
+        suite = unittest_module.TestLoader().loadTestsFromModule(sugg_tests)
+        suite.run(unittest_module.TestResult())
+    finally:
+        test_class.throws, test_class.runs = previous
+    return snippets
+
+
+def get_exception(code, namespace):
+    """Run code in a copy of a namespace and get what it throws (or None)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            exec(code, dict(namespace))
+        except Exception:
+            return sys.exc_info()
+    return None
+
+
+def get_percentile(sorted_values, percent):
+    """Get a percentile from a sorted list of values."""
+    index = int(round(percent / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def get_alloc_kb(allocs, aggregate):
+    """Get an aggregate of allocations in KB (None if not measured)."""
+    if not allocs:
+        return None
+    return round(aggregate(allocs) / 1024.0, 2)
+
+
+def bench_pipeline_config(snippets, nb_globals, nb_classes, nb_runs):
+    """Run the pipeline benchmark for a given configuration.
+
+    Results are returned as a dict error type name -> dict of results.
+    """
+    import didyoumean_sugg_tests as sugg_tests
+    rand = random.Random(0)
+    namespace = dict((name, rand.randint(0, 100)) for name in
+                     generate_identifiers(nb_globals, rand))
+    # Snippets rely on the names defined in the test module
+    namespace.update(vars(sugg_tests))
+    classes = [type('BenchClass{0}'.format(i), (object,), {})
+               for i in range(nb_classes)]
+    results = dict()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        reset_peak = getattr(
+            tracemalloc, 'reset_peak', tracemalloc.clear_traces)
+    for code in snippets:
+        exc = get_exception(code, namespace)
+        if exc is None:
+            continue
+        type_, value, traceback = exc
+        family = results.setdefault(type_.__name__, {
+            'nb_snippets': 0, 'times': [], 'allocs': [], 'nb_suggs': 0})
+        family['nb_snippets'] += 1
+        family['nb_suggs'] += len(list(
+            get_suggestions_for_exception(value, traceback)))
+        # Allocations
+        if tracemalloc is not None:
+            type_, value, traceback = get_exception(code, namespace)
+            reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            add_suggestions_to_exception(type_, value, traceback, lazy=False)
+            family['allocs'].append(
+                tracemalloc.get_traced_memory()[1] - before)
+    if tracemalloc is not None:
+        tracemalloc.stop()
+    # Timings are measured without tracemalloc
+    for _ in range(nb_runs):
+        for code in snippets:
+            exc = get_exception(code, namespace)
+            if exc is None:
+                continue
+            type_, value, traceback = exc
+            start = timeit.default_timer()
+            add_suggestions_to_exception(type_, value, traceback, lazy=False)
+            results[type_.__name__]['times'].append(
+                timeit.default_timer() - start)
+    del classes
+    return results
+
+
+def bench_pipeline(sizes, nb_runs=PIPELINE_NB_RUNS):
+    """Benchmark add_suggestions_to_exception on many code snippets.
+
+    Namespaces of various sizes are used and then various numbers of
+    classes are defined (with the smallest namespace).
+    """
+    snippets = get_readme_snippets() + get_sugg_tests_snippets()
+    snippets = sorted(set(snippets), key=snippets.index)
+    configs = [(size, 0) for size in sizes] + \
+        [(min(sizes), count) for count in PIPELINE_CLASS_COUNTS]
+    for nb_globals, nb_classes in configs:
+        results = bench_pipeline_config(
+            snippets, nb_globals, nb_classes, nb_runs)
+        for family, res in sorted(results.items()):
+            times = sorted(res['times'])
+            allocs = res['allocs']
+            print(json.dumps(dict([
+                ('benchmark', 'pipeline'),
+                ('python', sys.version.split()[0]),
+                ('globals', nb_globals),
+                ('classes', nb_classes),
+                ('family', family),
+                ('nb_snippets', res['nb_snippets']),
+                ('nb_calls', len(times)),
+                ('p50_ms', round(get_percentile(times, 50) * 1000, 4)),
+                ('p99_ms', round(get_percentile(times, 99) * 1000, 4)),
+                ('mean_alloc_kb', get_alloc_kb(
+                    allocs, lambda a: sum(a) / float(len(a)))),
+                ('max_alloc_kb', get_alloc_kb(allocs, max)),
+                ('nb_suggestions', res['nb_suggs']),
+            ])))
+            sys.stdout.flush()
+
+
+class BenchRegistrationError(Exception):
+    """Exception type for which functions are registered during the bench."""
+
+
+def get_thread_results(namespace, nb_exceptions):
+    """Add suggestions to exceptions and get them as strings."""
+    results = []
+    for i in range(nb_exceptions):
+        type_, value, traceback = get_exception(
+            THREAD_SNIPPETS[i % len(THREAD_SNIPPETS)], namespace)
+        add_suggestions_to_exception(type_, value, traceback, lazy=False)
+        results.append(str(value))
+    return results
+
+
+def register_bench_functions(stop):
+    """Register suggestion functions until the stop event is set."""
+    def bench_func(context, groups):
+        return []
+    nb_registered = 0
+    while not stop.is_set():
+        register_context_suggestion_for(
+            BenchRegistrationError, None)(bench_func)
+        nb_registered += 1
+        stop.wait(0.001)
+    return nb_registered
+
+
+def bench_threads(sizes, nb_exceptions=THREAD_NB_EXCEPTIONS):
+    """Compute suggestions from many threads at once.
+
+    Functions are registered at the same time to check that the registry
+    can be read while it gets updated. Results are compared to the ones
+    computed by a single thread.
+    """
+    namespace = dict()
+    exec(THREAD_SETUP, namespace)
+    expected = get_thread_results(namespace, nb_exceptions)
+    print("{0:>8} {1:>12} {2:>10} {3:>12} {4:>12} {5:>8}".format(
+        'threads', 'exceptions', 'time (s)', 'exc/s', 'registered', 'same'))
+    for nb_threads in sizes:
+        results = [None] * nb_threads
+        barrier = threading.Barrier(nb_threads + 1)
+
+        def run(i):
+            barrier.wait()
+            results[i] = get_thread_results(namespace, nb_exceptions)
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(nb_threads)]
+        for thread in threads:
+            thread.start()
+        stop = threading.Event()
+        registered = []
+        registering = threading.Thread(
+            target=lambda: registered.append(register_bench_functions(stop)))
+        registering.start()
+        start = timeit.default_timer()
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        duration = timeit.default_timer() - start
+        stop.set()
+        registering.join()
+        unregister_suggestions_for(BenchRegistrationError)
+        total = nb_threads * nb_exceptions
+        print("{0:>8} {1:>12} {2:>10.4f} {3:>12.1f} {4:>12} {5:>8}".format(
+            nb_threads, total, duration, total / duration, registered[0],
+            str(all(res == expected for res in results))))
+
+
+BENCHMARKS = {
+    'fuzzy': (bench_fuzzy, FUZZY_SIZES),
+    'pipeline': (bench_pipeline, PIPELINE_SIZES),
+    'threads': (bench_threads, THREAD_COUNTS),
+}
+
+
+def main(args):
+    """Main."""
+    names = args[:1] or sorted(BENCHMARKS)
+    for name in names:
+        func, default_sizes = BENCHMARKS[name]
+        sizes = [int(a) for a in args[1:]] or default_sizes
+        print("## Benchmark '{0}' on Python {1}".format(name, sys.version))
+        func(sizes)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
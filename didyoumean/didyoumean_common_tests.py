@@ -1,6 +1,10 @@
 # -*- coding: utf-8
 """Common logic for unit tests."""
+from shutil import rmtree
+import atexit
+import os
 import sys
+import tempfile
 
 try:
     import unittest2
@@ -17,6 +21,12 @@ except AttributeError:
 # disable the corresponding tests easily.
 SKIP_MEMORY_ERROR_TESTS = False
 
+# Index files of didyoumean_symbols are written in a temporary directory
+# instead of the cache of the user.
+if not os.environ.get('DIDYOUMEAN_CACHE_DIR'):
+    os.environ['DIDYOUMEAN_CACHE_DIR'] = tempfile.mkdtemp()
+    atexit.register(rmtree, os.environ['DIDYOUMEAN_CACHE_DIR'], True)
+
 old_errors = (IOError, OSError)
 
 try:
@@ -0,0 +1,687 @@
+# -*- coding: utf-8
+"""Fuzzy matching logic to find close matches for a word.
+
+Modules which are slow to import (difflib, numpy, multiprocessing, etc)
+are imported when first needed so that importing this module is cheap.
+"""
+import bisect
+import sys
+import threading
+from collections import OrderedDict
+
+#: Minimal number of possibilities for the index to be used by the 'auto'
+# matcher (on smaller sets, a linear scan with difflib is faster than
+# building an index).
+INDEX_MIN_SIZE = 2000
+
+#: Number of times a set of words must be seen by the 'auto' matcher before
+# an index gets built for it (building an index is only worth it when it
+# gets reused).
+INDEX_MIN_USES = 2
+
+#: Maximal number of sets of words (and indexes) kept in cache
+INDEX_CACHE_SIZE = 8
+
+#: Maximal number of results kept in cache by each index
+RESULT_CACHE_SIZE = 64
+
+#: Minimal number of possibilities for the matching to be performed in a
+# separate process by the 'process' matcher (on smaller sets, it is faster
+# to perform it in the calling thread than to send the words)
+PROCESS_MIN_SIZE = 20000
+
+#: Maximal time (in seconds) the 'process' matcher waits for the result
+# from the pool of processes (no match is returned after that)
+PROCESS_TIMEOUT = 0.2
+
+#: Number of processes in the pool used by the 'process' matcher
+PROCESS_POOL_SIZE = 1
+
+#: Number of words processed by the matchers between two checks of the
+# deadline (see set_deadline_check)
+DEADLINE_CHECK_INTERVAL = 256
+
+#: Whether numpy (if available) is used by the 'vector' matcher
+USE_NUMPY = True
+
+#: Maximal length of the words looked up with numpy by the 'vector' matcher
+# (the bit vectors used must fit in 64 bits, longer words are looked up in
+# pure Python)
+VECTOR_MAX_WORD_LEN = 63
+
+# Pool of processes used by the 'process' matcher (created when needed)
+_PROCESS_POOL = None
+
+# Last job submitted to _PROCESS_POOL (the pool is busy until it is done)
+_PROCESS_JOB = None
+
+# Lock for _PROCESS_POOL and _PROCESS_JOB
+_PROCESS_POOL_LOCK = threading.Lock()
+
+# Mapping id(words) -> (words, frozenset of words) for the immutable
+# collections of words seen last (most recently used last)
+_KEY_CACHE = OrderedDict()
+
+# Lock for _KEY_CACHE
+_KEY_CACHE_LOCK = threading.Lock()
+
+# Mapping frozenset of words -> FuzzyIndex or number of uses so far
+# (most recently used last)
+_INDEX_CACHE = OrderedDict()
+
+# Lock for _INDEX_CACHE (not held while building an index)
+_INDEX_CACHE_LOCK = threading.Lock()
+
+# Mapping frozenset of words -> EncodedWords (most recently used last)
+_ENCODED_CACHE = OrderedDict()
+
+# Lock for _ENCODED_CACHE (not held while encoding words)
+_ENCODED_CACHE_LOCK = threading.Lock()
+
+# numpy module (None if not available, False if not imported yet)
+_NUMPY = False
+
+# Function checking the deadline of the matching performed in each thread
+# (see set_deadline_check)
+_DEADLINE_CHECKS = threading.local()
+
+
+def get_numpy():
+    """Get the numpy module (None if not available or not to be used).
+
+    numpy is not imported when it is not to be used.
+    """
+    global _NUMPY
+    if not USE_NUMPY:
+        return None
+    if _NUMPY is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _NUMPY = numpy
+    return _NUMPY
+
+
+def set_deadline_check(check_deadline):
+    """Set the function checking the deadline in the current thread.
+
+    The matchers call it regularly: it is expected to raise an exception
+    to stop the matching when the time budget is exhausted (None disables
+    the checks). This is per thread as matchers are pluggable functions
+    with a fixed signature. The previous function is returned.
+    """
+    previous = getattr(_DEADLINE_CHECKS, 'check', None)
+    _DEADLINE_CHECKS.check = check_deadline
+    return previous
+
+
+def with_deadline_checks(iterable):
+    """Get the items of an iterable with the deadline checked regularly.
+
+    See set_deadline_check: the iterable is returned as is if there is no
+    deadline to check.
+    """
+    check_deadline = getattr(_DEADLINE_CHECKS, 'check', None)
+    if check_deadline is None:
+        return iterable
+    return iterate_with_checks(iterable, check_deadline)
+
+
+def iterate_with_checks(iterable, check_deadline):
+    """Yield the items of an iterable, calling check_deadline regularly."""
+    for i, item in enumerate(iterable):
+        if not i % DEADLINE_CHECK_INTERVAL:
+            check_deadline()
+        yield item
+
+
+def get_char_masks(word):
+    """Map each char of the word to the bitmask of its positions."""
+    masks = dict()
+    for i, char in enumerate(word):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+
+def indel_distance(word1, word2, masks1=None):
+    """Get the insertion/deletion distance between two strings.
+
+    This is the edit distance where substitutions are not allowed, that is to
+    say len(word1) + len(word2) - 2 * LCS(word1, word2). It is a metric.
+    The length of the Longest Common Subsequence is computed with the
+    bit-parallel algorithm from Allison and Dix in O(len(word2)) operations
+    on integers. The masks for word1 can be provided if already computed.
+    """
+    if masks1 is None:
+        masks1 = get_char_masks(word1)
+    len1 = len(word1)
+    full = (1 << len1) - 1
+    vect = full
+    for char in word2:
+        match = vect & masks1.get(char, 0)
+        vect = ((vect + match) | (vect - match)) & full
+    lcs = len1 - bin(vect).count('1')
+    return len1 + len(word2) - 2 * lcs
+
+
+def get_ratio(word, possibility):
+    """Get the similarity ratio used by difflib.get_close_matches."""
+    import difflib
+    return difflib.SequenceMatcher(None, possibility, word).ratio()
+
+
+def get_max_distance(len1, len2, cutoff):
+    """Get the maximal distance for two words to have a ratio above cutoff.
+
+    The ratio computed by difflib.SequenceMatcher is 2 * M / T where T is the
+    total number of characters and M the number of matches. Matching blocks
+    form a common subsequence so M <= LCS and then:
+    ratio >= cutoff => indel_distance = T - 2 * LCS <= (1 - cutoff) * T.
+    """
+    # Epsilon is used to be on the safe side of rounding errors
+    return int((1.0 - cutoff) * (len1 + len2) + 1e-9)
+
+
+class BKTree(object):
+    """Burkhard-Keller tree to retrieve words close to a given word.
+
+    Distance used is `indel_distance`. Nodes are stored as tuples
+    (word, {distance: child node}).
+    """
+
+    def __init__(self, words=()):
+        """Init a BKTree with an optional iterable of words."""
+        self.root = None
+        self.size = 0
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        """Get the number of (distinct) words in the tree."""
+        return self.size
+
+    def add(self, word):
+        """Add a word to the tree (if not already in it)."""
+        if self.root is None:
+            self.root = (word, dict())
+            self.size += 1
+            return
+        masks = get_char_masks(word)
+        node = self.root
+        while True:
+            node_word, children = node
+            dist = indel_distance(word, node_word, masks)
+            if dist == 0:
+                return
+            child = children.get(dist)
+            if child is None:
+                children[dist] = (word, dict())
+                self.size += 1
+                return
+            node = child
+
+    def search(self, word, radius):
+        """Yield the words at distance at most `radius` from word.
+
+        Thanks to the triangle inequality, only the children with a
+        distance to their parent in [dist - radius, dist + radius] need
+        to be considered.
+        """
+        if self.root is None:
+            return
+        # Computation of indel_distance is inlined as this is the hot loop
+        masks = get_char_masks(word)
+        len1 = len(word)
+        full = (1 << len1) - 1
+        stack = [self.root]
+        check_deadline = getattr(_DEADLINE_CHECKS, 'check', None)
+        nb_nodes = 0
+        while stack:
+            if check_deadline is not None and \
+                    not nb_nodes % DEADLINE_CHECK_INTERVAL:
+                check_deadline()
+            nb_nodes += 1
+            node_word, children = stack.pop()
+            vect = full
+            for char in node_word:
+                match = vect & masks.get(char, 0)
+                vect = ((vect + match) | (vect - match)) & full
+            dist = len(node_word) - len1 + 2 * bin(vect).count('1')
+            if dist <= radius:
+                yield node_word
+            low, high = dist - radius, dist + radius
+            for child_dist, child in children.items():
+                if low <= child_dist <= high:
+                    stack.append(child)
+
+
+class FuzzyIndex(object):
+    """Index on a set of words to retrieve close matches in sub-linear time.
+
+    Words are stored in a BKTree per length so that the radius of the search
+    can be as small as possible (it depends on the length of the words).
+    Candidates retrieved are then ranked with difflib so that results are
+    exactly the same as difflib.get_close_matches.
+    Once built, the index can be used from many threads.
+    """
+
+    def __init__(self, words):
+        """Init a FuzzyIndex from some words (non-strings are ignored)."""
+        self.trees = dict()
+        self.results = OrderedDict()
+        self.lock = threading.Lock()  # for results
+        for word in with_deadline_checks(words):
+            if isinstance(word, str):
+                self.trees.setdefault(len(word), BKTree()).add(word)
+
+    def __len__(self):
+        """Get the number of (distinct) words in the index."""
+        return sum(len(tree) for tree in self.trees.values())
+
+    def get_candidates(self, word, cutoff):
+        """Yield the words which may have a ratio above cutoff with word."""
+        len1 = len(word)
+        for len2, tree in self.trees.items():
+            radius = get_max_distance(len1, len2, cutoff)
+            if abs(len1 - len2) <= radius:
+                for candidate in tree.search(word, radius):
+                    yield candidate
+
+    def get_close_matches(self, word, n=3, cutoff=0.6):
+        """Equivalent of difflib.get_close_matches on the indexed words.
+
+        Results are cached as the same lookup tends to happen many times.
+        """
+        key = (word, n, cutoff)
+        with self.lock:
+            res = self.results.pop(key, None)
+        if res is None:
+            import difflib
+            res = difflib.get_close_matches(
+                word, list(self.get_candidates(word, cutoff)), n, cutoff)
+        with self.lock:
+            self.results.pop(key, None)
+            while len(self.results) >= RESULT_CACHE_SIZE:
+                self.results.popitem(last=False)
+            self.results[key] = res
+        return list(res)
+
+
+class EncodedWords(object):
+    """Words encoded to compute their distances to a word all at once.
+
+    Words are sorted by length and, when numpy is available, encoded as a
+    padded array of character codes (one row per position in the words,
+    one column per word) with the narrowest integer type for the alphabet.
+    The indel_distance from a word to all of them is then computed with the
+    bit-parallel algorithm on vectors of 64-bit integers: padding codes have
+    an empty mask so that they leave the bit vectors unchanged. Words longer
+    than VECTOR_MAX_WORD_LEN are not encoded so that a few long words do not
+    inflate the array. Distances to the words not encoded (or without numpy)
+    are computed one by one.
+    Candidates retrieved are then ranked with difflib so that results are
+    exactly the same as difflib.get_close_matches.
+    """
+
+    def __init__(self, words):
+        """Init EncodedWords from some words (non-strings are ignored)."""
+        self.words = sorted(set(w for w in with_deadline_checks(words)
+                                if isinstance(w, str)), key=len)
+        self.lengths = [len(w) for w in self.words]
+        self.alphabet = self.codes = None
+        self.nb_encoded = 0
+        self.numpy = get_numpy()
+        if self.numpy is not None and self.words:
+            self.encode()
+
+    def __len__(self):
+        """Get the number of (distinct) words."""
+        return len(self.words)
+
+    def encode(self):
+        """Encode the words as an array of codes (see class docstring)."""
+        numpy = self.numpy
+        self.nb_encoded = bisect.bisect_right(
+            self.lengths, VECTOR_MAX_WORD_LEN)
+        text = ''.join(self.words[:self.nb_encoded])
+        if isinstance(text, bytes):  # Python 2
+            points = numpy.frombuffer(text, dtype=numpy.uint8)
+        else:
+            points = numpy.frombuffer(
+                text.encode('utf-32-le'), dtype=numpy.uint32)
+        self.alphabet, inverse = numpy.unique(points, return_inverse=True)
+        self.lengths = numpy.array(self.lengths, dtype=numpy.intp)
+        lengths = self.lengths[:self.nb_encoded]
+        offsets = numpy.cumsum(lengths) - lengths
+        columns = numpy.repeat(numpy.arange(self.nb_encoded), lengths)
+        rows = numpy.arange(len(points)) - numpy.repeat(offsets, lengths)
+        # Code 0 is used for the padding
+        self.codes = numpy.zeros(
+            (lengths[-1] if self.nb_encoded else 0, self.nb_encoded),
+            dtype=numpy.min_scalar_type(len(self.alphabet)))
+        self.codes[rows, columns] = inverse.ravel() + 1
+        # Number of bits set for each byte value
+        self.popcount = numpy.array(
+            [bin(i).count('1') for i in range(256)], dtype=numpy.uint8)
+
+    def get_range(self, word, cutoff):
+        """Get the range of indices of the words with a suitable length."""
+        len1 = len(word)
+        valid = [len2 for len2 in set(self.lengths)
+                 if abs(len1 - len2) <= get_max_distance(len1, len2, cutoff)]
+        if not valid:
+            return 0, 0
+        return (bisect.bisect_left(self.lengths, min(valid)),
+                bisect.bisect_right(self.lengths, max(valid)))
+
+    def get_candidates(self, word, cutoff):
+        """Get the words which may have a ratio above cutoff with word."""
+        start, end = self.get_range(word, cutoff)
+        middle = start
+        candidates = []
+        if self.codes is not None and len(word) <= VECTOR_MAX_WORD_LEN:
+            middle = max(start, min(end, self.nb_encoded))
+        if start < middle:
+            dist = self.get_distances(word, start, middle)
+            lengths = self.lengths[start:middle]
+            max_dist = ((1.0 - cutoff) * (len(word) + lengths)
+                        + 1e-9).astype(self.numpy.intp)
+            candidates = [self.words[start + i]
+                          for i in self.numpy.flatnonzero(dist <= max_dist)]
+        if middle < end:
+            masks = get_char_masks(word)
+            candidates.extend(
+                w for w in with_deadline_checks(self.words[middle:end])
+                if indel_distance(word, w, masks)
+                <= get_max_distance(len(word), len(w), cutoff))
+        return candidates
+
+    def get_distances(self, word, start, end):
+        """Get the indel_distance from word to words[start:end] (numpy)."""
+        numpy = self.numpy
+        masks = numpy.zeros(len(self.alphabet) + 1, dtype=numpy.uint64)
+        for char, mask in get_char_masks(word).items():
+            code = numpy.searchsorted(self.alphabet, ord(char))
+            if code < len(self.alphabet) and self.alphabet[code] == ord(char):
+                masks[code + 1] = mask
+        full = numpy.uint64((1 << len(word)) - 1)
+        vect = numpy.full(end - start, full, dtype=numpy.uint64)
+        lengths = self.lengths[start:end]
+        # Words being sorted by length, only the ones longer than the
+        # position considered need to be updated
+        firsts = numpy.searchsorted(lengths, numpy.arange(lengths[-1]),
+                                    side='right')
+        for pos, first in with_deadline_checks(enumerate(firsts)):
+            sub = vect[first:]
+            match = sub & masks[self.codes[pos, start + first:end]]
+            sub[:] = ((sub + match) | (sub - match)) & full
+        popcount = self.popcount[vect.view(numpy.uint8)].reshape(-1, 8).sum(
+            axis=1, dtype=numpy.intp)
+        return lengths - len(word) + 2 * popcount
+
+    def get_close_matches(self, word, n=3, cutoff=0.6):
+        """Equivalent of difflib.get_close_matches on the encoded words."""
+        import difflib
+        return difflib.get_close_matches(
+            word, self.get_candidates(word, cutoff), n, cutoff)
+
+
+def get_words_key(words):
+    """Get the frozenset of a collection of words (key of the caches).
+
+    Building it takes a time linear in the number of words so it is cached
+    for the immutable collections (by identity, frozensets being their own
+    key). As the same frozenset object is returned, looking it up in the
+    caches does not compare all the words either.
+    """
+    if isinstance(words, frozenset):
+        return words
+    if not isinstance(words, tuple):
+        return frozenset(words)
+    with _KEY_CACHE_LOCK:
+        entry = _KEY_CACHE.pop(id(words), None)
+        if entry is not None:
+            _KEY_CACHE[id(words)] = entry
+            return entry[1]
+    key = frozenset(words)
+    with _KEY_CACHE_LOCK:
+        _KEY_CACHE.pop(id(words), None)
+        while len(_KEY_CACHE) >= INDEX_CACHE_SIZE:
+            _KEY_CACHE.popitem(last=False)
+        _KEY_CACHE[id(words)] = (words, key)
+    return key
+
+
+def get_encoded_words(words):
+    """Get the EncodedWords for a collection of words (cached)."""
+    key = get_words_key(words)
+    with _ENCODED_CACHE_LOCK:
+        encoded = _ENCODED_CACHE.pop(key, None)
+    if encoded is None:
+        encoded = EncodedWords(key)
+    with _ENCODED_CACHE_LOCK:
+        _ENCODED_CACHE.pop(key, None)
+        while len(_ENCODED_CACHE) >= INDEX_CACHE_SIZE:
+            _ENCODED_CACHE.popitem(last=False)
+        _ENCODED_CACHE[key] = encoded
+    return encoded
+
+
+def get_index(words, min_uses=1):
+    """Get the FuzzyIndex for a collection of words (cached).
+
+    The index is built only once the collection has been seen `min_uses`
+    times, None is returned before that.
+    """
+    key = get_words_key(words)
+    with _INDEX_CACHE_LOCK:
+        entry = _INDEX_CACHE.pop(key, 0)
+        if not isinstance(entry, FuzzyIndex):
+            entry += 1
+        add_to_index_cache(key, entry)
+    if isinstance(entry, FuzzyIndex) or entry < min_uses:
+        return entry if isinstance(entry, FuzzyIndex) else None
+    index = FuzzyIndex(key)
+    with _INDEX_CACHE_LOCK:
+        current = _INDEX_CACHE.pop(key, None)
+        if isinstance(current, FuzzyIndex):
+            index = current  # built by another thread in the meantime
+        add_to_index_cache(key, index)
+    return index
+
+
+def add_to_index_cache(key, entry):
+    """Add an entry to _INDEX_CACHE (lock to be held by the caller)."""
+    while len(_INDEX_CACHE) >= INDEX_CACHE_SIZE:
+        _INDEX_CACHE.popitem(last=False)
+    _INDEX_CACHE[key] = entry
+
+
+def difflib_matcher(word, possibilities, n, cutoff):
+    """Get close matches with a linear scan using difflib."""
+    import difflib
+    return difflib.get_close_matches(
+        word, with_deadline_checks(possibilities), n, cutoff)
+
+
+def bktree_matcher(word, possibilities, n, cutoff):
+    """Get close matches using a (cached) FuzzyIndex."""
+    return get_index(possibilities).get_close_matches(word, n, cutoff)
+
+
+def vector_matcher(word, possibilities, n, cutoff):
+    """Get close matches using (cached) EncodedWords.
+
+    Distances to all the possibilities are computed at once with numpy if
+    available so that this is fast for big collections, be they used once
+    or for many lookups.
+    """
+    return get_encoded_words(possibilities).get_close_matches(
+        word, n, cutoff)
+
+
+def auto_matcher(word, possibilities, n, cutoff):
+    """Get close matches using an index only when it is worth it.
+
+    An index is used for big collections of words seen many times,
+    a linear scan with difflib is performed otherwise.
+    """
+    if not hasattr(possibilities, '__len__'):
+        possibilities = list(possibilities)
+    if len(possibilities) >= INDEX_MIN_SIZE:
+        index = get_index(possibilities, INDEX_MIN_USES)
+        if index is not None:
+            return index.get_close_matches(word, n, cutoff)
+    return difflib_matcher(word, possibilities, n, cutoff)
+
+
+def get_futures():
+    """Get the concurrent.futures module (None if it can not be used).
+
+    The 'process' matcher needs to choose how the processes are started,
+    which is not supported before Python 3.7.
+    """
+    if sys.version_info < (3, 7):
+        return None
+    from concurrent import futures
+    return futures
+
+
+def get_process_pool():
+    """Get the pool of processes used by the 'process' matcher.
+
+    Processes are started with 'spawn' so that they do not inherit locks
+    held by other threads. A job is submitted when the pool is created so
+    that the processes start in the background: the pool is busy until
+    they are started.
+    """
+    from concurrent import futures
+    import multiprocessing
+    global _PROCESS_POOL, _PROCESS_JOB
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is None:
+            pool = futures.ProcessPoolExecutor(
+                PROCESS_POOL_SIZE, multiprocessing.get_context('spawn'))
+            _PROCESS_JOB = pool.submit(len, ())
+            _PROCESS_POOL = pool
+        return _PROCESS_POOL
+
+
+def start_process_pool():
+    """Start the processes used by the 'process' matcher (and wait for them).
+
+    This is to be called beforehand so that the first matching does not
+    need to wait for the processes to start.
+    """
+    pool = get_process_pool()
+    for future in [pool.submit(len, ()) for _ in range(PROCESS_POOL_SIZE)]:
+        future.result()
+
+
+def stop_process_pool():
+    """Stop the processes used by the 'process' matcher (if any)."""
+    global _PROCESS_POOL, _PROCESS_JOB
+    with _PROCESS_POOL_LOCK:
+        pool, _PROCESS_POOL, _PROCESS_JOB = _PROCESS_POOL, None, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def submit_process_job(pool, func, *args):
+    """Submit a job to the pool of processes if it is not busy.
+
+    The pool is busy while its processes start or while the last job is
+    running (a job which timed out can not be stopped). None is returned
+    if the job was not submitted.
+    """
+    global _PROCESS_JOB
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_JOB is not None and not _PROCESS_JOB.done():
+            return None
+        _PROCESS_JOB = pool.submit(func, *args)
+        return _PROCESS_JOB
+
+
+def process_matcher(word, possibilities, n, cutoff):
+    """Get close matches in a separate process for big collections.
+
+    This does not hold the GIL in the calling thread while the matching is
+    performed (with auto_matcher in the process so that an index gets
+    built for collections seen many times). The calling thread does not
+    wait for more than PROCESS_TIMEOUT: no match is returned after that or
+    if the pool of processes is broken (a new one is then created for next
+    calls). Small collections, and all collections while the pool is busy
+    (see submit_process_job), when it can not be created or when
+    concurrent.futures can not be used (see get_futures), are handled with
+    auto_matcher directly.
+    """
+    if not hasattr(possibilities, '__len__'):
+        possibilities = list(possibilities)
+    futures = get_futures()
+    if len(possibilities) < PROCESS_MIN_SIZE or futures is None:
+        return auto_matcher(word, possibilities, n, cutoff)
+    pool = None
+    try:
+        pool = get_process_pool()
+        future = submit_process_job(
+            pool, auto_matcher, word, list(possibilities), n, cutoff)
+        if future is None:
+            return auto_matcher(word, possibilities, n, cutoff)
+        return future.result(PROCESS_TIMEOUT)
+    except futures.TimeoutError:
+        future.cancel()
+    except (futures.BrokenExecutor, RuntimeError, OSError,
+            ValueError, NotImplementedError):
+        # The pool is broken or could not be created
+        global _PROCESS_POOL
+        with _PROCESS_POOL_LOCK:
+            if pool is not None and _PROCESS_POOL is pool:
+                _PROCESS_POOL = None
+        if pool is None:
+            return auto_matcher(word, possibilities, n, cutoff)
+    return []
+
+
+#: Matchers which can be selected by name with `set_matcher`
+MATCHERS = {
+    'difflib': difflib_matcher,
+    'bktree': bktree_matcher,
+    'auto': auto_matcher,
+    'vector': vector_matcher,
+    'process': process_matcher,
+}
+
+# Matcher used by `get_close_matches`
+_matcher = auto_matcher
+
+
+def set_matcher(matcher):
+    """Set the matcher used by get_close_matches and return the previous one.
+
+    Matcher can be provided by name (see MATCHERS) or as a function with the
+    same parameters as `get_close_matches`.
+    """
+    global _matcher
+    previous = _matcher
+    _matcher = MATCHERS[matcher] if isinstance(matcher, str) else matcher
+    return previous
+
+
+def warm_up_matcher():
+    """Prepare the matcher which has been set (see set_matcher).
+
+    For the 'process' matcher, this starts the pool of processes (and
+    waits for them).
+    """
+    if _matcher is process_matcher and get_futures() is not None:
+        start_process_pool()
+
+
+def get_close_matches(word, possibilities, n=3, cutoff=0.6):
+    """Return a list of the best "good enough" matches.
+
+    This has the same semantic as difflib.get_close_matches but relies on
+    the matcher which has been set (see set_matcher).
+    """
+    return _matcher(word, possibilities, n, cutoff)
@@ -0,0 +1,394 @@
+# -*- coding: utf-8
+"""Unit tests for code in didyoumean_fuzzy.py."""
+from didyoumean_fuzzy import indel_distance, get_max_distance, BKTree,\
+    FuzzyIndex, get_index, get_close_matches, set_matcher, MATCHERS,\
+    process_matcher, start_process_pool, stop_process_pool, EncodedWords,\
+    get_encoded_words, set_deadline_check, warm_up_matcher, get_words_key
+import didyoumean_fuzzy as fuzzy
+from didyoumean_common_tests import unittest_module
+import difflib
+import os
+import random
+import subprocess
+import sys
+import timeit
+
+# Environment variable set to run the tests with numpy in the process
+NUMPY_TEST_ENV = 'DIDYOUMEAN_NUMPY_TESTS'
+
+# Value of fuzzy.USE_NUMPY before the tests of this module
+PREVIOUS_USE_NUMPY = fuzzy.USE_NUMPY
+
+
+def setUpModule():
+    """Disable numpy unless it is already imported (see EncodedWordsTests)."""
+    global PREVIOUS_USE_NUMPY
+    PREVIOUS_USE_NUMPY = fuzzy.USE_NUMPY
+    if 'numpy' not in sys.modules and not os.environ.get(NUMPY_TEST_ENV):
+        fuzzy.USE_NUMPY = False
+
+
+def tearDownModule():
+    """Restore the use of numpy."""
+    fuzzy.USE_NUMPY = PREVIOUS_USE_NUMPY
+
+
+def naive_indel_distance(word1, word2):
+    """Compute the insertion/deletion distance with dynamic programming."""
+    prev = list(range(len(word2) + 1))
+    for i, char1 in enumerate(word1):
+        curr = [i + 1]
+        for j, char2 in enumerate(word2):
+            if char1 == char2:
+                curr.append(prev[j])
+            else:
+                curr.append(1 + min(prev[j + 1], curr[j]))
+        prev = curr
+    return prev[-1]
+
+
+def random_words(rand, nb, alphabet='abcde_', max_len=10):
+    """Generate a list of random words."""
+    return [''.join(rand.choice(alphabet)
+                    for _ in range(rand.randint(0, max_len)))
+            for _ in range(nb)]
+
+
+class IndelDistanceTests(unittest_module.TestCase):
+    """Tests about indel_distance."""
+
+    def test_simple_cases(self):
+        """Test indel_distance on simple cases."""
+        self.assertEqual(indel_distance('', ''), 0)
+        self.assertEqual(indel_distance('abc', ''), 3)
+        self.assertEqual(indel_distance('', 'abc'), 3)
+        self.assertEqual(indel_distance('abc', 'abc'), 0)
+        self.assertEqual(indel_distance('abc', 'abd'), 2)
+        self.assertEqual(indel_distance('maths', 'math'), 1)
+
+    def test_against_naive_implementation(self):
+        """Compare indel_distance with a naive implementation."""
+        rand = random.Random(0)
+        words = random_words(rand, 60)
+        for word1 in words:
+            for word2 in words:
+                self.assertEqual(
+                    indel_distance(word1, word2),
+                    naive_indel_distance(word1, word2), (word1, word2))
+
+    def test_max_distance_is_a_bound(self):
+        """Check that words above cutoff are within the max distance."""
+        rand = random.Random(1)
+        words = random_words(rand, 60)
+        for cutoff in (0.6, 0.7, 0.8):
+            for word1 in words:
+                for word2 in words:
+                    ratio = difflib.SequenceMatcher(None, word2, word1).ratio()
+                    if ratio >= cutoff:
+                        self.assertTrue(
+                            indel_distance(word1, word2)
+                            <= get_max_distance(len(word1), len(word2),
+                                                cutoff))
+
+
+class BKTreeTests(unittest_module.TestCase):
+    """Tests about BKTree."""
+
+    def test_empty(self):
+        """Search in an empty tree."""
+        tree = BKTree()
+        self.assertEqual(len(tree), 0)
+        self.assertEqual(list(tree.search('abc', 3)), [])
+
+    def test_duplicates(self):
+        """Words are stored only once."""
+        tree = BKTree(['abc', 'abd', 'abc'])
+        self.assertEqual(len(tree), 2)
+
+    def test_search_against_linear_scan(self):
+        """Compare search results with a linear scan."""
+        rand = random.Random(2)
+        words = set(random_words(rand, 300))
+        tree = BKTree(words)
+        self.assertEqual(len(tree), len(words))
+        for query in random_words(rand, 30):
+            for radius in range(5):
+                expected = set(w for w in words
+                               if indel_distance(query, w) <= radius)
+                self.assertEqual(set(tree.search(query, radius)), expected)
+
+
+class FuzzyIndexTests(unittest_module.TestCase):
+    """Tests about FuzzyIndex and the matchers."""
+
+    def test_same_results_as_difflib(self):
+        """Results are the same as the ones from difflib."""
+        rand = random.Random(3)
+        words = sorted(set(random_words(rand, 500, 'abcdefgh_', 12)))
+        index = FuzzyIndex(words)
+        self.assertEqual(len(index), len(words))
+        for query in random_words(rand, 50, 'abcdefgh_', 12):
+            for cutoff in (0.6, 0.7, 0.8):
+                self.assertEqual(
+                    index.get_close_matches(query, 3, cutoff),
+                    difflib.get_close_matches(query, words, 3, cutoff),
+                    (query, cutoff))
+
+    def test_non_string_ignored(self):
+        """Non-string elements are ignored."""
+        index = FuzzyIndex(['foo', 1, None])
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.get_close_matches('fooo'), ['foo'])
+
+    def test_get_index_min_uses(self):
+        """Index is built only after being requested enough times."""
+        words = ['foo_%d' % i for i in range(10)]
+        self.assertEqual(get_index(words, 3), None)
+        self.assertEqual(get_index(words, 3), None)
+        index = get_index(words, 3)
+        self.assertTrue(isinstance(index, FuzzyIndex))
+        self.assertTrue(get_index(words) is index)
+
+    def test_words_key_cached(self):
+        """Key of immutable collections is only built once."""
+        words = tuple('key_%d' % i for i in range(10))
+        key = get_words_key(words)
+        self.assertEqual(key, frozenset(words))
+        self.assertTrue(get_words_key(words) is key)
+        self.assertTrue(get_words_key(key) is key)
+        words_list = list(words)
+        self.assertFalse(get_words_key(words_list) is key)
+        words_list.append('key_10')
+        self.assertTrue('key_10' in get_words_key(words_list))
+
+    def test_matchers(self):
+        """All matchers give the same results."""
+        words = ['foo', 'bar', 'baz', 'foobar']
+        expected = difflib.get_close_matches('fob', words, 3, 0.6)
+        self.assertEqual(sorted(expected), ['foo', 'foobar'])
+        previous = set_matcher('difflib')
+        try:
+            for name in sorted(MATCHERS):
+                set_matcher(name)
+                for _ in range(3):
+                    self.assertEqual(
+                        get_close_matches('fob', words, 3, 0.6), expected)
+        finally:
+            set_matcher(previous)
+
+
+class DeadlineTests(unittest_module.TestCase):
+    """Tests about the deadline checked by the matchers."""
+
+    class Expired(Exception):
+        """Exception raised when checking the deadline."""
+
+    def check(self):
+        """Function checking the deadline (always exhausted)."""
+        self.calls += 1
+        raise self.Expired()
+
+    def setUp(self):
+        """Set the deadline check."""
+        self.calls = 0
+        self.previous = set_deadline_check(self.check)
+
+    def tearDown(self):
+        """Restore the deadline check."""
+        set_deadline_check(self.previous)
+
+    def test_matchers_are_stopped(self):
+        """All matchers check the deadline (except 'process')."""
+        words = ['deadline_%d' % i for i in range(10)]
+        for name in sorted(MATCHERS):
+            if name != 'process':
+                self.assertRaises(self.Expired, MATCHERS[name],
+                                  'deadlin', words, 3, 0.6)
+        self.assertRaises(self.Expired, FuzzyIndex, words)
+        set_deadline_check(None)
+        index = FuzzyIndex(words)
+        set_deadline_check(self.check)
+        self.assertRaises(self.Expired, index.get_close_matches, 'deadlin')
+
+    def test_no_check(self):
+        """Nothing is checked without deadline."""
+        set_deadline_check(None)
+        words = ['deadline_%d' % i for i in range(10)]
+        for name in sorted(MATCHERS):
+            self.assertEqual(MATCHERS[name]('deadline_1', words, 1, 0.6),
+                             ['deadline_1'])
+        self.assertEqual(self.calls, 0)
+
+
+class EncodedWordsTests(unittest_module.TestCase):
+    """Tests about EncodedWords (with and without numpy).
+
+    Unless it is already imported, numpy is only imported in a separate
+    process: its types would otherwise be found by the tests looking for
+    types by name (like numpy.bool).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Check whether numpy is available (without importing it here)."""
+        with open(os.devnull, 'w') as devnull:
+            cls.numpy_available = subprocess.call(
+                [sys.executable, '-c', 'import numpy'],
+                stdout=devnull, stderr=devnull) == 0
+
+    def get_encoded_words(self, words, use_numpy):
+        """Get EncodedWords using numpy or not."""
+        previous = fuzzy.USE_NUMPY
+        fuzzy.USE_NUMPY = use_numpy
+        try:
+            return EncodedWords(words)
+        finally:
+            fuzzy.USE_NUMPY = previous
+
+    def check_same_results_as_difflib(self, use_numpy):
+        """Check that results are the same as the ones from difflib."""
+        rand = random.Random(6)
+        words = sorted(set(random_words(rand, 500, 'abcdefgh_', 12)
+                           + ['\xe9t\xe9', 'x' * 70]))
+        encoded = self.get_encoded_words(words + [1, None], use_numpy)
+        self.assertEqual(encoded.codes is not None, use_numpy)
+        self.assertEqual(len(encoded), len(words))
+        if use_numpy:
+            # The longest word is not encoded, codes fit in a byte
+            self.assertEqual(encoded.codes.shape[1], len(words) - 1)
+            self.assertEqual(encoded.codes.dtype.itemsize, 1)
+        queries = random_words(rand, 50, 'abcdefgh_', 12) + \
+            ['\xe9te', 'x' * 40, 'x' * 69, 'zzz']
+        for query in queries:
+            for cutoff in (0.0, 0.6, 0.8, 1.0):
+                self.assertEqual(
+                    encoded.get_close_matches(query, 3, cutoff),
+                    difflib.get_close_matches(query, words, 3, cutoff),
+                    (query, cutoff))
+
+    def test_same_results_as_difflib(self):
+        """Results are the same as the ones from difflib (pure Python)."""
+        self.check_same_results_as_difflib(False)
+
+    def test_same_results_as_difflib_numpy(self):
+        """Results are the same as the ones from difflib (numpy)."""
+        if not self.numpy_available:
+            self.skipTest("numpy is not available")
+        if 'numpy' in sys.modules or os.environ.get(NUMPY_TEST_ENV):
+            self.check_same_results_as_difflib(True)
+            return
+        env = dict(os.environ)
+        env[NUMPY_TEST_ENV] = '1'
+        test_name = '{0}.{1}.{2}'.format(
+            __name__, type(self).__name__, self._testMethodName)
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'unittest', test_name],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output.decode('utf-8'))
+
+    def test_empty(self):
+        """No words leads to no matches."""
+        self.assertEqual(EncodedWords([]).get_close_matches('foo'), [])
+
+    def test_cached(self):
+        """Words get encoded once for many lookups."""
+        words = ['foo_%d' % i for i in range(10)]
+        self.assertTrue(get_encoded_words(words) is
+                        get_encoded_words(reversed(words)))
+
+
+class ProcessMatcherFallbackTests(unittest_module.TestCase):
+    """Tests about the 'process' matcher without concurrent.futures."""
+
+    def test_without_futures(self):
+        """Matching is done in this thread without concurrent.futures."""
+        previous = fuzzy.get_futures, fuzzy.PROCESS_MIN_SIZE
+        fuzzy.get_futures = lambda: None
+        fuzzy.PROCESS_MIN_SIZE = 10
+        try:
+            words = ['bar_%d' % i for i in range(10)]
+            self.assertEqual(
+                process_matcher('fob', ['foo'] + words, 3, 0.6), ['foo'])
+            self.assertTrue(fuzzy._PROCESS_POOL is None)
+        finally:
+            fuzzy.get_futures, fuzzy.PROCESS_MIN_SIZE = previous
+
+
+class ProcessMatcherTests(unittest_module.TestCase):
+    """Tests about the matching in a pool of processes."""
+
+    def setUp(self):
+        """Use the pool of processes for small collections too."""
+        if fuzzy.get_futures() is None:
+            self.skipTest("concurrent.futures can not be used")
+        self.previous = fuzzy.PROCESS_MIN_SIZE, fuzzy.PROCESS_TIMEOUT
+        fuzzy.PROCESS_MIN_SIZE = 10
+
+    def tearDown(self):
+        """Restore the settings and stop the processes."""
+        fuzzy.PROCESS_MIN_SIZE, fuzzy.PROCESS_TIMEOUT = self.previous
+        stop_process_pool()
+
+    def test_same_results_as_difflib(self):
+        """Results are the same as the ones from difflib."""
+        fuzzy.PROCESS_TIMEOUT = 60
+        start_process_pool()
+        rand = random.Random(4)
+        words = sorted(set(random_words(rand, 100, 'abcdefgh_', 12)))
+        for query in random_words(rand, 10, 'abcdefgh_', 12) + ['']:
+            self.assertEqual(
+                process_matcher(query, iter(words), 3, 0.6),
+                difflib.get_close_matches(query, words, 3, 0.6))
+        self.assertEqual(process_matcher('fob', ['foo', 'bar'], 3, 0.6),
+                         ['foo'])
+
+    def test_timeout(self):
+        """Caller does not wait for the result for longer than the timeout."""
+        fuzzy.PROCESS_TIMEOUT = 0.001
+        start_process_pool()
+        words = random_words(random.Random(5), 10000, 'abcdefgh_', 12)
+        start = timeit.default_timer()
+        self.assertEqual(process_matcher('abcdefgh', words, 3, 0.6), [])
+        self.assertTrue(timeit.default_timer() - start < 1)
+        # The job is still running: matching is performed in this thread
+        words = ['bar_%d' % i for i in range(10)]
+        self.assertEqual(process_matcher('fob', ['foo'] + words, 3, 0.6),
+                         ['foo'])
+
+    def test_pool_not_started(self):
+        """Matching is done in this thread until the pool is started."""
+        fuzzy.PROCESS_TIMEOUT = 0.001
+        words = ['bar_%d' % i for i in range(10)]
+        self.assertEqual(process_matcher('fob', ['foo'] + words, 3, 0.6),
+                         ['foo'])
+
+    def test_pool_creation_error(self):
+        """Matching is done in this thread if the pool can not be created."""
+        def get_process_pool():
+            raise OSError('too many processes')
+        previous = fuzzy.get_process_pool
+        fuzzy.get_process_pool = get_process_pool
+        try:
+            words = ['bar_%d' % i for i in range(10)]
+            self.assertEqual(
+                process_matcher('fob', ['foo'] + words, 3, 0.6), ['foo'])
+        finally:
+            fuzzy.get_process_pool = previous
+
+    def test_warm_up(self):
+        """Processes are started when the matcher is warmed up."""
+        fuzzy.PROCESS_TIMEOUT = 60
+        previous = set_matcher('process')
+        try:
+            warm_up_matcher()
+        finally:
+            set_matcher(previous)
+        self.assertFalse(fuzzy.submit_process_job(
+            fuzzy.get_process_pool(), len, ()) is None)
+
+
+if __name__ == '__main__':
+    print(sys.version_info)
+    unittest_module.main()
@@ -1,14 +1,25 @@
 # -*- coding: utf-8
 """Logic to add suggestions to exceptions."""
 import keyword
-import difflib
 import didyoumean_re as re
+import didyoumean_fuzzy as fuzzy
+import didyoumean_symbols as symbols
 import itertools
-import inspect
+import bisect
 import errno
+import functools
+import heapq
 import os
 import sys
-from collections import namedtuple
+import threading
+import timeit
+import types
+import weakref
+from collections import namedtuple, OrderedDict
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 
 #: Standard modules we'll consider while searching for symbols, for instance:
@@ -31,6 +42,78 @@ STAND_MODULES = set(['string', 'os', 'sys', 're', 'math', 'random',
                      'datetime', 'timeit', 'unittest', 'itertools',
                      'functools', 'collections', '__future__'])
 
+#: Settings changing the way suggestions are computed (see `configure`):
+#  - time_budget: maximum time (in seconds) spent to compute the suggestions
+#     for an exception (None for no limit)
+#  - lazy: whether suggestions are computed only when the exception is
+#     converted to string (see add_lazy_suggestions_to_exception)
+#  - instrumentation: whether statistics are recorded for each suggestion
+#     function (see SUGGESTER_STATS and SUGGESTER_SINKS)
+#  - attribute_cache_size: maximum number of (types, attribute) for which
+#     suggestions are kept in cache (see AttributeSuggestionCache)
+#  - top_k: number of suggestions kept when they are ranked by score (see
+#     get_top_suggestions), None for all the suggestions in the order they
+#     are found
+#  - all_frames: whether the namespaces of the caller frames from the
+#     traceback are also searched for names and functions (see
+#     AnalysisContext.get_caller_namespaces)
+SETTINGS = {
+    'time_budget': None,
+    'lazy': False,
+    'instrumentation': False,
+    'attribute_cache_size': 256,
+    'top_k': None,
+    'all_frames': False,
+}
+
+#: Maximum number of caller frames (the closest to the last frame first)
+# whose namespaces are searched when SETTINGS['all_frames'] is set
+MAX_CALLER_FRAMES = 64
+
+#: Modules whose frames are not considered as caller frames (the APIs
+# catching the exceptions), only the ones from this package are ignored
+IGNORED_CALLER_MODULES = set(['didyoumean_api', 'didyoumean_async'])
+
+#: Flag of the code objects of functions (as opposed to the ones of modules
+# and class bodies whose names are not visible from nested functions)
+CO_OPTIMIZED = 0x0001
+
+#: Flag of the code objects of functions defined in another function
+CO_NESTED = 0x0010
+
+#: Maximum score of a suggestion (see ScoredSuggestion), also used for the
+# suggestions without score
+MAX_SCORE = 1.0
+
+#: Statistics about the computation of suggestions:
+#  - truncated: number of analyses stopped because of the time budget
+STATS = {
+    'truncated': 0,
+}
+
+#: Statistics about each suggestion function (when instrumentation is
+# enabled): mapping name of the function -> dict with:
+#  - calls: number of calls
+#  - matches: number of calls where the error message matched the regex
+#  - match_time: time spent (in seconds) matching the error message
+#  - suggestion_time: time spent (in seconds) producing suggestions
+#  - suggestions: number of suggestions yielded
+SUGGESTER_STATS = dict()
+
+#: Callbacks called with a SuggesterRecord for each call of a suggestion
+# function (when instrumentation is enabled)
+SUGGESTER_SINKS = []
+
+# Lock for the updates of STATS and SUGGESTER_STATS
+_STATS_LOCK = threading.Lock()
+
+#: Maximum number of namespaces for which a CallableIndex is kept in cache
+CALLABLE_INDEX_CACHE_SIZE = 16
+
+#: Maximum number of callables which can not be weakly referenced (like
+# the methods of builtin types) for which the parameters are kept in cache
+PARAMETERS_CACHE_SIZE = 256
+
 #: Almost synonyms methods that can be confused from one type to another
 # To be completed
 SYNONYMS_SETS = [
@@ -42,6 +125,21 @@ SYNONYMS_SETS = [
 #: Maximum number of files suggested
 MAX_NB_FILES = 4
 
+#: Maximum number of entries read from a directory to suggest its files
+# (the number of files is reported as "more than" this number above it)
+MAX_NB_FILES_COUNTED = 10000
+
+#: Maximum time (in seconds) spent reading entries from a directory to
+# suggest its files
+DIR_SCAN_TIME_BUDGET = 0.05
+
+#: Maximum number of directory listings kept in cache to suggest file names
+# close to a missing one (see DirectoryListingCache)
+DIR_LISTING_CACHE_SIZE = 64
+
+#: Time (in seconds) after which a directory listing in cache is read again
+DIR_LISTING_TTL = 5.0
+
 #: Message to suggest not using recursion
 AVOID_REC_MSG = \
     "to avoid recursion (cf " \
@@ -82,15 +180,82 @@ def quote(string):
     return "'{0}'".format(string)
 
 
+class ScoredSuggestion(str):
+    """Suggestion (string) along with a score used to rank it.
+
+    Scores are in [0, MAX_SCORE], typos get the similarity ratio between
+    the word and the match.
+    """
+
+    def __new__(cls, string, score):
+        """Create a ScoredSuggestion from a string and a score."""
+        scored = str.__new__(cls, string)
+        scored.score = score
+        return scored
+
+    def __reduce__(self):
+        """Pickle with the score."""
+        return (ScoredSuggestion, (str(self), self.score))
+
+
+class TypoSuggestion(ScoredSuggestion):
+    """Suggestion for a typo scored with the similarity ratio.
+
+    The ratio is only computed when the score is needed (to rank the
+    suggestions, see get_top_suggestions).
+    """
+
+    def __new__(cls, string, word, match):
+        """Create a TypoSuggestion from a string, a word and its match."""
+        typo = str.__new__(cls, string)
+        typo.word, typo.match = word, match
+        return typo
+
+    @property
+    def score(self):
+        """Get the similarity ratio between the word and the match."""
+        if '_score' not in self.__dict__:
+            self._score = fuzzy.get_ratio(self.word, self.match)
+        return self._score
+
+
+def get_typo_suggestion(string, word, match):
+    """Get the suggestion for a typo scored with the similarity ratio."""
+    return TypoSuggestion(string, word, match)
+
+
+def get_typo_max_score(word):
+    """Get the best score a typo suggestion for a word can get.
+
+    Exact matches are not suggested (see get_close_matches) so the closest
+    match has one character inserted: the ratio is 2n / (2n + 1) for a word
+    of length n.
+    """
+    return 2.0 * len(word) / (2 * len(word) + 1)
+
+
+def get_suggestions_if_improving(suggestions, max_score, context):
+    """Yield the suggestions unless they can not improve the ones kept.
+
+    The check is done when the first suggestion is needed (see
+    AnalysisContext.can_improve) so the suggestions are expected to be
+    computed lazily: nothing is computed when they are skipped.
+    """
+    if context.can_improve(max_score):
+        for sugg in suggestions:
+            yield sugg
+
+
 def get_close_matches(word, possibilities):
     """
     Return a list of the best "good enough" matches.
 
-    Wrapper around difflib.get_close_matches() to be able to
-    change default values or implementation details easily.
+    Wrapper around didyoumean_fuzzy.get_close_matches() (equivalent to
+    difflib.get_close_matches() with a pluggable implementation) to be able
+    to change default values or implementation details easily.
     """
     return [w
-            for w in difflib.get_close_matches(word, possibilities, 3, 0.7)
+            for w in fuzzy.get_close_matches(word, possibilities, 3, 0.7)
             if w != word]
 
 
@@ -127,14 +292,117 @@ def get_subclasses(klass):
     return subclasses
 
 
+class TypeIndex(object):
+    """Index mapping type names to the types with that name.
+
+    A new class can be derived from any existing class so there is no
+    cheap way to know whether the whole index is up to date. Instead, the
+    index is updated lazily, relying on snapshots of the direct subclasses
+    of each class visited:
+    - when a name is found, the subclasses of the types with that name and
+    of their bases are compared to their snapshot and the new ones are
+    indexed (this finds the classes defined again, the usual way to get a
+    new class with a known name);
+    - when a name is not found, the whole class hierarchy is visited and
+    the classes which are not indexed yet are added.
+    A new class with a known name derived from other bases is thus only
+    found after an update of the whole index (types in the namespaces are
+    also looked for by get_types_for_str).
+    Types are referenced weakly so that the index does not keep classes
+    alive. Lookups are lock-free: the index is updated copy-on-write, the
+    updates being serialised with a lock.
+    """
+
+    def __init__(self):
+        """Init an empty TypeIndex."""
+        self.by_name = dict()  # name -> tuple of weak references to types
+        self.snapshots = weakref.WeakKeyDictionary()  # type -> frozenset
+        self.lock = threading.Lock()
+
+    def add_type(self, klass):
+        """Add type to the index (without its subclasses)."""
+        name = klass.__name__
+        refs = self.by_name.get(name, ())
+        if any(ref() is klass for ref in refs):
+            return
+        try:
+            new_ref = weakref.ref(klass)
+        except TypeError:  # type can't be weakly referenced
+            return
+        self.by_name[name] = tuple(
+            ref for ref in refs if ref() is not None) + (new_ref,)
+
+    def get_snapshot(self, klass):
+        """Get the ids of the direct subclasses when a class was visited."""
+        try:
+            return self.snapshots.get(klass)
+        except TypeError:  # type can't be weakly referenced
+            return None
+
+    def is_stale(self, klass):
+        """Check whether the direct subclasses of a class have changed."""
+        snapshot = self.get_snapshot(klass)
+        return snapshot is None or \
+            snapshot != frozenset(map(id, subclasses_wrapper(klass)))
+
+    def update(self, roots, new_only):
+        """Index the classes derived from some classes (included).
+
+        The direct subclasses of each class are compared to its snapshot:
+        with new_only, only the ones not in the snapshot are visited.
+        """
+        seen = set(map(id, roots))
+        stack = list(roots)
+        while stack:
+            klass = stack.pop()
+            self.add_type(klass)
+            subclasses = subclasses_wrapper(klass)
+            snapshot = self.get_snapshot(klass)
+            try:
+                self.snapshots[klass] = frozenset(map(id, subclasses))
+            except TypeError:  # type can't be weakly referenced
+                pass
+            known = snapshot if new_only and snapshot is not None else ()
+            for derived in subclasses:
+                if id(derived) in seen or id(derived) in known:
+                    continue
+                seen.add(id(derived))
+                stack.append(derived)
+
+    def lookup(self, name):
+        """Get the set of indexed types with a given name."""
+        types = (ref() for ref in self.by_name.get(name, ()))
+        return set(t for t in types if t is not None and t.__name__ == name)
+
+    def get(self, name):
+        """Get the set of types with a given name (updating the index)."""
+        types = self.lookup(name)
+        if types:
+            classes = types.union(b for t in types for b in t.__bases__)
+            stale = [k for k in classes if self.is_stale(k)]
+            if not stale:
+                return types
+            with self.lock:
+                self.update(stale, True)
+        else:
+            with self.lock:
+                self.update([object], False)
+        return self.lookup(name)
+
+
+# To be used in `get_types_for_str_using_inheritance`.
+TYPE_INDEX = TypeIndex()
+
+
 def get_types_for_str_using_inheritance(name):
     """Get types corresponding to a string name.
 
-    This goes through all defined classes. Therefore, it :
+    This goes through all defined classes (using a cached index).
+    Therefore, it :
     - does not include old style classes on Python 2.x
     - is to be called as late as possible to ensure wanted type is defined.
     """
-    return set(c for c in get_subclasses(object) if c.__name__ == name)
+    return TYPE_INDEX.get(name)
 
 
 def get_types_for_str_using_names(name, frame):
@@ -143,6 +411,7 @@ def get_types_for_str_using_names(name, frame):
     This does not find everything as builtin types for instance may not
     be in the names.
     """
+    import inspect  # slow to import, only needed here
     return set(obj
                for obj, _ in get_objects_in_frame(frame).get(name, [])
                if inspect.isclass(obj) and obj.__name__ == name)
@@ -167,35 +436,57 @@ def get_types_for_str(tp_name, frame):
     res = set.union(
         get_types_for_str_using_inheritance(name),
         get_types_for_str_using_names(name, frame))
+    import inspect  # slow to import, only needed here
     assert all(inspect.isclass(t) and t.__name__ == name for t in res)
     return res
 
 
-def merge_dict(*dicts):
-    """Merge dicts and return a dictionary mapping key to list of values.
+ScopedObj = namedtuple('ScopedObj', 'obj scope')
+
 
-    Order of the values corresponds to the order of the original dicts.
+class NamespaceView(Mapping):
+    """Read-only mapping from names to the objects they refer to.
+
+    Names are looked up lazily in a sequence of (dict, scope) pairs and map
+    to the (non empty) list of ScopedObj objects found, in the order of the
+    scopes. Nothing gets copied: keys are iterated directly from the dicts.
     """
-    ret = dict()
-    for dict_ in dicts:
-        for key, val in dict_.items():
-            ret.setdefault(key, []).append(val)
-    return ret
 
+    def __init__(self, scopes):
+        """Init a NamespaceView from a list of (dict, scope) pairs."""
+        self.scopes = scopes
 
-ScopedObj = namedtuple('ScopedObj', 'obj scope')
+    def __getitem__(self, name):
+        """Get the list of ScopedObj for a name (KeyError if not found)."""
+        res = [ScopedObj(dict_[name], scope)
+               for dict_, scope in self.scopes
+               if name in dict_]
+        if not res:
+            raise KeyError(name)
+        return res
 
+    def __contains__(self, name):
+        """Check if name is defined in any of the scopes."""
+        return any(name in dict_ for dict_, _ in self.scopes)
 
-def add_scope_to_dict(dict_, scope):
-    """Convert name:obj dict to name:ScopedObj(obj,scope) dict."""
-    return dict((k, ScopedObj(v, scope)) for k, v in dict_.items())
+    def __iter__(self):
+        """Iterate over names (each name being provided only once)."""
+        for i, (dict_, _) in enumerate(self.scopes):
+            previous = [d for d, _ in self.scopes[:i]]
+            for name in dict_:
+                if not any(name in d for d in previous):
+                    yield name
+
+    def __len__(self):
+        """Get the number of different names."""
+        return sum(1 for _ in self)
 
 
 def get_objects_in_frame(frame):
     """Get objects defined in a given frame.
 
     This includes variable, types, builtins, etc.
-    The function returns a dictionary mapping names to a (non empty)
+    The function returns a (lazy) mapping from names to a (non empty)
     list of ScopedObj objects in the order following the LEGB Rule.
     """
     # https://www.python.org/dev/peps/pep-0227/ PEP227 Statically Nested Scopes
@@ -203,14 +494,167 @@ def get_objects_in_frame(frame):
     #      access to all visible scopes."
     # https://www.python.org/dev/peps/pep-3104/ PEP 3104 Access to Names in
     #      Outer Scopes
-    # LEGB Rule : missing E (enclosing) at the moment.
-    # I'm not sure if it can be fixed but if it can, suggestions
-    # tagged TODO_ENCLOSING could be implemented (and tested).
-    return merge_dict(
-        add_scope_to_dict(frame.f_locals, 'local'),
-        add_scope_to_dict(frame.f_globals, 'global'),
-        add_scope_to_dict(frame.f_builtins, 'builtin'),
-    )
+    # LEGB Rule : the E (enclosing) is not here as the namespaces of the
+    # enclosing functions may not exist anymore: only the names defined
+    # there can be retrieved (see get_enclosing_names).
+    return NamespaceView([
+        (frame.f_locals, 'local'),
+        (frame.f_globals, 'global'),
+        (frame.f_builtins, 'builtin'),
+    ])
+
+
+def get_code_path(root, is_target):
+    """Get the list of code objects from root to a target (None if none).
+
+    Code objects of nested functions and classes are looked up in the
+    constants of the code object they are defined in. The target is the
+    deepest code object for which is_target returns True.
+    """
+    for const in root.co_consts:
+        if isinstance(const, types.CodeType):
+            path = get_code_path(const, is_target)
+            if path is not None:
+                return [root] + path
+    return [root] if is_target(root) else None
+
+
+def get_caller_codes(frame, max_frames=MAX_CALLER_FRAMES):
+    """Yield the code objects of the caller frames (following f_back)."""
+    back = frame.f_back
+    for _ in range(max_frames):
+        if back is None:
+            break
+        yield back.f_code
+        back = back.f_back
+
+
+def get_root_codes(frame):
+    """Yield the code objects which may contain the code of a frame.
+
+    These are the code objects of the caller frames and the one of the
+    outermost function retrieved from the globals using the qualified name
+    (Python 3.11+) when the function is not called from where it is defined.
+    """
+    caller_codes = getattr(frame, 'caller_codes', None)
+    for code in get_caller_codes(frame) if caller_codes is None \
+            else caller_codes:
+        yield code
+    qualname = getattr(frame.f_code, 'co_qualname', '')
+    if '.<locals>.' in qualname:
+        parts = qualname.split('.<locals>.')[0].split('.')
+        obj = frame.f_globals.get(parts[0])
+        for part in parts[1:]:
+            obj = getattr(obj, '__dict__', dict()).get(part)
+        code = getattr(getattr(obj, '__func__', obj), '__code__', None)
+        if isinstance(code, types.CodeType):
+            yield code
+
+
+def get_enclosing_codes(frame):
+    """Get the code objects of the functions enclosing the code of a frame.
+
+    The innermost function comes first. Only code objects are used: the
+    frames of the enclosing functions are neither needed nor accessed.
+    The search goes on from the outermost code object found as long as it
+    is nested in a function.
+    """
+    code = frame.f_code
+    codes = []
+    seen = set()
+    for root in get_root_codes(frame):
+        if not code.co_flags & CO_NESTED:
+            break
+        if id(root) not in seen:
+            seen.add(id(root))
+            path = get_code_path(root, lambda c: c is code)
+            if path is not None:
+                codes.extend(c for c in reversed(path[:-1])
+                             if c.co_flags & CO_OPTIMIZED)
+                code = path[0]
+    return codes
+
+
+def get_names_in_codes(codes, names=()):
+    """Get the names of the variables of code objects, each name once."""
+    res = list(names)
+    seen = set(res)
+    for code in codes:
+        for name in code.co_varnames + code.co_cellvars:
+            if name not in seen:
+                seen.add(name)
+                res.append(name)
+    return res
+
+
+def get_enclosing_names(frame):
+    """Get the names defined in the functions enclosing a frame.
+
+    These are the free variables of the code of the frame and the variables
+    of the enclosing functions (see get_enclosing_codes), which can be
+    referred to from the frame, the innermost ones first.
+    """
+    if frame is None:
+        return []
+    return get_names_in_codes(get_enclosing_codes(frame),
+                              frame.f_code.co_freevars)
+
+
+def configure(**settings):
+    """Change some settings (see SETTINGS) and return their previous values."""
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise TypeError("unknown settings: " + ", ".join(sorted(unknown)))
+    previous = dict((name, SETTINGS[name]) for name in settings)
+    SETTINGS.update(settings)
+    return previous
+
+
+class TimeBudgetExceeded(Exception):
+    """Exception raised when the time budget of an analysis is exhausted."""
+
+
+#: Information about a call of a suggestion function (see SUGGESTER_STATS)
+SuggesterRecord = namedtuple('SuggesterRecord', [
+    'name', 'error_type', 'matched', 'match_time', 'suggestion_time',
+    'suggestions'])
+
+
+def get_suggester_stats(reset=False):
+    """Get a copy of the statistics about the suggestion functions.
+
+    The match rate is computed for each function. If `reset` is set,
+    statistics are cleared.
+    """
+    with _STATS_LOCK:
+        stats = dict((name, dict(func_stats))
+                     for name, func_stats in SUGGESTER_STATS.items())
+        if reset:
+            SUGGESTER_STATS.clear()
+    for func_stats in stats.values():
+        func_stats['match_rate'] = \
+            float(func_stats['matches']) / func_stats['calls']
+    return stats
+
+
+def record_suggester_call(record):
+    """Add a SuggesterRecord to the statistics and send it to the sinks."""
+    with _STATS_LOCK:
+        func_stats = SUGGESTER_STATS.get(record.name)
+        if func_stats is None:
+            func_stats = SUGGESTER_STATS[record.name] = {
+                'calls': 0, 'matches': 0, 'match_time': 0.0,
+                'suggestion_time': 0.0, 'suggestions': 0}
+        func_stats['calls'] += 1
+        func_stats['matches'] += bool(record.matched)
+        func_stats['match_time'] += record.match_time
+        func_stats['suggestion_time'] += record.suggestion_time
+        func_stats['suggestions'] += record.suggestions
+    for sink in list(SUGGESTER_SINKS):
+        try:
+            sink(record)
+        except Exception:  # instrumentation must not change the exception
+            pass
 
 
 def import_from_frame(module_name, frame):
@@ -223,11 +667,192 @@ def import_from_frame(module_name, frame):
         frame.f_locals)
 
 
+class AnalysisContext(object):
+    """Information about an exception shared by the suggestion functions.
+
+    A context is created once per exception. On top of the exception and
+    its last frame, it provides the facts derived from them (objects in the
+    frame, types for a name, attributes of these types, imported modules,
+    etc). These are computed lazily and at most once, no matter how many
+    suggestion functions need them.
+    """
+
+    def __init__(self, value, frame, time_budget=None, caller_frames=()):
+        """Init an AnalysisContext from an exception and its last frame.
+
+        A time budget (in seconds) can be provided, see check_deadline.
+        Caller frames (the closest to the last frame first) can be provided
+        for their namespaces to be searched as well.
+        """
+        self.value = value
+        self.frame = frame
+        self.caller_frames = list(caller_frames)
+        self.cache = dict()
+        self.deadline = None if time_budget is None \
+            else timeit.default_timer() + time_budget
+        # Score to beat for a suggestion to be kept (see get_top_suggestions)
+        self.min_score = None
+
+    def can_improve(self, max_score):
+        """Tell whether suggestions up to a score can still be kept.
+
+        This is always the case unless the suggestions are ranked and the
+        best ones found so far all have a score above max_score.
+        """
+        return self.min_score is None or max_score > self.min_score
+
+    def check_deadline(self):
+        """Raise TimeBudgetExceeded if the time budget is exhausted."""
+        if self.deadline is not None and \
+                timeit.default_timer() > self.deadline:
+            raise TimeBudgetExceeded()
+
+    def memoize(self, key, func, *args):
+        """Get the result of func(*args), computed only once for a key.
+
+        The deadline is checked before any computation.
+        """
+        try:
+            return self.cache[key]
+        except KeyError:
+            self.check_deadline()
+            res = self.cache[key] = func(*args)
+            return res
+
+    def get_matches(self):
+        """Get the matches of the error message for the registered regexps.
+
+        Result is a dict pattern -> match object (see Dispatcher.match_all).
+        It is empty if the first argument of the exception is not a string.
+        """
+        args = self.value.args
+        if not args or not isinstance(args[0], str):
+            return dict()
+        return self.memoize('matches', re.DISPATCHER.match_all, args[0])
+
+    def get_matched_patterns(self):
+        """Get the names of the regexps matching the error message."""
+        return sorted(re.get_pattern_name(p) for p in self.get_matches())
+
+    def get_objects(self):
+        """Get the objects in the frame (see get_objects_in_frame)."""
+        return self.memoize('objects', get_objects_in_frame, self.frame)
+
+    def get_enclosing_names(self):
+        """Get the names from the enclosing functions.
+
+        See get_enclosing_names: the namespaces are not accessed.
+        """
+        return self.memoize('enclosing_names', get_enclosing_names, self.frame)
+
+    def get_types_for_str(self, tp_name):
+        """Get the types for a type name (see get_types_for_str)."""
+        return self.memoize(
+            ('types', tp_name), get_types_for_str, tp_name, self.frame)
+
+    def get_type_attributes(self, tp_name):
+        """Get the set of attributes of the types for a type name."""
+        return self.memoize(
+            ('type_attributes', tp_name),
+            lambda: set(a for t in self.get_types_for_str(tp_name)
+                        for a in dir(t)))
+
+    def import_module(self, module_name):
+        """Import a module from the frame (see import_from_frame)."""
+        return self.memoize(
+            ('import', module_name),
+            import_from_frame, module_name, self.frame)
+
+    def get_module_attributes(self, module_name):
+        """Get the set of attributes of a module imported from the frame."""
+        return self.memoize(
+            ('module_attributes', module_name),
+            lambda: set(dir(self.import_module(module_name))))
+
+    def get_func_by_name(self, func_name):
+        """Get the functions with a given name (see get_func_by_name).
+
+        If none is found from the last frame, they are looked up in the
+        namespaces of the caller frames.
+        """
+        functions = self.memoize(
+            ('functions', func_name),
+            get_func_by_name, func_name, self.frame, self.check_deadline)
+        if functions or not self.caller_frames:
+            return functions
+        return self.memoize(
+            ('caller_functions', func_name),
+            get_func_by_name_in_namespaces, func_name,
+            [(dict_, volatile)
+             for dict_, _, volatile in self.get_caller_namespaces()],
+            self.check_deadline)
+
+    def get_caller_namespaces(self):
+        """Get the namespaces of the caller frames not in the last frame.
+
+        Namespaces are returned as (dict, scope, volatile) with volatile
+        being whether the dict holds local variables. Each dict is provided
+        only once (globals and builtins are usually shared by many frames)
+        so that the cost depends on the number of distinct namespaces and
+        not on the depth of the traceback.
+        """
+        return self.memoize(
+            'caller_namespaces', get_distinct_namespaces,
+            self.caller_frames,
+            [] if self.frame is None else [self.frame.f_locals,
+                                           self.frame.f_globals,
+                                           self.frame.f_builtins],
+            self.check_deadline)
+
+    def get_caller_objects(self):
+        """Get the objects from the namespaces of the caller frames.
+
+        See get_caller_namespaces and get_objects_in_frame.
+        """
+        return NamespaceView([(dict_, scope) for dict_, scope, _
+                              in self.get_caller_namespaces()])
+
+
+def get_distinct_namespaces(frames, known, check_deadline=None):
+    """Get the namespaces of frames which are not known yet.
+
+    Namespaces are returned as (dict, scope, volatile) with volatile being
+    whether the dict holds local variables. Dicts are compared by identity
+    and provided only once. See AnalysisContext.get_caller_namespaces.
+    """
+    seen = set(id(dict_) for dict_ in known)
+    namespaces = []
+    for frame in frames:
+        if check_deadline is not None:
+            check_deadline()
+        f_locals = frame.f_locals
+        f_globals = frame.f_globals
+        for dict_, scope, volatile in (
+                (f_locals, 'local in {0}()'.format(frame.f_code.co_name),
+                 f_locals is not f_globals),
+                (f_globals, 'global in {0}'.format(f_globals.get('__name__')),
+                 False),
+                (frame.f_builtins, 'builtin', False)):
+            if id(dict_) not in seen:
+                seen.add(id(dict_))
+                namespaces.append((dict_, scope, volatile))
+    return namespaces
+
+
 # To be used in `get_suggestions_for_exception`.
+# Lists of functions are never modified in place (copy-on-write) so that
+# the registry can be read without lock while functions get registered.
 SUGGESTION_FUNCTIONS = dict()
 
+# Lock for the registration of suggestion functions
+_REGISTRY_LOCK = threading.Lock()
 
-def register_suggestion_for(error_type, regex):
+# Mapping exception type -> applicable suggestion functions
+# (cache computed from SUGGESTION_FUNCTIONS, replaced on registration)
+_FUNCTIONS_BY_TYPE = weakref.WeakKeyDictionary()
+
+
+def register_context_suggestion_for(error_type, regex):
     """Decorator to register a function to be called to get suggestions.
 
     Parameters correspond to the fact that the registration is done for a
@@ -235,8 +860,43 @@ def register_suggestion_for(error_type, regex):
     (if the regex is None, the error message is assumed to match before being
     retrieved).
 
+    The regex is matched once per exception along with the other registered
+    regexps (see didyoumean_re.Dispatcher).
+
     The decorated function is expected to yield any number (0 included) of
     suggestions (as string).
+    The parameters are: (context, groups):
+     - context: AnalysisContext for the exception
+     - groups: Groups from the error message matched by the error message.
+    """
+    if regex is not None:
+        re.DISPATCHER.add(regex)
+
+    def internal_decorator(func):
+        def registered_function(context):
+            if regex is None:
+                return func(context, [])
+            match = context.get_matches().get(regex)
+            if match:
+                return func(context, match.groups())
+            return []
+        global _FUNCTIONS_BY_TYPE
+        registered_function.suggester = func
+        registered_function.regex = regex
+        with _REGISTRY_LOCK:
+            SUGGESTION_FUNCTIONS[error_type] = \
+                SUGGESTION_FUNCTIONS.get(error_type, []) + \
+                [registered_function]
+            _FUNCTIONS_BY_TYPE = weakref.WeakKeyDictionary()
+        return func  # return original function
+    return internal_decorator
+
+
+def register_suggestion_for(error_type, regex):
+    """Decorator to register a function to be called to get suggestions.
+
+    This is similar to `register_context_suggestion_for` for functions
+    not relying on the analysis context.
     The parameters are: (value, frame, groups):
      - value: Exception object
      - frame: Last frame of the traceback (may be None when the traceback is
@@ -244,43 +904,61 @@ def register_suggestion_for(error_type, regex):
      - groups: Groups from the error message matched by the error message.
     """
     def internal_decorator(func):
-        def registered_function(value, frame):
-            if regex is None:
-                return func(value, frame, [])
-            error_msg = value.args[0]
-            match = re.match(regex, error_msg)
-            if match:
-                return func(value, frame, match.groups())
-            return []
-        SUGGESTION_FUNCTIONS.setdefault(error_type, []) \
-            .append(registered_function)
+        @functools.wraps(func)
+        def context_function(context, groups):
+            return func(context.value, context.frame, groups)
+        register_context_suggestion_for(error_type, regex)(context_function)
         return func  # return original function
     return internal_decorator
 
 
+def unregister_suggestions_for(error_type):
+    """Unregister the functions registered for an error type.
+
+    The error type is expected to be the one used for the registration
+    (possibly a tuple of types). Like the registration, this can be done
+    while the registry is being read.
+    """
+    global _FUNCTIONS_BY_TYPE
+    with _REGISTRY_LOCK:
+        SUGGESTION_FUNCTIONS.pop(error_type, None)
+        _FUNCTIONS_BY_TYPE = weakref.WeakKeyDictionary()
+
+
 # Functions related to NameError
-@register_suggestion_for(NameError, re.VARREFBEFOREASSIGN_RE)
-@register_suggestion_for(NameError, re.NAMENOTDEFINED_RE)
-def suggest_name_not_defined(value, frame, groups):
+@register_context_suggestion_for(NameError, re.VARREFBEFOREASSIGN_RE)
+@register_context_suggestion_for(NameError, re.NAMENOTDEFINED_RE)
+def suggest_name_not_defined(context, groups):
     """Get the suggestions for name in case of NameError."""
-    del value  # unused param
     name, = groups
-    objs = get_objects_in_frame(frame)
+    objs = context.get_objects()
+    max_score = get_typo_max_score(name)
     return itertools.chain(
-        suggest_name_as_attribute(name, objs),
+        suggest_name_as_nonlocal(name, context),
+        suggest_name_as_attribute(name, objs, context.check_deadline),
         suggest_name_as_standard_module(name),
-        suggest_name_as_name_typo(name, objs),
-        suggest_name_as_keyword_typo(name),
-        suggest_name_as_missing_import(name, objs, frame),
+        get_suggestions_if_improving(
+            suggest_name_as_name_typo(name, objs), max_score, context),
+        get_suggestions_if_improving(
+            suggest_name_as_enclosing_typo(name, objs, context),
+            max_score, context),
+        suggest_name_from_callers(name, objs, context),
+        get_suggestions_if_improving(
+            suggest_name_as_keyword_typo(name), max_score, context),
+        suggest_name_as_missing_import(name, objs, context),
         suggest_name_as_special_case(name))
 
 
-def suggest_name_as_attribute(name, objdict):
+def suggest_name_as_attribute(name, objdict, check_deadline=None):
     """Suggest that name could be an attribute of an object.
 
     Example: 'do_stuff()' -> 'self.do_stuff()'.
+    As going through all objects can be long, a function can be provided
+    to be called regularly to stop by raising an exception.
     """
     for nameobj, objs in objdict.items():
+        if check_deadline is not None:
+            check_deadline()
         prev_scope = None
         for obj, scope in objs:
             if hasattr(obj, name):
@@ -291,13 +969,15 @@ def suggest_name_as_attribute(name, objdict):
             prev_scope = scope
 
 
-def suggest_name_as_missing_import(name, objdict, frame):
+def suggest_name_as_missing_import(name, objdict, context):
     """Suggest that name could come from missing import.
 
     Example: 'foo' -> 'import mod, mod.foo'.
     """
+    modules = symbols.get_symbol_index(STAND_MODULES) \
+        .get_modules_with_attribute(name)
     for mod in STAND_MODULES:
-        if mod not in objdict and name in dir(import_from_frame(mod, frame)):
+        if mod not in objdict and mod in modules:
             yield "'{0}' from {1} (not imported)".format(name, mod)
 
 
@@ -315,8 +995,46 @@ def suggest_name_as_name_typo(name, objdict):
 
     Example: 'foobaf' -> 'foobar'.
     """
-    for name in get_close_matches(name, objdict.keys()):
-        yield quote(name) + ' (' + objdict[name][0].scope + ')'
+    for match in get_close_matches(name, objdict.keys()):
+        yield get_typo_suggestion(
+            quote(match) + ' (' + objdict[match][0].scope + ')', name, match)
+
+
+def suggest_name_as_nonlocal(name, context):
+    """Suggest that a local variable could be declared as nonlocal.
+
+    Example: 'nb += 1' in a nested function -> 'nonlocal nb'.
+    """
+    frame = context.frame
+    if frame is not None and name in frame.f_code.co_varnames and \
+            name in context.get_enclosing_names():
+        yield quote('nonlocal ' + name)
+
+
+def suggest_name_as_enclosing_typo(name, objdict, context):
+    """Suggest that name could be a typo of a name from an enclosing scope.
+
+    Example: 'foob' -> 'foo' defined in the enclosing function.
+    """
+    names = [n for n in context.get_enclosing_names() if n not in objdict]
+    for match in get_close_matches(name, names):
+        yield get_typo_suggestion(quote(match) + ' (enclosing)', name, match)
+
+
+def suggest_name_from_callers(name, objdict, context):
+    """Suggest that name could be (a typo of) a name from a caller frame.
+
+    Example: 'foo' defined in the caller but not passed to the function.
+    Names defined in the last frame are not considered again.
+    """
+    caller_objs = context.get_caller_objects() if context.caller_frames \
+        else dict()
+    names = [n for n in caller_objs if n not in objdict]
+    matches = [name] if name in caller_objs else []
+    for match in matches + get_close_matches(name, names):
+        yield get_typo_suggestion(
+            quote(match) + ' (' + caller_objs[match][0].scope + ')',
+            name, match)
 
 
 def suggest_name_as_keyword_typo(name):
@@ -324,8 +1042,8 @@ def suggest_name_as_keyword_typo(name):
 
     Example: 'yieldd' -> 'yield'.
     """
-    for name in get_close_matches(name, keyword.kwlist):
-        yield quote(name) + " (keyword)"
+    for match in get_close_matches(name, keyword.kwlist):
+        yield get_typo_suggestion(quote(match) + " (keyword)", name, match)
 
 
 def suggest_name_as_special_case(name):
@@ -355,50 +1073,120 @@ def suggest_name_as_special_case(name):
 
 
 # Functions related to AttributeError
-@register_suggestion_for(AttributeError, re.ATTRIBUTEERROR_RE)
-@register_suggestion_for(TypeError, re.ATTRIBUTEERROR_RE)
-def suggest_attribute_error(value, frame, groups):
+@register_context_suggestion_for(AttributeError, re.ATTRIBUTEERROR_RE)
+@register_context_suggestion_for(TypeError, re.ATTRIBUTEERROR_RE)
+def suggest_attribute_error(context, groups):
     """Get suggestions in case of ATTRIBUTEERROR."""
-    del value  # unused param
     type_str, attr = groups
-    return get_attribute_suggestions(type_str, attr, frame)
+    return get_attribute_suggestions(type_str, attr, context)
 
 
-@register_suggestion_for(AttributeError, re.MODULEHASNOATTRIBUTE_RE)
-def suggest_module_has_no_attr(value, frame, groups):
+@register_context_suggestion_for(AttributeError, re.MODULEHASNOATTRIBUTE_RE)
+def suggest_module_has_no_attr(context, groups):
     """Get suggestions in case of MODULEHASNOATTRIBUTE."""
-    del value  # unused param
     _, attr = groups  # name ignored for the time being
-    return get_attribute_suggestions('module', attr, frame)
-
-
-def get_attribute_suggestions(type_str, attribute, frame):
-    """Get the suggestions closest to the attribute name for a given type."""
-    types = get_types_for_str(type_str, frame)
-    attributes = set(a for t in types for a in dir(t))
-    if type_str == 'module':
-        # For module, we manage to get the corresponding 'module' type
-        # but the type doesn't bring much information about its content.
-        # A hacky way to do so is to assume that the exception was something
-        # like 'module_name.attribute' so that we can actually find the module
-        # based on the name. Eventually, we check that the found object is a
-        # module indeed. This is not failproof but it brings a whole lot of
-        # interesting suggestions and the (minimal) risk is to have invalid
-        # suggestions.
-        module_name = frame.f_code.co_names[0]
-        objs = get_objects_in_frame(frame)
-        mod = objs[module_name][0].obj
-        if inspect.ismodule(mod):
-            attributes = set(dir(mod))
+    return get_attribute_suggestions('module', attr, context)
+
+
+class AttributeSuggestionCache(object):
+    """LRU cache for the suggestions depending only on types and attribute.
+
+    Entries are keyed by the (weakly referenced) types, the name of the
+    type and the attribute. Each entry stores a fingerprint of the types
+    (the names in the __dict__ of the classes in their MRO) so that it is
+    invalidated when attributes are added to or removed from a class.
+    The maximum size is read from SETTINGS['attribute_cache_size'].
+    The lock is not held while suggestions are computed.
+    """
+
+    def __init__(self):
+        """Init an empty AttributeSuggestionCache."""
+        self.entries = OrderedDict()  # most recently used last
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """Get the number of entries in the cache."""
+        return len(self.entries)
+
+    def clear(self):
+        """Remove all entries (counters are kept)."""
+        with self.lock:
+            self.entries.clear()
+
+    def get(self, types, type_str, attribute, func):
+        """Get the suggestions for types and attribute (computed by func)."""
+        refs = [(weakref.ref(t), t) for t in types]
+        key = (frozenset(r for r, _ in refs), type_str, attribute)
+        fingerprint = frozenset(
+            (r, tuple(frozenset(d) for d in get_static_dicts(t)))
+            for r, t in refs)
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[0] == fingerprint:
+                self.hits += 1
+            else:
+                self.misses += 1
+                entry = None
+        if entry is None:
+            entry = (fingerprint, func())
+        max_size = SETTINGS['attribute_cache_size']
+        with self.lock:
+            self.entries.pop(key, None)
+            while self.entries and len(self.entries) >= max_size:
+                self.entries.popitem(last=False)
+            if max_size > 0:
+                self.entries[key] = entry
+        return entry[1]
+
+
+# To be used in `get_attribute_suggestions`.
+ATTRIBUTE_SUGGESTIONS = AttributeSuggestionCache()
+
 
+def get_attribute_suggestions(type_str, attribute, context):
+    """Get the suggestions closest to the attribute name for a given type.
+
+    Suggestions only depending on the types and on the attribute are cached
+    (see AttributeSuggestionCache) except for modules.
+    """
+    if type_str != 'module':
+        return itertools.chain(
+            suggest_attribute_is_other_obj(attribute, type_str, context),
+            ATTRIBUTE_SUGGESTIONS.get(
+                context.get_types_for_str(type_str), type_str, attribute,
+                lambda: list(get_type_attribute_suggestions(
+                    attribute, type_str,
+                    context.get_type_attributes(type_str)))))
+    # For module, we manage to get the corresponding 'module' type
+    # but the type doesn't bring much information about its content.
+    # A hacky way to do so is to assume that the exception was something
+    # like 'module_name.attribute' so that we can actually find the module
+    # based on the name. Eventually, we check that the found object is a
+    # module indeed. This is not failproof but it brings a whole lot of
+    # interesting suggestions and the (minimal) risk is to have invalid
+    # suggestions.
+    attributes = context.get_type_attributes(type_str)
+    module_name = context.frame.f_code.co_names[0]
+    objs = context.get_objects()
+    mod = objs[module_name][0].obj
+    if isinstance(mod, types.ModuleType):
+        attributes = set(dir(mod))
+    return itertools.chain(
+        suggest_attribute_is_other_obj(attribute, type_str, context),
+        get_type_attribute_suggestions(attribute, type_str, attributes))
+
+
+def get_type_attribute_suggestions(attribute, type_str, attributes):
+    """Get the suggestions only depending on the attributes of the type."""
     return itertools.chain(
-        suggest_attribute_is_other_obj(attribute, type_str, frame),
         suggest_attribute_alternative(attribute, type_str, attributes),
         suggest_attribute_as_typo(attribute, attributes),
         suggest_attribute_as_special_case(attribute))
 
 
-def suggest_attribute_is_other_obj(attribute, type_str, frame):
+def suggest_attribute_is_other_obj(attribute, type_str, context):
     """Suggest that attribute correspond to another object.
 
     This can happen in two cases:
@@ -407,8 +1195,8 @@ def suggest_attribute_is_other_obj(attribute, type_str, frame):
      - A typo on the '.' which should have been a ','
         * Example: a, b = 1, 2 then: 'min(a. b)' -> 'min(a, b)'
     """
-    for obj, scope in get_objects_in_frame(frame).get(attribute, []):
-        if attribute in frame.f_code.co_names:
+    for obj, scope in context.get_objects().get(attribute, []):
+        if attribute in context.frame.f_code.co_names:
             if scope == 'builtin' and '__call__' in dir(obj):
                 yield quote(attribute + '(' + type_str + ')')
             else:
@@ -480,9 +1268,10 @@ def suggest_attribute_as_typo(attribute, attributes):
     for name in get_close_matches(attribute, attributes):
         # Handle Private name mangling
         if name.startswith('_') and '__' in name and not name.endswith('__'):
-            yield quote(name) + ' (but it is supposed to be private)'
+            sugg = quote(name) + ' (but it is supposed to be private)'
         else:
-            yield quote(name)
+            sugg = quote(name)
+        yield get_typo_suggestion(sugg, attribute, name)
 
 
 def suggest_attribute_as_special_case(attribute):
@@ -498,51 +1287,61 @@ def suggest_attribute_as_special_case(attribute):
 
 
 # Functions related to ImportError
-@register_suggestion_for(ImportError, re.NOMODULE_RE)
-def suggest_no_module(value, frame, groups):
+@register_context_suggestion_for(ImportError, re.NOMODULE_RE)
+def suggest_no_module(context, groups):
     """Get the suggestions closest to the failing module import.
 
     Example: 'import maths' -> 'import math'.
     """
-    del value, frame  # unused param
     module_str, = groups
-    for name in get_close_matches(module_str, STAND_MODULES):
-        yield quote(name)
-
-
-@register_suggestion_for(ImportError, re.CANNOTIMPORT_RE)
-def suggest_cannot_import(value, frame, groups):
+    if not context.can_improve(get_typo_max_score(module_str)):
+        return
+    names = get_close_matches(module_str, STAND_MODULES)
+    if not names:
+        # Other (public) modules available are considered only when no
+        # standard module matches to avoid too many suggestions
+        names = get_close_matches(module_str, symbols.get_symbol_index(
+            STAND_MODULES).get_public_module_names())
+    for name in names:
+        yield get_typo_suggestion(quote(name), module_str, name)
+
+
+@register_context_suggestion_for(ImportError, re.CANNOTIMPORT_RE)
+def suggest_cannot_import(context, groups):
     """Get the suggestions closest to the failing import."""
-    del value  # unused param
     imported_name, = groups
-    module_name = frame.f_code.co_names[0]
+    module_name = context.frame.f_code.co_names[0]
     return itertools.chain(
-        suggest_imported_name_as_typo(imported_name, module_name, frame),
-        suggest_import_from_module(imported_name, frame))
+        get_suggestions_if_improving(
+            suggest_imported_name_as_typo(imported_name, module_name, context),
+            get_typo_max_score(imported_name), context),
+        suggest_import_from_module(imported_name, context))
 
 
-def suggest_imported_name_as_typo(imported_name, module_name, frame):
+def suggest_imported_name_as_typo(imported_name, module_name, context):
     """Suggest that imported name could be a typo from actual name in module.
 
     Example: 'from math import pie' -> 'from math import pi'.
     """
-    dir_mod = dir(import_from_frame(module_name, frame))
+    dir_mod = context.get_module_attributes(module_name)
     for name in get_close_matches(imported_name, dir_mod):
-        yield quote(name)
+        yield get_typo_suggestion(quote(name), imported_name, name)
 
 
-def suggest_import_from_module(imported_name, frame):
+def suggest_import_from_module(imported_name, context):
     """Suggest than name could be found in a standard module.
 
     Example: 'from itertools import pi' -> 'from math import pi'.
     """
+    modules = symbols.get_symbol_index(STAND_MODULES) \
+        .get_modules_with_attribute(imported_name)
     for mod in STAND_MODULES:
-        if imported_name in dir(import_from_frame(mod, frame)):
+        if mod in modules:
             yield quote('from {0} import {1}'.format(mod, imported_name))
 
 
 # Functions related to TypeError
-def suggest_feature_not_supported(attr, type_str, frame):
+def suggest_feature_not_supported(attr, type_str, context):
     """Get suggestion for unsupported feature."""
     # 'Object does not support <feature>' exceptions
     # can be somehow seen as attribute errors for magic
@@ -550,35 +1349,31 @@ def suggest_feature_not_supported(attr, type_str, frame):
     # have any fuzzy logic on the magic method name.
     # Also, we want to suggest the implementation of the
     # missing method (if is it not on a builtin object).
-    types = get_types_for_str(type_str, frame)
-    attributes = set(a for t in types for a in dir(t))
+    attributes = context.get_type_attributes(type_str)
     for s in suggest_attribute_alternative(attr, type_str, attributes):
         yield s
-    if type_str not in frame.f_builtins and \
+    if type_str not in context.frame.f_builtins and \
             type_str not in ('function', 'generator', 'builtin_function_or_method'):
         yield 'implement "' + attr + '" on ' + type_str
 
 
-@register_suggestion_for(TypeError, re.UNSUBSCRIPTABLE_RE)
-def suggest_unsubscriptable(value, frame, groups):
+@register_context_suggestion_for(TypeError, re.UNSUBSCRIPTABLE_RE)
+def suggest_unsubscriptable(context, groups):
     """Get suggestions in case of UNSUBSCRIPTABLE error."""
-    del value  # unused param
     type_str, = groups
-    return suggest_feature_not_supported('__getitem__', type_str, frame)
+    return suggest_feature_not_supported('__getitem__', type_str, context)
 
 
-@register_suggestion_for(TypeError, re.NOT_CALLABLE_RE)
-def suggest_not_callable(value, frame, groups):
+@register_context_suggestion_for(TypeError, re.NOT_CALLABLE_RE)
+def suggest_not_callable(context, groups):
     """Get suggestions in case of NOT_CALLABLE error."""
-    del value  # unused param
     type_str, = groups
-    return suggest_feature_not_supported('__call__', type_str, frame)
+    return suggest_feature_not_supported('__call__', type_str, context)
 
 
-@register_suggestion_for(TypeError, re.OBJ_DOES_NOT_SUPPORT_RE)
-def suggest_obj_does_not_support(value, frame, groups):
+@register_context_suggestion_for(TypeError, re.OBJ_DOES_NOT_SUPPORT_RE)
+def suggest_obj_does_not_support(context, groups):
     """Get suggestions in case of OBJ DOES NOT SUPPORT error."""
-    del value  # unused param
     type_str, feature = groups
     FEATURES = {
         'indexing': '__getitem__',
@@ -588,23 +1383,21 @@ def suggest_obj_does_not_support(value, frame, groups):
     attr = FEATURES.get(feature)
     if attr is None:
         return []
-    return suggest_feature_not_supported(attr, type_str, frame)
+    return suggest_feature_not_supported(attr, type_str, context)
 
 
-@register_suggestion_for(TypeError, re.OBJECT_HAS_NO_FUNC_RE)
-def suggest_obj_has_no(value, frame, groups):
+@register_context_suggestion_for(TypeError, re.OBJECT_HAS_NO_FUNC_RE)
+def suggest_obj_has_no(context, groups):
     """Get suggestions in case of OBJECT_HAS_NO_FUNC."""
-    del value  # unused param
     type_str, feature = groups
     if feature in ('length', 'len'):
-        return suggest_feature_not_supported('__len__', type_str, frame)
+        return suggest_feature_not_supported('__len__', type_str, context)
     return []
 
 
-@register_suggestion_for(TypeError, re.BAD_OPERAND_UNARY_RE)
-def suggest_bad_operand_for_unary(value, frame, groups):
+@register_context_suggestion_for(TypeError, re.BAD_OPERAND_UNARY_RE)
+def suggest_bad_operand_for_unary(context, groups):
     """Get suggestions for BAD_OPERAND_UNARY."""
-    del value  # unused param
     unary, type_str = groups
     UNARY_OPS = {
         '+': '__pos__',
@@ -618,19 +1411,18 @@ def suggest_bad_operand_for_unary(value, frame, groups):
     attr = UNARY_OPS.get(unary)
     if attr is None:
         return []
-    return suggest_feature_not_supported(attr, type_str, frame)
+    return suggest_feature_not_supported(attr, type_str, context)
 
 
-@register_suggestion_for(TypeError, re.UNSUPPORTED_OP_RE)
-@register_suggestion_for(TypeError, re.UNSUPPORTED_OP_SUGG_RE)
-def suggest_unsupported_op(value, frame, groups):
+@register_context_suggestion_for(TypeError, re.UNSUPPORTED_OP_RE)
+@register_context_suggestion_for(TypeError, re.UNSUPPORTED_OP_SUGG_RE)
+def suggest_unsupported_op(context, groups):
     """Get suggestions for UNSUPPORTED_OP_RE/UNSUPPORTED_OP_SUGG_RE."""
-    del value  # unused param
     binary, type1, type2 = groups[:3]
     sugg = "" if len(groups) < 3 + 1 else groups[3]
     # Special case for print being used without parenthesis (Python 2 style)
     if type1 in ('builtin_function_or_method', 'builtin_function') and \
-       'print' in frame.f_code.co_names and \
+       'print' in context.frame.f_code.co_names and \
        not sugg.startswith('print('):
         if binary == '>>':
             yield '"print(<message>, file=<output_stream>)"'\
@@ -643,70 +1435,407 @@ def suggest_unsupported_op(value, frame, groups):
     attr = BINARY_OPS.get(binary)
     # Suggestion is based on first type which may not be the best
     if attr is not None:
-        for s in suggest_feature_not_supported(attr, type1, frame):
+        for s in suggest_feature_not_supported(attr, type1, context):
             yield s
 
 
-@register_suggestion_for(TypeError, re.CANNOT_BE_INTERPRETED_INT_RE)
-@register_suggestion_for(TypeError, re.INTEGER_EXPECTED_GOT_RE)
-@register_suggestion_for(TypeError, re.INDICES_MUST_BE_INT_RE)
-def suggest_integer_type_expected(value, frame, groups):
+@register_context_suggestion_for(TypeError, re.CANNOT_BE_INTERPRETED_INT_RE)
+@register_context_suggestion_for(TypeError, re.INTEGER_EXPECTED_GOT_RE)
+@register_context_suggestion_for(TypeError, re.INDICES_MUST_BE_INT_RE)
+def suggest_integer_type_expected(context, groups):
     """Get suggestions when an int is wanted."""
-    del value  # unused param
     type_str, = groups
-    return suggest_feature_not_supported('__index__', type_str, frame)
-
-
-def get_func_by_name(func_name, frame):
-    """Get the function with the given name in the frame."""
-    # TODO: Handle qualified names such as dict.get
-    # Dirty workaround is to remove everything before the last '.'
-    func_name = func_name.split('.')[-1]
-    objs = get_objects_in_frame(frame)
-    # Trying to fetch reachable objects: getting objects and attributes
-    # for objects. We would go deeper (with a fixed point algorithm) but
-    # it doesn't seem to be worth it. In any case, we'll be missing a few
-    # possible functions.
-    objects = [o.obj for lst in objs.values() for o in lst]
-    for obj in list(objects):
-        for a in dir(obj):
-            attr = getattr(obj, a, None)
-            if attr is not None:
-                objects.append(attr)
-    # Then, we filter for function with the correct name (the name being the
-    # name on the function object which is not always the same from the
-    # namespace).
-    return [func
-            for func in objects
-            if getattr(func, '__name__', None) == func_name]
-
-
-def suggest_unexpected_keywordarg_for_func(kw_arg, func_name, frame):
+    return suggest_feature_not_supported('__index__', type_str, context)
+
+
+# Types of the old style classes and of their instances on Python 2 (no
+# __mro__, attributes not retrieved by object.__getattribute__)
+OLD_STYLE_CLASS_TYPES = tuple(
+    getattr(types, name) for name in ('ClassType',) if hasattr(types, name))
+OLD_STYLE_TYPES = tuple(
+    getattr(types, name) for name in ('ClassType', 'InstanceType')
+    if hasattr(types, name))
+
+# Types of the __dict__ of objects (the dictproxy of the classes is not a
+# Mapping on Python 2)
+DICT_TYPES = (Mapping, type(type.__dict__))
+
+
+def is_class(obj):
+    """Check whether an object is a class (old style classes included)."""
+    return isinstance(obj, (type,) + OLD_STYLE_CLASS_TYPES)
+
+
+def get_class(obj):
+    """Get the class of an object (old style classes included)."""
+    if OLD_STYLE_TYPES and isinstance(obj, OLD_STYLE_TYPES):
+        return obj.__class__
+    return type(obj)
+
+
+def get_mro(klass):
+    """Get the classes in the MRO of a class.
+
+    Old style classes have no __mro__: their bases are searched depth-first
+    as done by inspect.getmro.
+    """
+    if isinstance(klass, type):
+        return klass.__mro__
+    mro = [klass]
+    for base in klass.__bases__:
+        mro.extend(k for k in get_mro(base) if k not in mro)
+    return tuple(mro)
+
+
+def get_static_dicts(obj):
+    """Yield the dictionaries where the attributes of an object are stored.
+
+    This corresponds to the __dict__ of the object (if it is not a class)
+    and the ones from the classes in the MRO of its class. These are
+    retrieved without triggering properties, descriptors, __getattr__, etc.
+    """
+    obj_is_class = is_class(obj)
+    if not obj_is_class:
+        yield get_static_dict(obj)
+    for klass in get_mro(obj if obj_is_class else get_class(obj)):
+        yield get_static_dict(klass)
+
+
+def get_static_dict(obj):
+    """Get the __dict__ of an object (empty dict if there is none)."""
+    if OLD_STYLE_TYPES and isinstance(obj, OLD_STYLE_TYPES):
+        return obj.__dict__  # no __getattr__ involved
+    try:
+        obj_dict = object.__getattribute__(obj, '__dict__')
+    except Exception:
+        return dict()
+    return obj_dict if isinstance(obj_dict, DICT_TYPES) else dict()
+
+
+def unwrap_static_value(value):
+    """Get the function behind a static or class method."""
+    if isinstance(value, (staticmethod, classmethod)):
+        return value.__func__
+    return value
+
+
+def get_static_attribute(obj, name):
+    """Get an attribute of an object without triggering any code.
+
+    None is returned if the attribute is not found.
+    """
+    for attr_dict in get_static_dicts(obj):
+        if name in attr_dict:
+            return unwrap_static_value(attr_dict[name])
+    return None
+
+
+def get_static_name(obj):
+    """Get the __name__ of a callable without triggering any code."""
+    if isinstance(obj, types.MethodType):
+        obj = obj.__func__
+    if OLD_STYLE_CLASS_TYPES and isinstance(obj, OLD_STYLE_CLASS_TYPES):
+        return obj.__name__  # no __getattr__ involved
+    try:
+        return object.__getattribute__(obj, '__name__')
+    except Exception:
+        return None
+
+
+def get_indexed_dicts(namespace, check_deadline=None):
+    """Yield the dicts whose values are indexed by a CallableIndex.
+
+    These are the namespace and the dicts of attributes of its values
+    (retrieved statically as in get_static_dicts), the dict of each class
+    being yielded once. They are yielded with their owner: None for the
+    namespace, a tuple (name, value, object owning the dict) otherwise.
+    A function can be provided to be called regularly to stop the
+    iteration by raising an exception.
+    """
+    yield None, namespace
+    seen_classes = set()
+    for name, obj in list(namespace.items()):
+        if check_deadline is not None:
+            check_deadline()
+        if is_class(obj):
+            mro = get_mro(obj)
+        else:
+            yield (name, obj, obj), get_static_dict(obj)
+            mro = get_mro(get_class(obj))
+        for klass in mro:
+            if id(klass) not in seen_classes:
+                seen_classes.add(id(klass))
+                yield (name, obj, klass), get_static_dict(klass)
+
+
+def get_weak_ref(obj):
+    """Get a weak reference to an object (a strong one if not possible)."""
+    try:
+        return weakref.ref(obj)
+    except TypeError:
+        return lambda: obj
+
+
+class CallableIndex(object):
+    """Index by __name__ of the callables reachable from a namespace.
+
+    Objects reachable are the values in the namespace and their attributes
+    (see get_indexed_dicts). We could go deeper (with a fixed point
+    algorithm) but it doesn't seem to be worth it. In any case, we'll be
+    missing a few possible functions.
+    Callables are referenced weakly when possible so that a cached index
+    does not keep them alive. The way each of them was reached is kept so
+    that the callables retrieved are checked to be still reachable.
+    """
+
+    def __init__(self, namespace, check_deadline=None):
+        """Init a CallableIndex for a namespace (dict name -> object).
+
+        As this can be long, a function can be provided to be called
+        regularly to stop the indexing by raising an exception.
+        """
+        self.by_name = dict()
+        seen = set()
+        for owner, attr_dict in get_indexed_dicts(namespace, check_deadline):
+            self.add_values(owner, attr_dict, seen)
+
+    def add_values(self, owner, attr_dict, seen):
+        """Add the values from a dict of attributes (see is_reachable)."""
+        if owner is not None:
+            name, value, obj = owner
+            owner = (name, id(value), get_weak_ref(obj))
+        for attr, value in list(attr_dict.items()):
+            path = (attr,) if owner is None else owner + (attr,)
+            self.add(unwrap_static_value(value), path, seen)
+
+    def add(self, obj, path, seen):
+        """Add an object to the index (if callable and not seen yet)."""
+        if id(obj) not in seen and callable(obj):
+            seen.add(id(obj))
+            name = get_static_name(obj)
+            if name is not None:
+                self.by_name.setdefault(name, []).append(
+                    (get_weak_ref(obj), path))
+
+    def get(self, name, namespace):
+        """Get the callables with a given __name__ still reachable."""
+        functions = []
+        for ref, path in self.by_name.get(name, []):
+            func = ref()
+            if func is not None and is_reachable(func, namespace, path):
+                functions.append(func)
+        return functions
+
+
+def is_reachable(obj, namespace, path):
+    """Check whether an indexed object is still reachable from a namespace.
+
+    The path is (name,) for the values of the namespace. For the attributes,
+    it is (name, id of the value, weak reference to the object owning the
+    dict of attributes, name of the attribute).
+    """
+    if len(path) == 1:
+        return unwrap_static_value(namespace.get(path[0])) is obj
+    name, value_id, owner_ref, attr = path
+    owner = owner_ref()
+    if owner is None or id(namespace.get(name)) != value_id:
+        return False
+    return unwrap_static_value(get_static_dict(owner).get(attr)) is obj
+
+
+# Mapping id(namespace) -> (names, CallableIndex) with the names in the
+# namespace when it was indexed (most recently used last). Namespaces
+# (dicts) can not be weakly referenced: they are not kept alive, nor the
+# callables indexed. As the id of a namespace can be reused once it is
+# freed, its names are compared as well.
+_CALLABLE_INDEXES = OrderedDict()
+
+# Lock for _CALLABLE_INDEXES (not held while building an index)
+_CALLABLE_INDEXES_LOCK = threading.Lock()
+
+
+def get_callable_index(namespace, check_deadline=None):
+    """Get the CallableIndex for a namespace (cached).
+
+    The index is reused as long as the names in the namespace are the same:
+    it is cheap to check, unlike the content of the attributes of the
+    values. The callables retrieved from the index are checked to be still
+    reachable but the ones added since the indexing to the attributes of
+    the values (or to the namespace, replacing another value) are missed.
+    """
+    names = tuple(namespace)
+    key = id(namespace)
+    with _CALLABLE_INDEXES_LOCK:
+        entry = _CALLABLE_INDEXES.get(key)
+    if entry is None or entry[0] != names:
+        entry = (names, CallableIndex(namespace, check_deadline))
+    with _CALLABLE_INDEXES_LOCK:
+        _CALLABLE_INDEXES.pop(key, None)
+        while len(_CALLABLE_INDEXES) >= CALLABLE_INDEX_CACHE_SIZE:
+            _CALLABLE_INDEXES.popitem(last=False)
+        _CALLABLE_INDEXES[key] = entry
+    return entry[1]
+
+
+def resolve_qualified_name(qual_name, namespaces):
+    """Get the callable with a qualified name (like 'dict.get') in a list.
+
+    The first component of the name is looked for in the namespaces and the
+    next ones are retrieved as attributes (statically).
+    """
+    parts = qual_name.split('.')
+    for namespace in namespaces:
+        obj = namespace.get(parts[0])
+        for part in parts[1:]:
+            if obj is None:
+                break
+            obj = get_static_attribute(obj, part)
+        if obj is not None and callable(obj):
+            return [obj]
+    return []
+
+
+def get_func_by_name(func_name, frame, check_deadline=None):
+    """Get the function with the given name in the frame.
+
+    Qualified names (such as 'dict.get') are resolved directly when possible.
+    Otherwise, we look for the functions reachable from the frame with the
+    correct name (the name being the name on the function object which is
+    not always the same from the namespace), relying on indexes built for
+    the namespaces.
+    As this can be long, a function can be provided to be called regularly
+    to stop the search by raising an exception.
+    """
+    return get_func_by_name_in_namespaces(func_name, [
+        (frame.f_locals, frame.f_locals is not frame.f_globals),
+        (frame.f_globals, False),
+        (frame.f_builtins, False),
+    ], check_deadline)
+
+
+def get_func_by_name_in_namespaces(func_name, namespaces, check_deadline=None):
+    """Get the functions with the given name from namespaces.
+
+    Namespaces are provided as (dict, volatile) pairs, volatile being
+    whether the dict holds local variables (changing too often for an index
+    to be reused). See get_func_by_name.
+    """
+    if '.' in func_name:
+        functions = resolve_qualified_name(
+            func_name, [namespace for namespace, _ in namespaces])
+        if functions:
+            return functions
+        func_name = func_name.split('.')[-1]
+    functions = []
+    seen = set()
+    for namespace, volatile in namespaces:
+        if volatile:
+            index = CallableIndex(namespace, check_deadline)
+        else:
+            index = get_callable_index(namespace, check_deadline)
+        for func in index.get(func_name, namespace):
+            if id(func) not in seen:
+                seen.add(id(func))
+                functions.append(func)
+    return functions
+
+
+# Mapping callable -> (code object, names of the keyword parameters) with
+# the code object (if any) invalidating the entry when __code__ is changed
+_PARAMETERS = weakref.WeakKeyDictionary()
+
+# Mapping id(callable) -> (callable, entry as in _PARAMETERS) for the
+# callables which can not be weakly referenced (most recently used last)
+_STRONG_PARAMETERS = OrderedDict()
+
+# Lock for _PARAMETERS and _STRONG_PARAMETERS (not held while retrieving
+# a signature)
+_PARAMETERS_LOCK = threading.Lock()
+
+
+def get_keyword_parameters_from_signature(func):
+    """Get the names of the parameters of a callable usable as keywords.
+
+    None is returned when the signature of the callable is not available.
+    """
+    import inspect  # slow to import, only needed here
+    if not hasattr(inspect, 'signature'):  # Python 2
+        code = getattr(func, '__code__', None)
+        if code is None:
+            return None
+        return code.co_varnames[:code.co_argcount]
+    try:
+        signature = inspect.signature(func)
+    except (TypeError, ValueError):
+        return None
+    kinds = (inspect.Parameter.POSITIONAL_OR_KEYWORD,
+             inspect.Parameter.KEYWORD_ONLY)
+    return tuple(param.name for param in signature.parameters.values()
+                 if param.kind in kinds)
+
+
+def get_keyword_parameters(func):
+    """Get the names of the parameters of a callable usable as keywords.
+
+    The result is cached per callable (see _PARAMETERS) and None is returned
+    when the signature is not available. Methods are handled through their
+    function (to be cached once for all the instances).
+    """
+    if isinstance(func, types.MethodType):
+        func = func.__func__
+    code = getattr(func, '__code__', None)
+    try:
+        with _PARAMETERS_LOCK:
+            entry = _PARAMETERS.get(func)
+        key = None
+    except TypeError:  # can not be weakly referenced
+        key = id(func)
+        with _PARAMETERS_LOCK:
+            obj, entry = _STRONG_PARAMETERS.get(key, (None, None))
+        if obj is not func:
+            entry = None
+    if entry is not None and entry[0] is code and key is None:
+        return entry[1]
+    if entry is None or entry[0] is not code:
+        entry = (code, get_keyword_parameters_from_signature(func))
+    with _PARAMETERS_LOCK:
+        if key is None:
+            _PARAMETERS[func] = entry
+        else:
+            _STRONG_PARAMETERS.pop(key, None)
+            while len(_STRONG_PARAMETERS) >= PARAMETERS_CACHE_SIZE:
+                _STRONG_PARAMETERS.popitem(last=False)
+            _STRONG_PARAMETERS[key] = (func, entry)
+    return entry[1]
+
+
+def suggest_unexpected_keywordarg_for_func(kw_arg, func_name, context):
     """Get suggestions in case of unexpected keyword argument."""
-    functions = get_func_by_name(func_name, frame)
-    func_codes = [f.__code__ for f in functions if hasattr(f, '__code__')]
-    args = set([var for func in func_codes for var in func.co_varnames])
+    if kw_arg != 'cmp' and \
+            not context.can_improve(get_typo_max_score(kw_arg)):
+        return
+    functions = context.get_func_by_name(func_name)
+    params = [get_keyword_parameters(f) for f in functions]
+    args = set(arg for names in params if names is not None
+               for arg in names)
     for arg_name in get_close_matches(kw_arg, args):
-        yield quote(arg_name)
-    if kw_arg == 'cmp' and \
-            (('key' in args) or (len(functions) > len(func_codes))):
+        yield get_typo_suggestion(quote(arg_name), kw_arg, arg_name)
+    if kw_arg == 'cmp' and (('key' in args) or (None in params)):
         yield CMP_ARG_REMOVED_MSG
 
 
-@register_suggestion_for(TypeError, re.UNEXPECTED_KEYWORDARG_RE)
-def suggest_unexpected_keywordarg(value, frame, groups):
+@register_context_suggestion_for(TypeError, re.UNEXPECTED_KEYWORDARG_RE)
+def suggest_unexpected_keywordarg(context, groups):
     """Get suggestions in case of UNEXPECTED_KEYWORDARG error."""
-    del value  # unused param
     func_name, kw_arg = groups
-    return suggest_unexpected_keywordarg_for_func(kw_arg, func_name, frame)
+    return suggest_unexpected_keywordarg_for_func(kw_arg, func_name, context)
 
 
-@register_suggestion_for(TypeError, re.UNEXPECTED_KEYWORDARG4_RE)
-def suggest_unexpected_keywordarg4(value, frame, groups):
+@register_context_suggestion_for(TypeError, re.UNEXPECTED_KEYWORDARG4_RE)
+def suggest_unexpected_keywordarg4(context, groups):
     """Get suggestions in case of UNEXPECTED_KEYWORDARG4 error."""
-    del value  # unused param
     kw_arg, func_name = groups
-    return suggest_unexpected_keywordarg_for_func(kw_arg, func_name, frame)
+    return suggest_unexpected_keywordarg_for_func(kw_arg, func_name, context)
 
 
 @register_suggestion_for(TypeError, re.UNEXPECTED_KEYWORDARG2_RE)
@@ -727,10 +1856,9 @@ def suggest_unexpected_keywordarg3(value, frame, groups):
     return []  # no implementation so far
 
 
-@register_suggestion_for(TypeError, re.NB_ARG_RE)
-def suggest_nb_arg(value, frame, groups):
+@register_context_suggestion_for(TypeError, re.NB_ARG_RE)
+def suggest_nb_arg(context, groups):
     """Get suggestions in case of NB ARGUMENT error."""
-    del value  # unused param
     func_name, expected, given = groups
     given_nb = int(given)
     beg, to, end = expected.partition(' to ')
@@ -748,14 +1876,14 @@ def suggest_nb_arg(value, frame, groups):
         expect_nb = 0
     else:
         expect_nb = int(expected)
-    objs = get_objects_in_frame(frame)
+    objs = context.get_objects()
     del expect_nb, given_nb, objs, func_name  # for later
     return
     yield
 
 
-@register_suggestion_for(TypeError, re.FUNC_TAKES_NO_KEYWORDARG_RE)
-def suggest_func_no_kw_arg(value, frame, groups):
+@register_context_suggestion_for(TypeError, re.FUNC_TAKES_NO_KEYWORDARG_RE)
+def suggest_func_no_kw_arg(context, groups):
     """Get suggestions for FUNC_TAKES_NO_KEYWORDARG_RE."""
     # C-Level functions don't have actual names for their arguments.
     # Therefore, trying to use them with keyword arguments leads to
@@ -772,9 +1900,8 @@ def suggest_func_no_kw_arg(value, frame, groups):
     # Unfortunately, introspection of builtin function is not possible as per
     # http://bugs.python.org/issue1748064 . Thus, the only thing we can look
     # for is if a function has no __code__ attribute.
-    del value  # unused param
     func_name, = groups
-    functions = get_func_by_name(func_name, frame)
+    functions = context.get_func_by_name(func_name)
     if any([not hasattr(f, '__code__') for f in functions]):
         yield NO_KEYWORD_ARG_MSG
 
@@ -807,12 +1934,11 @@ def suggest_outside_func_error(value, frame, groups):
         yield "'sys.exit([arg])'"
 
 
-@register_suggestion_for(SyntaxError, re.FUTURE_FEATURE_NOT_DEF_RE)
-def suggest_future_feature(value, frame, groups):
+@register_context_suggestion_for(SyntaxError, re.FUTURE_FEATURE_NOT_DEF_RE)
+def suggest_future_feature(context, groups):
     """Get suggestions in case of FUTURE_FEATURE_NOT_DEF error."""
-    del value  # unused param
     feature, = groups
-    return suggest_imported_name_as_typo(feature, '__future__', frame)
+    return suggest_imported_name_as_typo(feature, '__future__', context)
 
 
 @register_suggestion_for(SyntaxError, re.INVALID_COMP_RE)
@@ -822,16 +1948,49 @@ def suggest_invalid_comp(value, frame, groups):
     yield quote('!=')
 
 
-@register_suggestion_for(SyntaxError, re.NO_BINDING_NONLOCAL_RE)
-def suggest_no_binding_for_nonlocal(value, frame, groups):
+@register_context_suggestion_for(SyntaxError, re.NO_BINDING_NONLOCAL_RE)
+def suggest_no_binding_for_nonlocal(context, groups):
     """Get suggestions in case of NO BINDING FOR NONLOCAL."""
-    del value  # unused param
     name, = groups
-    objs = get_objects_in_frame(frame).get(name, [])
+    objs = context.get_objects().get(name, [])
     for _, scope in objs:
         if scope == 'global':
-            # TODO_ENCLOSING: suggest close matches for enclosing
             yield quote('global ' + name)
+    if not context.can_improve(get_typo_max_score(name)):
+        return
+    names = get_enclosing_names_from_source(context.value)
+    for match in get_close_matches(name, names):
+        yield get_typo_suggestion(quote('nonlocal ' + match), name, match)
+
+
+def get_enclosing_names_from_source(value):
+    """Get the names defined in the functions enclosing a SyntaxError.
+
+    The source is retrieved from the file (if any) and compiled again with
+    the faulty statement replaced by an expression on the same line so
+    that the code objects of the enclosing functions can be retrieved (the
+    innermost function being the deepest code object with that line).
+    """
+    import linecache  # only needed here
+    lines = linecache.getlines(value.filename or '')
+    lineno = value.lineno
+    if not lineno or lineno > len(lines):
+        return []
+    line = lines[lineno - 1]
+    col = line.find('nonlocal', max((value.offset or 1) - 1, 0))
+    if col < 0:
+        return []
+    lines = list(lines)
+    lines[lineno - 1] = line[:col] + 'pass;   ' + line[col + 8:]
+    try:
+        code = compile(''.join(lines), value.filename, 'exec')
+    except (SyntaxError, ValueError):
+        return []
+    import dis  # only needed here
+    path = get_code_path(code, lambda c: any(
+        l == lineno for _, l in dis.findlinestarts(c))) or []
+    return get_names_in_codes(
+        c for c in reversed(path[1:-1]) if c.co_flags & CO_OPTIMIZED)
 
 
 @register_suggestion_for(SyntaxError, re.INVALID_SYNTAX_RE)
@@ -855,23 +2014,22 @@ def suggest_invalid_syntax(value, frame, groups):
 
 
 # Functions related to MemoryError
-@register_suggestion_for(MemoryError, None)
-def get_memory_error_sugg(value, frame, groups):
+@register_context_suggestion_for(MemoryError, None)
+def get_memory_error_sugg(context, groups):
     """Get suggestions for MemoryError exception."""
-    del value, groups  # unused param
-    objs = get_objects_in_frame(frame)
+    del groups  # unused param
+    objs = context.get_objects()
     return itertools.chain.from_iterable(
         suggest_memory_friendly_equi(name, objs)
-        for name in frame.f_code.co_names)
+        for name in context.frame.f_code.co_names)
 
 
 # Functions related to OverflowError
-@register_suggestion_for(OverflowError, re.RESULT_TOO_MANY_ITEMS_RE)
-def suggest_too_many_items(value, frame, groups):
+@register_context_suggestion_for(OverflowError, re.RESULT_TOO_MANY_ITEMS_RE)
+def suggest_too_many_items(context, groups):
     """Suggest for TOO_MANY_ITEMS error."""
-    del value  # unused param
     func, = groups
-    objs = get_objects_in_frame(frame)
+    objs = context.get_objects()
     return suggest_memory_friendly_equi(func, objs)
 
 
@@ -910,7 +2068,6 @@ def get_io_os_error_sugg(value, frame, groups):
 
 def suggest_if_file_does_not_exist(value):
     """Get suggestions when a file does not exist."""
-    # TODO: Add fuzzy match
     filename = value.filename
     for func, name in (
             (os.path.expanduser, 'os.path.expanduser'),
@@ -918,6 +2075,120 @@ def suggest_if_file_does_not_exist(value):
         expanded = func(filename)
         if os.path.exists(expanded) and filename != expanded:
             yield quote(expanded) + " (calling " + name + ")"
+    for sugg in suggest_close_file_names(filename):
+        yield sugg
+
+
+class DirectoryListingCache(object):
+    """LRU cache for the names in directories.
+
+    Entries are keyed by the path of the directory and store its
+    modification time so that the listing is read again when the directory
+    is modified. They also expire after some time as modification times
+    may not be precise enough. Only the first MAX_NB_FILES_COUNTED names
+    are read, within DIR_SCAN_TIME_BUDGET seconds.
+    The lock is not held while directories are read.
+    """
+
+    def __init__(self, size, ttl):
+        """Init an empty DirectoryListingCache (size and ttl in seconds)."""
+        self.entries = OrderedDict()  # most recently used last
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """Get the number of entries in the cache."""
+        return len(self.entries)
+
+    def clear(self):
+        """Remove all entries (counters are kept)."""
+        with self.lock:
+            self.entries.clear()
+
+    def get(self, path):
+        """Get the names in a directory (OSError if it can not be read)."""
+        key = os.path.abspath(path)
+        mtime = os.stat(key).st_mtime
+        now = timeit.default_timer()
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[0] == mtime and \
+                    now < entry[1] + self.ttl:
+                self.hits += 1
+            else:
+                self.misses += 1
+                entry = None
+        if entry is None:
+            entry = (mtime, now, self.read(key))
+        with self.lock:
+            self.entries.pop(key, None)
+            while self.entries and len(self.entries) >= self.size:
+                self.entries.popitem(last=False)
+            if self.size > 0:
+                self.entries[key] = entry
+        return entry[2]
+
+    @staticmethod
+    def read(path):
+        """Read the names in a directory (within the limits)."""
+        deadline = timeit.default_timer() + DIR_SCAN_TIME_BUDGET
+        names = []
+        for name in iter_directory_names(path):
+            if len(names) >= MAX_NB_FILES_COUNTED or \
+                    timeit.default_timer() > deadline:
+                break
+            names.append(name)
+        return names
+
+
+# To be used in `suggest_close_file_names`.
+DIRECTORY_LISTINGS = DirectoryListingCache(
+    DIR_LISTING_CACHE_SIZE, DIR_LISTING_TTL)
+
+
+def split_missing_path(path):
+    """Split a path into its deepest existing directory and the rest.
+
+    The rest is returned as a list of components, the first one being
+    missing from the directory. None is returned if no directory exists.
+    """
+    components = []
+    head = path
+    while True:
+        head, tail = os.path.split(head)
+        if tail:
+            components.insert(0, tail)
+        if os.path.isdir(head or os.curdir):
+            return head, components
+        if not tail:
+            return None
+
+
+def suggest_close_file_names(filename):
+    """Suggest paths where the first missing component is a typo.
+
+    The component is matched against the names in its parent directory (the
+    deepest existing directory in the path). When components follow, the
+    path suggested must exist.
+    """
+    if not isinstance(filename, str):
+        return
+    split = split_missing_path(filename)
+    if split is None or not split[1]:
+        return
+    directory, components = split
+    missing, rest = components[0], components[1:]
+    try:
+        names = DIRECTORY_LISTINGS.get(directory or os.curdir)
+    except OSError:
+        return
+    for name in get_close_matches(missing, names):
+        path = os.path.join(directory, name, *rest)
+        if not rest or os.path.exists(path):
+            yield get_typo_suggestion(quote(path), missing, name)
 
 
 def suggest_if_file_is_not_dir(value):
@@ -926,28 +2197,261 @@ def suggest_if_file_is_not_dir(value):
     yield quote(os.path.dirname(filename)) + " (calling os.path.dirname)"
 
 
+def iter_directory_names(path):
+    """Yield the names of the entries in a directory.
+
+    They are read one at a time with os.scandir when it is available and
+    all at once with os.listdir otherwise (Python 2).
+    """
+    scandir = getattr(os, 'scandir', None)
+    if scandir is None:
+        for name in os.listdir(path):
+            yield name
+        return
+    entries = scandir(path)
+    try:
+        for entry in entries:
+            yield entry.name
+    finally:
+        close = getattr(entries, 'close', None)  # Python 3.6+
+        if close is not None:
+            close()
+
+
+def scan_directory(path, nb_names, max_entries, time_budget):
+    """Get the number of entries in a directory and the first names.
+
+    Entries are read one at a time (the listing is never stored nor
+    sorted as a whole) and only the `nb_names` smallest names are kept (in
+    sorted order). Reading stops if there are more than `max_entries`
+    entries or if it takes more than `time_budget` seconds: the directory
+    is then known to have more entries than the number returned.
+    Result is returned as (number of entries, complete, names).
+    """
+    deadline = timeit.default_timer() + time_budget
+    names = []
+    count = 0
+    for name in iter_directory_names(path):
+        if count >= max_entries or timeit.default_timer() > deadline:
+            return count, False, names
+        count += 1
+        if len(names) < nb_names or (names and name < names[-1]):
+            bisect.insort(names, name)
+            del names[nb_names:]
+    return count, True, names
+
+
 def suggest_if_file_is_dir(value):
     """Get suggestions when a file is a dir and should not."""
     filename = value.filename
-    listdir = sorted(os.listdir(filename))
-    if listdir:
-        trunc_l = listdir[:MAX_NB_FILES]
-        truncated = listdir != trunc_l
-        filelist = [quote(f) for f in trunc_l] + (["etc"] if truncated else [])
-        yield "any of the {0} files in directory ({1})".format(
-            len(listdir), ", ".join(filelist))
-    else:
+    nb_files, complete, names = scan_directory(
+        filename, MAX_NB_FILES, MAX_NB_FILES_COUNTED, DIR_SCAN_TIME_BUDGET)
+    if nb_files:
+        truncated = nb_files > len(names) or not complete
+        filelist = [quote(f) for f in names] + (["etc"] if truncated else [])
+        yield "any of the {0}{1} files in directory ({2})".format(
+            "" if complete else "more than ", nb_files, ", ".join(filelist))
+    elif complete:
         yield "to add content to {0} first".format(filename)
+    # Otherwise, nothing could be read within the limits
 
 
-def get_suggestions_for_exception(value, traceback):
-    """Get suggestions for an exception."""
-    frame = get_last_frame(traceback)
-    return itertools.chain.from_iterable(
-            func(value, frame)
-            for error_type, functions in SUGGESTION_FUNCTIONS.items()
-            if isinstance(value, error_type)
-            for func in functions)
+def get_suggestion_functions(error_type):
+    """Get the suggestion functions for an exception type (cached).
+
+    Functions registered for the classes of the MRO of the type are
+    retrieved in the MRO order. Functions registered for a tuple of types
+    are retrieved only once.
+    This does not take any lock: the cache is read before the registry so
+    that results computed from an outdated registry are stored in a cache
+    which has already been replaced.
+    """
+    functions_by_type = _FUNCTIONS_BY_TYPE
+    functions = functions_by_type.get(error_type)
+    if functions is None:
+        functions = []
+        keys = []
+        registry = SUGGESTION_FUNCTIONS.copy()
+        for klass in error_type.__mro__:
+            for key, key_functions in registry.items():
+                types = key if isinstance(key, tuple) else (key,)
+                if klass in types and key not in keys:
+                    keys.append(key)
+                    functions.extend(key_functions)
+        functions_by_type[error_type] = functions
+    return functions
+
+
+def get_suggestions_for_exception(value, traceback, time_budget=None):
+    """Get suggestions for an exception.
+
+    If a time budget (in seconds) is provided or set in SETTINGS, only the
+    suggestions found before it is exhausted are returned.
+    """
+    return get_suggestions_for_frame(
+        value, get_last_frame(traceback), time_budget,
+        get_caller_frames(traceback))
+
+
+def get_suggestions_for_frame(value, frame, time_budget=None,
+                              caller_frames=()):
+    """Get suggestions for an exception from its last frame.
+
+    See get_suggestions_for_exception and AnalysisContext.
+    """
+    if time_budget is None:
+        time_budget = SETTINGS['time_budget']
+    context = AnalysisContext(value, frame, time_budget, caller_frames)
+    functions = get_suggestion_functions(type(value))
+    top_k = SETTINGS['top_k']
+    if top_k is not None:
+        return get_top_suggestions(functions, context, top_k)
+    suggestions = itertools.chain.from_iterable(
+            get_function_suggestions(func, context) for func in functions)
+    if time_budget is None:
+        return suggestions
+    return get_suggestions_within_budget(suggestions, context)
+
+
+def get_function_suggestions(registered_function, context):
+    """Get the suggestions from a registered function (maybe instrumented)."""
+    if SETTINGS['instrumentation']:
+        return get_instrumented_suggestions(registered_function, context)
+    return registered_function(context)
+
+
+def get_top_suggestions(functions, context, k):
+    """Yield the k best suggestions from registered functions (ranked).
+
+    Suggestions are ranked by score (see ScoredSuggestion) and then by the
+    order they are found in. A bounded heap keeps the best ones: once it is
+    full, the lowest score kept is the score to beat (see
+    AnalysisContext.can_improve) so that the sources of suggestions which
+    can not beat it are skipped (typos can not get the maximum score, see
+    get_typo_max_score). Once the heap is full of suggestions with the
+    maximum score, the remaining functions (and the generators they return)
+    are not consumed anymore.
+    If the time budget is exhausted, the best suggestions found so far are
+    yielded.
+    """
+    if k <= 0:
+        return
+    heap = []  # (score, -rank, suggestion)
+    rank = itertools.count()
+    try:
+        for func in functions:
+            if len(heap) == k and heap[0][0] >= MAX_SCORE:
+                break
+            suggestions = with_matcher_deadline(
+                get_function_suggestions(func, context), context)
+            for sugg in suggestions:
+                entry = (getattr(sugg, 'score', MAX_SCORE), -next(rank), sugg)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry[0] > heap[0][0]:
+                    heapq.heapreplace(heap, entry)
+                if len(heap) == k:
+                    context.min_score = heap[0][0]
+                context.check_deadline()
+                if len(heap) == k and heap[0][0] >= MAX_SCORE:
+                    break
+            suggestions.close()
+    except TimeBudgetExceeded:
+        with _STATS_LOCK:
+            STATS['truncated'] += 1
+    finally:
+        context.min_score = None
+    for _, _, sugg in sorted(heap, reverse=True):
+        yield sugg
+
+
+def get_instrumented_suggestions(registered_function, context):
+    """Yield the suggestions from a registered function and record stats.
+
+    Matching the error message relies on the regexps being matched all at
+    once so the time for it is mostly spent on the first function called.
+    """
+    suggester = registered_function.suggester
+    regex = registered_function.regex
+    start = timeit.default_timer()
+    match = None if regex is None else context.get_matches().get(regex)
+    match_time = timeit.default_timer() - start
+    matched = regex is None or bool(match)
+    nb_suggs, sugg_time, start = 0, 0.0, None
+    try:
+        if matched:
+            start = timeit.default_timer()
+            for sugg in suggester(context, [] if match is None
+                                  else match.groups()):
+                sugg_time += timeit.default_timer() - start
+                nb_suggs, start = nb_suggs + 1, None
+                yield sugg
+                start = timeit.default_timer()
+    finally:
+        if start is not None:
+            sugg_time += timeit.default_timer() - start
+        record_suggester_call(SuggesterRecord(
+            '{0}.{1}'.format(suggester.__module__, suggester.__name__),
+            type(context.value).__name__, matched, match_time, sugg_time,
+            nb_suggs))
+
+
+def with_matcher_deadline(suggestions, context):
+    """Yield suggestions with the matchers checking the deadline meanwhile.
+
+    The deadline of the context is checked by the fuzzy matching (see
+    didyoumean_fuzzy.set_deadline_check) only while suggestions are
+    computed so that matchers used by the caller in between are not
+    impacted. The underlying generator is closed when this one is.
+    """
+    suggestions = iter(suggestions)
+    try:
+        while True:
+            previous = fuzzy.set_deadline_check(context.check_deadline)
+            try:
+                sugg = next(suggestions)
+            except StopIteration:
+                return
+            finally:
+                fuzzy.set_deadline_check(previous)
+            yield sugg
+    finally:
+        close = getattr(suggestions, 'close', None)
+        if close is not None:
+            close()
+
+
+def get_suggestions_within_budget(suggestions, context):
+    """Yield suggestions until the time budget of the context is exhausted.
+
+    Stopped analyses are counted in STATS.
+    """
+    try:
+        for sugg in with_matcher_deadline(suggestions, context):
+            yield sugg
+            context.check_deadline()
+    except TimeBudgetExceeded:
+        with _STATS_LOCK:
+            STATS['truncated'] += 1
+
+
+def warm_up():
+    """Precompute the data reused from one analysis to another.
+
+    This covers the modules imported when first needed, the compiled
+    regexps, the index of types, the index of symbols from the standard
+    modules and the processes of the 'process' matcher so that they do not
+    need to be computed when an exception is handled (it can be called
+    from a background thread at start-up).
+    """
+    for module_name in ('difflib', 'inspect'):
+        __import__(module_name)
+    re.DISPATCHER.process_pending()
+    for pattern in re.DISPATCHER.patterns:
+        re.compile(pattern)
+    TYPE_INDEX.get(object.__name__)
+    symbols.get_symbol_index(STAND_MODULES)
+    fuzzy.warm_up_matcher()
 
 
 def add_string_to_exception(value, string):
@@ -978,6 +2482,109 @@ def add_string_to_exception(value, string):
                 setattr(value, attr, attrval + string)
 
 
+class FrameSnapshot(object):
+    """Copy of the information from a frame needed to get suggestions.
+
+    Local variables are copied (unless they are the global variables) so
+    that suggestions computed later are not impacted by changes in the
+    frame. Caller frames are not kept: only their code objects are, for
+    nested functions (see get_enclosing_codes).
+    """
+
+    def __init__(self, frame):
+        """Init a FrameSnapshot from a frame."""
+        self.f_code = frame.f_code
+        self.caller_codes = list(get_caller_codes(frame)) \
+            if frame.f_code.co_flags & CO_NESTED else []
+        self.f_globals = frame.f_globals
+        self.f_builtins = frame.f_builtins
+        f_locals = frame.f_locals
+        self.f_locals = f_locals if f_locals is self.f_globals \
+            else dict(f_locals)
+
+
+class LazySuggestions(object):
+    """Suggestion string for an exception, computed when first needed."""
+
+    def __init__(self, value, frame, time_budget=None, caller_frames=()):
+        """Init LazySuggestions for an exception and its (last) frame."""
+        self.value = value
+        self.frame = None if frame is None else FrameSnapshot(frame)
+        self.caller_frames = [FrameSnapshot(f) for f in caller_frames]
+        self.time_budget = time_budget
+        self.string = None
+        self.lock = threading.RLock()
+
+    def get_string(self):
+        """Get the suggestion string (computed only once).
+
+        Other threads wait for the string being computed.
+        """
+        with self.lock:
+            if self.string is None:
+                # Prevent infinite recursion if the exception gets converted
+                # to string while suggestions are computed
+                self.string = ''
+                self.string = get_suggestion_string(
+                    get_suggestions_for_frame(
+                        self.value, self.frame, self.time_budget,
+                        self.caller_frames))
+                # References are not needed anymore
+                self.value = self.frame = self.caller_frames = None
+            return self.string
+
+
+class LazySuggestionString(str):
+    """String getting the suggestions appended when converted to string.
+
+    The underlying value (used for comparisons, hashing, etc) is the
+    original string.
+    """
+
+    def __new__(cls, string, suggestions):
+        """Create a LazySuggestionString from a string and LazySuggestions."""
+        lazy_string = str.__new__(cls, string)
+        lazy_string.suggestions = suggestions
+        return lazy_string
+
+    def __str__(self):
+        """Get the string with the suggestions."""
+        return str.__str__(self) + self.suggestions.get_string()
+
+    def __repr__(self):
+        """Get the representation of the string with the suggestions."""
+        return repr(str(self))
+
+    def __reduce__(self):
+        """Pickle as a normal string (with the suggestions)."""
+        return (str, (str(self),))
+
+
+def add_lazy_suggestions_to_exception(value, traceback, time_budget=None):
+    """Add suggestions to an exception, computed only when displayed.
+
+    Strings from the exception (see add_string_to_exception) are replaced
+    by LazySuggestionString objects sharing the same LazySuggestions. If
+    there is no such string, suggestions are added immediately.
+    """
+    suggestions = LazySuggestions(
+        value, get_last_frame(traceback), time_budget,
+        get_caller_frames(traceback))
+    lst_args = list(value.args)
+    for i, arg in enumerate(lst_args):
+        if isinstance(arg, str):
+            lst_args[i] = LazySuggestionString(arg, suggestions)
+            break
+    else:
+        add_string_to_exception(value, suggestions.get_string())
+        return
+    value.args = tuple(lst_args)
+    for attr in ['msg', 'strerror', 'reason']:
+        attrval = getattr(value, attr, None)
+        if isinstance(attrval, str):
+            setattr(value, attr, LazySuggestionString(attrval, suggestions))
+
+
 def get_last_frame(traceback):
     """Extract last frame from a traceback."""
     # In some rare case, the given traceback might be None
@@ -988,6 +2595,40 @@ def get_last_frame(traceback):
     return traceback.tb_frame
 
 
+def get_source_path(filename):
+    """Get the normalised path of the source of a module."""
+    root, ext = os.path.splitext(filename)
+    if ext in ('.pyc', '.pyo'):
+        filename = root + '.py'
+    return os.path.normcase(os.path.abspath(filename))
+
+
+def get_ignored_caller_paths():
+    """Get the paths of the sources of the IGNORED_CALLER_MODULES."""
+    directory = os.path.dirname(get_source_path(__file__))
+    return set(os.path.join(directory, name + '.py')
+               for name in IGNORED_CALLER_MODULES)
+
+
+def get_caller_frames(traceback):
+    """Get the caller frames from a traceback (the closest first).
+
+    These are the frames before the last one (at most MAX_CALLER_FRAMES,
+    ignoring the ones from IGNORED_CALLER_MODULES), only retrieved if
+    SETTINGS['all_frames'] is set.
+    """
+    frames = []
+    if SETTINGS['all_frames']:
+        ignored = get_ignored_caller_paths()
+        while traceback is not None and traceback.tb_next is not None:
+            frame = traceback.tb_frame
+            path = get_source_path(frame.f_code.co_filename)
+            if path not in ignored:
+                frames.append(frame)
+            traceback = traceback.tb_next
+    return frames[::-1][:MAX_CALLER_FRAMES]
+
+
 def print_frame_information(frame):
     """Print information about a frame and the data one can get from it."""
     # For debug purposes
@@ -1014,15 +2655,25 @@ def print_frame_information(frame):
     print("-----")
 
 
-def add_suggestions_to_exception(type_, value, traceback):
+def add_suggestions_to_exception(
+        type_, value, traceback, time_budget=None, lazy=None):
     """Add suggestion to an exception.
 
-    Arguments are such as provided by sys.exc_info().
+    Arguments are such as provided by sys.exc_info(), an optional time
+    budget (see get_suggestions_for_exception) and whether suggestions are
+    to be computed lazily (see add_lazy_suggestions_to_exception), the
+    value from SETTINGS being used if not provided.
     """
     assert isinstance(value, type_)
+    if lazy is None:
+        lazy = SETTINGS['lazy']
+    if lazy:
+        add_lazy_suggestions_to_exception(value, traceback, time_budget)
+        return
     add_string_to_exception(
         value,
         get_suggestion_string(
             get_suggestions_for_exception(
                 value,
-                traceback)))
+                traceback,
+                time_budget)))
@@ -4,13 +4,41 @@ from didyoumean_internal import quote, get_suggestion_string,\
     add_string_to_exception, get_func_by_name,\
     get_objects_in_frame, get_subclasses, get_types_for_str,\
     get_types_for_str_using_inheritance,\
-    get_types_for_str_using_names
+    get_types_for_str_using_names, TypeIndex, NamespaceView,\
+    AnalysisContext, get_suggestions_for_exception,\
+    register_suggestion_for, register_context_suggestion_for,\
+    unregister_suggestions_for,\
+    get_suggestion_functions, STATS, SETTINGS,\
+    configure, TimeBudgetExceeded, CallableIndex, get_callable_index,\
+    resolve_qualified_name, add_suggestions_to_exception,\
+    LazySuggestionString, get_suggester_stats, SUGGESTER_SINKS, warm_up,\
+    TYPE_INDEX, AttributeSuggestionCache, ATTRIBUTE_SUGGESTIONS,\
+    ScoredSuggestion, get_top_suggestions, get_typo_suggestion,\
+    get_typo_max_score, get_suggestions_if_improving, scan_directory,\
+    suggest_if_file_is_dir, DirectoryListingCache, split_missing_path,\
+    get_enclosing_names, get_enclosing_names_from_source,\
+    get_keyword_parameters, get_keyword_parameters_from_signature
 import didyoumean_common_tests as common
+import didyoumean_fuzzy as fuzzy
+import didyoumean_internal as internal
+import didyoumean_re as re
 from didyoumean_common_tests import unittest_module,\
     CommonTestOldStyleClass2,\
     CommonTestNewStyleClass2  # to have these 2 in defined names
+from shutil import rmtree
+import errno
+import functools
 import itertools
+import gc
+import inspect
+import os
+import pickle
 import sys
+import tempfile
+import timeit
+import traceback
+from multiprocessing.pool import ThreadPool
+import weakref
 
 
 OLD_CLASS_SUPPORT = sys.version_info >= (3, 0)
@@ -194,6 +222,95 @@ class GetObjectInFrameTests(unittest_module.TestCase):
         self.name_corresponds_to('nested_func', [(nested_func, 'local')])
 
 
+class NamespaceViewTests(unittest_module.TestCase):
+    """Class for tests related to NamespaceView."""
+
+    def test_lookup(self):
+        """Names are looked up in all scopes, in order."""
+        view = NamespaceView([({'a': 1, 'b': 2}, 'local'),
+                              ({'a': 3, 'c': 4}, 'global')])
+        self.assertEqual(view['a'], [(1, 'local'), (3, 'global')])
+        self.assertEqual(view['c'], [(4, 'global')])
+        self.assertEqual(view.get('d', []), [])
+        self.assertRaises(KeyError, view.__getitem__, 'd')
+        self.assertTrue('b' in view)
+        self.assertFalse('d' in view)
+
+    def test_keys(self):
+        """Names are provided only once."""
+        view = NamespaceView([({'a': 1, 'b': 2}, 'local'),
+                              ({'a': 3, 'c': 4}, 'global')])
+        self.assertEqual(sorted(view), ['a', 'b', 'c'])
+        self.assertEqual(sorted(view.keys()), ['a', 'b', 'c'])
+        self.assertEqual(len(view), 3)
+
+    def test_view_is_lazy(self):
+        """Changes in the underlying dicts are visible."""
+        local = dict()
+        view = NamespaceView([(local, 'local')])
+        self.assertFalse('a' in view)
+        local['a'] = 1
+        self.assertEqual(view['a'], [(1, 'local')])
+
+
+def make_closure():
+    """Get a function returning its own frame, defined in a function."""
+    foo = 1
+
+    def bar(baz):
+        return sys._getframe(), foo
+    return bar
+
+
+class EnclosingNamesTests(unittest_module.TestCase):
+    """Class for tests related to the names from the enclosing functions."""
+
+    def test_names_of_caller(self):
+        """Names come from the enclosing function calling the function."""
+        def outer(arg):
+            foo = 2
+
+            def inner(baz):
+                return get_enclosing_names(sys._getframe())
+            return inner(foo)
+        self.assertEqual(outer(0), ['arg', 'foo', 'inner', 'self', 'outer'])
+
+    @unittest_module.skipIf(not hasattr(make_closure.__code__,
+                                        'co_qualname'),
+                            "Qualified names of code objects not available")
+    def test_closure_called_later(self):
+        """Names come from the function found in the globals."""
+        frame, _ = make_closure()(0)
+        self.assertEqual(get_enclosing_names(frame), ['foo', 'bar'])
+
+    def test_not_nested(self):
+        """No names for functions not defined in a function."""
+        self.assertEqual(get_enclosing_names(sys._getframe()), [])
+        self.assertEqual(get_enclosing_names(None), [])
+
+    @unittest_module.skipIf(sys.version_info < (3, 0),
+                            "nonlocal is not a keyword in Python 2")
+    def test_names_from_source(self):
+        """Names come from the source of the file for syntax errors."""
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'source.py')
+            with open(filename, 'w') as source:
+                source.write('def func(foo):\n\tclass A:\n\t\tbar = 1\n'
+                             '\t\tdef nested(self): nonlocal foob\n')
+            try:
+                with open(filename) as source:
+                    compile(source.read(), filename, 'exec')
+            except SyntaxError:
+                value = sys.exc_info()[1]
+            self.assertEqual(get_enclosing_names_from_source(value),
+                             ['foo', 'A'])
+            value.filename = '<string>'
+            self.assertEqual(get_enclosing_names_from_source(value), [])
+        finally:
+            rmtree(directory)
+
+
 class OldStyleBaseClass:
     """Dummy class for testing purposes."""
 
@@ -347,6 +464,75 @@ class GetTypesForStrTests(unittest_module.TestCase):
         self.assertEqual(types3, expect_with_inherit)
 
 
+class TypeIndexTests(unittest_module.TestCase):
+    """Test TypeIndex."""
+
+    def test_new_class_with_same_name(self):
+        """Classes defined after the index is built are found."""
+        index = TypeIndex()
+        name = 'TypeIndexTestsDummyClass'
+        self.assertEqual(index.get(name), set())
+        klass1 = type(name, (object,), {})
+        self.assertEqual(index.get(name), set([klass1]))
+        klass2 = type(name, (object,), {})
+        self.assertEqual(index.get(name), set([klass1, klass2]))
+        klass3 = type(name, (klass2,), {})
+        self.assertEqual(index.get(name), set([klass1, klass2, klass3]))
+
+    def test_new_subclass_of_other_class(self):
+        """Classes with a known name derived from other bases are found.
+
+        This requires an update of the whole index (when a name is not
+        found).
+        """
+        index = TypeIndex()
+        name = 'TypeIndexTestsSubclass'
+        base = type('TypeIndexTestsBase', (object,), {})
+        derived = type('TypeIndexTestsDerived', (base,), {})
+        klass1 = type(name, (object,), {})
+        self.assertEqual(index.get(name), set([klass1]))
+        klass2 = type(name, (derived,), {})
+        self.assertEqual(index.get('TypeIndexTestsUnknownClass'), set())
+        self.assertEqual(index.get(name), set([klass1, klass2]))
+
+    def test_lookup_is_incremental(self):
+        """Known names only lead to a visit of the new subclasses."""
+        index = TypeIndex()
+        name = 'TypeIndexTestsIncremental'
+        base = type('TypeIndexTestsIncrementalBase', (object,), {})
+        klass1 = type(name, (base,), {})
+        self.assertEqual(index.get(name), set([klass1]))
+        visited = []
+        update = index.update
+        index.update = lambda roots, new_only: visited.append(
+            (roots, new_only)) or update(roots, new_only)
+        self.assertEqual(index.get(name), set([klass1]))
+        self.assertEqual(visited, [])
+        klass2 = type(name, (base,), {})
+        self.assertEqual(index.get(name), set([klass1, klass2]))
+        self.assertEqual(visited, [([base], True)])
+
+    def test_renamed_class(self):
+        """Classes renamed are not found with their old name."""
+        index = TypeIndex()
+        name, name2 = 'TypeIndexTestsRenamedClass', 'TypeIndexTestsNewName'
+        klass = type(name, (object,), {})
+        self.assertEqual(index.get(name), set([klass]))
+        klass.__name__ = name2
+        self.assertEqual(index.get(name), set())
+        self.assertEqual(index.get(name2), set([klass]))
+
+    def test_classes_are_not_kept_alive(self):
+        """Index does not prevent classes from being garbage collected."""
+        index = TypeIndex()
+        name = 'TypeIndexTestsShortLivedClass'
+        klass = type(name, (object,), {})
+        self.assertEqual(index.get(name), set([klass]))
+        del klass
+        gc.collect()
+        self.assertEqual(index.lookup(name), set())
+
+
 class GetFuncByNameTests(unittest_module.TestCase):
     """Test get_func_by_name."""
 
@@ -433,6 +619,1041 @@ class GetFuncByNameTests(unittest_module.TestCase):
         self.assertEqual(self.get_func_by_name('dkalskjdas'), [])
 
 
+class AnalysisContextTests(unittest_module.TestCase):
+    """Test AnalysisContext and the registration of suggestion functions."""
+
+    def test_memoize(self):
+        """Function is called only once for a given key."""
+        context = AnalysisContext(None, sys._getframe())
+        calls = []
+
+        def func(arg):
+            calls.append(arg)
+            return [arg]
+        res = context.memoize('key', func, 1)
+        self.assertEqual(res, [1])
+        self.assertTrue(context.memoize('key', func, 2) is res)
+        self.assertEqual(context.memoize('other_key', func, 3), [3])
+        self.assertEqual(calls, [1, 3])
+
+    def test_derived_facts(self):
+        """Derived facts are correct and computed only once."""
+        local_var = 42
+        context = AnalysisContext(None, sys._getframe())
+        objs = context.get_objects()
+        self.assertTrue(objs is context.get_objects())
+        self.assertEqual(objs['local_var'][0].obj, local_var)
+        self.assertEqual(context.get_types_for_str('int'), set([int]))
+        attributes = context.get_type_attributes('int')
+        self.assertTrue('real' in attributes)
+        self.assertTrue(attributes is context.get_type_attributes('int'))
+        self.assertTrue(context.import_module('math') is sys.modules['math'])
+        self.assertTrue('pi' in context.get_module_attributes('math'))
+        self.assertEqual(context.get_func_by_name('dkalskjdas'), [])
+
+    def test_matched_patterns(self):
+        """Names of the regexps matching the error message are available."""
+        context = AnalysisContext(
+            TypeError("'int' object is not callable"), None)
+        self.assertEqual(context.get_matched_patterns(), ['NOT_CALLABLE_RE'])
+        self.assertEqual(
+            context.get_matches()[re.NOT_CALLABLE_RE].groups(), ('int',))
+
+    def test_registration(self):
+        """Suggestion functions share the context for an exception."""
+        class CustomError(Exception):
+            pass
+        contexts = []
+
+        @register_context_suggestion_for(CustomError, None)
+        def context_func(context, groups):
+            contexts.append(context)
+            yield 'context ' + str(groups)
+
+        @register_context_suggestion_for(CustomError, r"^(\w+) message$")
+        def context_func2(context, groups):
+            contexts.append(context)
+            yield 'context2 ' + str(groups)
+
+        @register_suggestion_for(CustomError, r"^(\w+) message$")
+        def legacy_func(value, frame, groups):
+            yield 'legacy ' + str((value is exc, frame is None, groups))
+
+        try:
+            exc = CustomError('custom message')
+            self.assertEqual(
+                list(get_suggestions_for_exception(exc, None)),
+                ['context []', "context2 ('custom',)",
+                 "legacy (True, True, ('custom',))"])
+            self.assertEqual(len(contexts), 2)
+            self.assertTrue(contexts[0] is contexts[1])
+            self.assertTrue(contexts[0].value is exc)
+            self.assertEqual(contexts[0].get_matched_patterns(),
+                             [r"^(\w+) message$"])
+            exc = CustomError('other error')
+            self.assertEqual(
+                list(get_suggestions_for_exception(exc, None)),
+                ['context []'])
+        finally:
+            unregister_suggestions_for(CustomError)
+            re.DISPATCHER.remove(r"^(\w+) message$")
+
+    def test_time_budget(self):
+        """Suggestions are computed until the time budget is exhausted."""
+        class CustomError(Exception):
+            pass
+
+        @register_context_suggestion_for(CustomError, None)
+        def context_func(context, groups):
+            yield 'a'
+            yield 'b'
+
+        @register_context_suggestion_for(CustomError, None)
+        def context_func2(context, groups):
+            yield 'c'
+
+        try:
+            exc = CustomError('custom message')
+            truncated = STATS['truncated']
+            self.assertEqual(
+                list(get_suggestions_for_exception(exc, None)),
+                ['a', 'b', 'c'])
+            self.assertEqual(
+                list(get_suggestions_for_exception(exc, None, 10)),
+                ['a', 'b', 'c'])
+            self.assertEqual(STATS['truncated'], truncated)
+            self.assertEqual(
+                list(get_suggestions_for_exception(exc, None, -1)), ['a'])
+            self.assertEqual(STATS['truncated'], truncated + 1)
+            previous = configure(time_budget=-1)
+            try:
+                self.assertEqual(
+                    list(get_suggestions_for_exception(exc, None)), ['a'])
+            finally:
+                configure(**previous)
+            self.assertEqual(STATS['truncated'], truncated + 2)
+        finally:
+            unregister_suggestions_for(CustomError)
+
+    def test_time_budget_in_computation(self):
+        """Long computations are stopped when the budget is exhausted."""
+        context = AnalysisContext(None, sys._getframe(), -1)
+        self.assertRaises(TimeBudgetExceeded, context.get_objects)
+        self.assertRaises(TimeBudgetExceeded, get_func_by_name,
+                          'dkalskjdas', sys._getframe(),
+                          context.check_deadline)
+        context = AnalysisContext(None, sys._getframe(), 10)
+        context.check_deadline()
+        self.assertEqual(context.get_func_by_name('dkalskjdas'), [])
+
+    def test_time_budget_in_matching(self):
+        """Fuzzy matching is stopped when the budget is exhausted."""
+        namespace = dict(('variable_name_{0}'.format(i), i)
+                         for i in range(20000))
+        code = compile('variable_nam_1234', '<string>', 'exec')
+        try:
+            exec(code, namespace)
+        except NameError:
+            exc, traceback = sys.exc_info()[1:]
+        truncated = STATS['truncated']
+        start = timeit.default_timer()
+        self.assertEqual(
+            list(get_suggestions_for_exception(exc, traceback, 0.01)), [])
+        self.assertTrue(timeit.default_timer() - start < 1.0)
+        self.assertEqual(STATS['truncated'], truncated + 1)
+
+    def test_configure(self):
+        """Settings can be changed and unknown settings are rejected."""
+        previous = configure(time_budget=0.5)
+        try:
+            self.assertEqual(previous, {'time_budget': None})
+            self.assertEqual(SETTINGS['time_budget'], 0.5)
+            self.assertRaises(TypeError, configure, foo=1)
+        finally:
+            configure(**previous)
+        self.assertEqual(SETTINGS['time_budget'], None)
+
+    def test_instrumentation(self):
+        """Statistics are recorded for each function when enabled."""
+        class CustomError(Exception):
+            pass
+
+        @register_context_suggestion_for(CustomError, None)
+        def context_func(context, groups):
+            yield 'a'
+            yield 'b'
+
+        @register_context_suggestion_for(CustomError, r"^no match$")
+        def context_func2(context, groups):
+            yield 'c'
+
+        @register_suggestion_for(CustomError, r"^(instrumented) message$")
+        def func(value, frame, groups):
+            yield groups[0]
+
+        names = ['{0}.{1}'.format(__name__, f.__name__)
+                 for f in (context_func, context_func2, func)]
+        records = []
+        exc = CustomError('instrumented message')
+        get_suggester_stats(True)
+        try:
+            self.assertEqual(
+                list(get_suggestions_for_exception(exc, None)),
+                ['a', 'b', 'instrumented'])
+            self.assertEqual(get_suggester_stats(), {})
+            previous = configure(instrumentation=True)
+            SUGGESTER_SINKS.append(records.append)
+            try:
+                for _ in range(2):
+                    self.assertEqual(
+                        list(get_suggestions_for_exception(exc, None)),
+                        ['a', 'b', 'instrumented'])
+            finally:
+                configure(**previous)
+                SUGGESTER_SINKS.remove(records.append)
+            self.assertEqual(
+                [(r.name, r.error_type, r.matched, r.suggestions)
+                 for r in records],
+                2 * [(names[0], 'CustomError', True, 2),
+                     (names[1], 'CustomError', False, 0),
+                     (names[2], 'CustomError', True, 1)])
+            stats = get_suggester_stats(True)
+            self.assertEqual(sorted(stats), sorted(names))
+            for name, calls, matches, suggs in zip(
+                    names, (2, 2, 2), (2, 0, 2), (4, 0, 2)):
+                self.assertEqual(stats[name]['calls'], calls)
+                self.assertEqual(stats[name]['matches'], matches)
+                self.assertEqual(stats[name]['match_rate'],
+                                 float(matches) / calls)
+                self.assertEqual(stats[name]['suggestions'], suggs)
+                self.assertTrue(stats[name]['match_time'] >= 0)
+                self.assertTrue(stats[name]['suggestion_time'] >= 0)
+            self.assertEqual(get_suggester_stats(), {})
+        finally:
+            unregister_suggestions_for(CustomError)
+            re.DISPATCHER.remove(r"^no match$")
+            re.DISPATCHER.remove(r"^(instrumented) message$")
+
+    def test_failing_sink(self):
+        """An error in a sink does not replace the suggestions."""
+        class CustomError(Exception):
+            pass
+
+        @register_suggestion_for(CustomError, None)
+        def func(value, frame, groups):
+            yield 'suggestion'
+
+        def sink(record):
+            raise ValueError(record)
+
+        exc = CustomError('message')
+        previous = configure(instrumentation=True)
+        SUGGESTER_SINKS.append(sink)
+        try:
+            self.assertEqual(
+                list(get_suggestions_for_exception(exc, None)),
+                ['suggestion'])
+        finally:
+            configure(**previous)
+            SUGGESTER_SINKS.remove(sink)
+            unregister_suggestions_for(CustomError)
+            get_suggester_stats(True)
+
+    def test_top_suggestions(self):
+        """The best suggestions from all the functions are kept."""
+        class CustomError(Exception):
+            pass
+
+        @register_context_suggestion_for(CustomError, None)
+        def context_func(context, groups):
+            yield 'unscored'
+            yield ScoredSuggestion('low', 0.2)
+
+        @register_context_suggestion_for(CustomError, None)
+        def context_func2(context, groups):
+            yield ScoredSuggestion('high', 0.9)
+            yield ScoredSuggestion('medium', 0.5)
+
+        exc = CustomError('message')
+        try:
+            self.assertEqual(
+                list(get_suggestions_for_exception(exc, None)),
+                ['unscored', 'low', 'high', 'medium'])
+            for top_k, expected in (
+                    (0, []),
+                    (1, ['unscored']),
+                    (2, ['unscored', 'high']),
+                    (3, ['unscored', 'high', 'medium']),
+                    (10, ['unscored', 'high', 'medium', 'low'])):
+                previous = configure(top_k=top_k)
+                try:
+                    self.assertEqual(
+                        list(get_suggestions_for_exception(exc, None)),
+                        expected)
+                finally:
+                    configure(**previous)
+        finally:
+            unregister_suggestions_for(CustomError)
+
+    def test_top_suggestions_short_circuit(self):
+        """Functions are not consumed once the best suggestions are found."""
+        consumed = []
+
+        def make_func(name, scores):
+            def func(context):
+                for score in scores:
+                    consumed.append((name, score))
+                    yield ScoredSuggestion(name, score)
+            return func
+        functions = [
+            make_func('a', [1.0, 0.5, 1.0, 1.0]),
+            make_func('b', [0.8]),
+        ]
+        context = AnalysisContext(Exception(), None)
+        self.assertEqual(
+            list(get_top_suggestions(functions, context, 2)), ['a', 'a'])
+        # The heap is full of suggestions with the maximum score: the
+        # generator of 'a' is not consumed any longer and 'b' is not called
+        self.assertEqual(consumed, [('a', 1.0), ('a', 0.5), ('a', 1.0)])
+        del consumed[:]
+        self.assertEqual(
+            [(s, s.score)
+             for s in get_top_suggestions(functions, context, 4)],
+            [('a', 1.0), ('a', 1.0), ('a', 1.0), ('b', 0.8)])
+        self.assertEqual(len(consumed), 5)
+
+    def test_top_suggestions_skip_typos(self):
+        """Typos are not looked for when they can not beat the ones kept."""
+        consumed = []
+
+        def suggest_typo(word):
+            consumed.append(word)
+            yield get_typo_suggestion(quote(word + 'x'), word, word + 'x')
+
+        def func(context):
+            return itertools.chain(
+                [ScoredSuggestion('fixed', 0.95)],
+                *(get_suggestions_if_improving(
+                    suggest_typo(word), get_typo_max_score(word), context)
+                  for word in ('abc', 'abcdefghij')))
+        context = AnalysisContext(Exception(), None)
+        # 'abc' can not get more than 6/7 and is skipped, not 'abcdefghij'
+        self.assertEqual(
+            list(get_top_suggestions([func], context, 1)), ["'abcdefghijx'"])
+        self.assertEqual(consumed, ['abcdefghij'])
+        self.assertEqual(context.min_score, None)
+        del consumed[:]
+        self.assertEqual(
+            list(get_top_suggestions([func], context, 2)),
+            ["'abcdefghijx'", 'fixed'])
+        self.assertEqual(consumed, ['abc', 'abcdefghij'])
+
+    def test_typo_max_score(self):
+        """The best score of a typo is reached with one insertion."""
+        for word in ('a', 'abc', 'abcdefghij'):
+            self.assertEqual(
+                get_typo_max_score(word), fuzzy.get_ratio(word, word + 'x'))
+            for typo in (word[1:], 'x' + word[1:], 'x' + word):
+                self.assertTrue(
+                    fuzzy.get_ratio(word, typo) <= get_typo_max_score(word))
+
+    def test_typo_ratio_computed_lazily(self):
+        """Similarity ratios are only computed to rank the suggestions."""
+        sugg = get_typo_suggestion("'foo'", 'fooo', 'foo')
+        self.assertEqual(sugg, "'foo'")
+        self.assertFalse('_score' in sugg.__dict__)
+        self.assertEqual(sugg.score, fuzzy.get_ratio('fooo', 'foo'))
+        self.assertTrue('_score' in sugg.__dict__)
+
+    def test_concurrent_use(self):
+        """Suggestions can be computed from many threads at once.
+
+        Functions are registered at the same time.
+        """
+        class CustomError(Exception):
+            pass
+
+        class ConcurrentFoo(object):
+            def bar(self):
+                pass
+
+        def get_suggestions(_):
+            try:
+                ConcurrentFoo().baar
+            except AttributeError:
+                _, value, traceback = sys.exc_info()
+            return list(get_suggestions_for_exception(value, traceback))
+
+        def register(_):
+            register_context_suggestion_for(CustomError, None)(
+                lambda context, groups: ['custom'])
+            return get_suggestion_functions(CustomError)
+        pool = ThreadPool(8)
+        try:
+            try:
+                results = pool.map(get_suggestions, range(200))
+                functions = pool.map(register, range(50))
+            finally:
+                pool.close()
+                pool.join()
+            self.assertEqual(results, 200 * [["'bar'"]])
+            self.assertTrue(all(functions))
+            self.assertEqual(len(get_suggestion_functions(CustomError)), 50)
+            self.assertEqual(
+                list(get_suggestions_for_exception(CustomError(), None)),
+                50 * ['custom'])
+        finally:
+            unregister_suggestions_for(CustomError)
+
+    def test_caller_frames(self):
+        """Names from the caller frames are suggested when enabled."""
+        code = 'def main():\n' \
+            '\tdef callee():\n\t\treturn babarr\n' \
+            '\tdef caller():\n\t\tbabar = 0\n\t\tcallee()\n' \
+            '\tcaller()\n' \
+            'main()'
+        _, value, traceback = common.get_exception(code)
+        sugg = "'babar' (local in caller())"
+        self.assertFalse(
+            sugg in get_suggestions_for_exception(value, traceback))
+        previous = configure(all_frames=True)
+        try:
+            self.assertTrue(
+                sugg in get_suggestions_for_exception(value, traceback))
+        finally:
+            configure(**previous)
+
+    def test_ignored_caller_modules(self):
+        """Only the frames from the modules of the package are ignored."""
+        def get_frames(filename):
+            code = 'def func(f):\n\tf()\n'
+            namespace = {'__name__': 'didyoumean_api'}
+            exec(compile(code, filename, 'exec'), namespace)
+            try:
+                namespace['func'](lambda: 1 / 0)
+            except ZeroDivisionError:
+                traceback = sys.exc_info()[2]
+            frames = internal.get_caller_frames(traceback)
+            return [f.f_code.co_filename for f in frames]
+        api_path = os.path.join(
+            os.path.dirname(internal.get_source_path(internal.__file__)),
+            'didyoumean_api.py')
+        user_path = os.path.join(tempfile.gettempdir(), 'didyoumean_api.py')
+        previous = configure(all_frames=True)
+        try:
+            self.assertFalse(api_path in get_frames(api_path))
+            self.assertTrue(user_path in get_frames(user_path))
+        finally:
+            configure(**previous)
+
+    def test_caller_namespaces(self):
+        """Namespaces shared by the caller frames are searched once."""
+        code = 'def main():\n' \
+            '\tdef rec(n):\n\t\tif n:\n\t\t\trec(n - 1)\n\t\tbabar\n' \
+            '\trec(9)\n' \
+            'main()'
+        _, value, traceback = common.get_exception(code)
+        frames = []
+        while traceback is not None:
+            frames.append(traceback.tb_frame)
+            traceback = traceback.tb_next
+        context = AnalysisContext(value, frames[-1], None, frames[-2::-1])
+        namespaces = context.get_caller_namespaces()
+        ids = [id(dict_) for dict_, _, _ in namespaces]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertFalse(id(frames[-1].f_globals) in ids)
+        scopes = [scope for _, scope, _ in namespaces]
+        self.assertEqual(scopes.count('local in rec()'), 9)
+        self.assertEqual(scopes.count('builtin'), 0)
+        self.assertTrue(context.get_caller_objects()['n'][0].obj in (1, 9))
+        self.assertEqual(context.get_func_by_name('get_exception'),
+                         [common.get_exception])
+
+    def test_warm_up(self):
+        """Data reused from one analysis to another gets computed."""
+        warm_up()
+        self.assertFalse(re.DISPATCHER.pending)
+        self.assertTrue(TYPE_INDEX.lookup('object'))
+
+    def test_suggestion_functions_by_type(self):
+        """Functions are retrieved following the MRO (and cached)."""
+        class CustomError(Exception):
+            pass
+
+        class CustomSubError(CustomError, KeyError):
+            pass
+
+        def func(context, groups):
+            return []
+
+        def func2(context, groups):
+            return []
+        self.assertEqual(get_suggestion_functions(CustomSubError), [])
+        try:
+            register_context_suggestion_for(
+                (KeyError, CustomError), None)(func)
+            register_context_suggestion_for(CustomSubError, None)(func2)
+            functions = get_suggestion_functions(CustomSubError)
+            self.assertEqual(len(functions), 2)
+            self.assertTrue(get_suggestion_functions(CustomSubError)
+                            is functions)
+            self.assertEqual(get_suggestion_functions(CustomError),
+                             functions[1:])
+            self.assertEqual(get_suggestion_functions(ValueError),
+                             get_suggestion_functions(ValueError))
+        finally:
+            unregister_suggestions_for((KeyError, CustomError))
+            unregister_suggestions_for(CustomSubError)
+        self.assertEqual(get_suggestion_functions(CustomSubError), [])
+        self.assertEqual(get_suggestion_functions(CustomError), [])
+
+
+class AttributeSuggestionCacheTests(unittest_module.TestCase):
+    """Tests about AttributeSuggestionCache."""
+
+    def test_hits_and_misses(self):
+        """Suggestions are computed only once per types and attribute."""
+        class Foo(object):
+            pass
+        calls = []
+
+        def func():
+            calls.append(None)
+            return ['sugg']
+        cache = AttributeSuggestionCache()
+        for _ in range(3):
+            self.assertEqual(cache.get([Foo], 'Foo', 'bar', func), ['sugg'])
+        self.assertEqual(cache.get([Foo], 'Foo', 'baz', func), ['sugg'])
+        self.assertEqual(cache.get([Foo, int], 'Foo', 'baz', func), ['sugg'])
+        self.assertEqual(len(calls), 3)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+        self.assertEqual(len(cache), 3)
+
+    def test_invalidation(self):
+        """Entries are invalidated when the classes are modified."""
+        class Base(object):
+            pass
+
+        class Foo(Base):
+            pass
+        cache = AttributeSuggestionCache()
+        cache.get([Foo], 'Foo', 'bar', lambda: [])
+        Base.baar = 0
+        self.assertEqual(cache.get([Foo], 'Foo', 'bar', lambda: ['baar']),
+                         ['baar'])
+        self.assertEqual(cache.get([Foo], 'Foo', 'bar', lambda: []),
+                         ['baar'])
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_invalidation_same_size(self):
+        """Entries are invalidated when an attribute is renamed."""
+        class Foo(object):
+            bar = 0
+        cache = AttributeSuggestionCache()
+        cache.get([Foo], 'Foo', 'baz', lambda: ['bar'])
+        del Foo.bar
+        Foo.qux = 0
+        self.assertEqual(cache.get([Foo], 'Foo', 'baz', lambda: []), [])
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def test_types_not_kept_alive(self):
+        """Types are referenced weakly."""
+        class Foo(object):
+            pass
+        cache = AttributeSuggestionCache()
+        cache.get([Foo], 'Foo', 'bar', lambda: [])
+        ref = weakref.ref(Foo)
+        del Foo
+        gc.collect()
+        self.assertTrue(ref() is None)
+
+    def test_size(self):
+        """Size of the cache is bounded."""
+        cache = AttributeSuggestionCache()
+        previous = configure(attribute_cache_size=2)
+        try:
+            for attr in ('a', 'b', 'c', 'a'):
+                cache.get([int], 'int', attr, lambda: [])
+            self.assertEqual(len(cache), 2)
+            self.assertEqual((cache.hits, cache.misses), (0, 4))
+            configure(attribute_cache_size=0)
+            cache.get([int], 'int', 'a', lambda: [])
+            self.assertEqual(len(cache), 0)
+        finally:
+            configure(**previous)
+
+    def test_attribute_error(self):
+        """Suggestions for an AttributeError are cached."""
+        class CachedFoo(object):
+            def bar(self):
+                pass
+
+        def get_suggestions():
+            try:
+                CachedFoo().baar
+            except AttributeError:
+                _, value, traceback = sys.exc_info()
+            return list(get_suggestions_for_exception(value, traceback))
+        hits = ATTRIBUTE_SUGGESTIONS.hits
+        self.assertEqual(get_suggestions(), ["'bar'"])
+        self.assertEqual(get_suggestions(), ["'bar'"])
+        self.assertEqual(ATTRIBUTE_SUGGESTIONS.hits, hits + 1)
+        CachedFoo.baaz = 0
+        self.assertEqual(sorted(get_suggestions()), ["'baaz'", "'bar'"])
+
+
+class CallableIndexTests(unittest_module.TestCase):
+    """Test CallableIndex and the resolution of qualified names."""
+
+    def test_no_side_effect(self):
+        """Properties and __getattr__ are not triggered."""
+        calls = []
+
+        class WithSideEffects(object):
+            @property
+            def prop(self):
+                calls.append('prop')
+                return a_function
+
+            def __getattr__(self, name):
+                calls.append(name)
+                return a_function
+
+            def method(self):
+                pass
+
+            @staticmethod
+            def static_method():
+                pass
+        namespace = {'obj': WithSideEffects()}
+        index = CallableIndex(namespace)
+        self.assertEqual(calls, [])
+        self.assertEqual(index.get('a_function', namespace), [])
+        self.assertEqual(index.get('method', namespace),
+                         [WithSideEffects.__dict__['method']])
+        self.assertEqual(index.get('static_method', namespace),
+                         [WithSideEffects.static_method])
+        self.assertEqual(
+            resolve_qualified_name('obj.static_method', [namespace]),
+            [WithSideEffects.static_method])
+        self.assertEqual(resolve_qualified_name('obj.prop', [namespace]), [])
+        self.assertEqual(calls, [])
+
+    def test_old_style_class(self):
+        """Methods of old style classes (Python 2) are indexed."""
+        class OldStyleClass:
+            def method(self):
+                pass
+
+        class OldStyleSubClass(OldStyleClass):
+            pass
+        namespace = {'obj': OldStyleSubClass()}
+        self.assertEqual(CallableIndex(namespace).get('method', namespace),
+                         [OldStyleClass.__dict__['method']])
+
+    def test_resolve_qualified_name(self):
+        """Qualified names are resolved directly."""
+        namespaces = [{'sys': sys}, {'dict': dict}]
+        self.assertEqual(
+            resolve_qualified_name('dict.get', namespaces), [dict.get])
+        self.assertEqual(
+            resolve_qualified_name('sys._getframe', namespaces),
+            [sys._getframe])
+        self.assertEqual(
+            resolve_qualified_name('dict.dkalskjdas', namespaces), [])
+        self.assertEqual(
+            resolve_qualified_name('set.add', namespaces), [])
+
+    def test_qualified_name_in_frame(self):
+        """Qualified names are resolved instead of using the last part."""
+        class SomeClass(object):
+            def get(self):
+                pass
+        frame = sys._getframe()
+        method = SomeClass.__dict__['get']  # not an unbound method
+        self.assertEqual(get_func_by_name('SomeClass.get', frame), [method])
+        self.assertEqual(get_func_by_name('dict.get', frame), [dict.get])
+        self.assertTrue(dict.get in get_func_by_name('get', frame))
+        self.assertTrue(method in get_func_by_name('get', frame))
+        self.assertTrue(dict.get in get_func_by_name('unknown.get', frame))
+
+    def test_cache(self):
+        """Index is reused as long as the names in the namespace are the same.
+
+        A namespace allocated with the id of a freed one is indexed again.
+        """
+        namespace = {'a_function': a_function}
+        index = get_callable_index(namespace)
+        self.assertEqual(index.get('a_function', namespace), [a_function])
+        self.assertTrue(get_callable_index(namespace) is index)
+        namespace['a_generator'] = a_generator
+        index2 = get_callable_index(namespace)
+        self.assertFalse(index2 is index)
+        self.assertEqual(index2.get('a_generator', namespace), [a_generator])
+        namespace['a_generator'] = a_function
+        self.assertTrue(get_callable_index(namespace) is index2)
+        self.assertEqual(index2.get('a_generator', namespace), [])
+        key = id(namespace)
+        del namespace
+        namespace = {'a_function': a_function, 'other': a_generator}
+        if id(namespace) == key:
+            self.assertFalse(get_callable_index(namespace) is index2)
+        self.assertEqual(get_callable_index(namespace).get(
+            'a_generator', namespace), [a_generator])
+
+    def test_cache_attributes_changed(self):
+        """Callables not reachable anymore are not retrieved."""
+        class SomeClass(object):
+            def method(self):
+                pass
+
+        class SubClass(SomeClass):
+            def method(self):
+                pass
+        method = SomeClass.__dict__['method']
+        obj = SomeClass()
+        obj.attribute = a_generator
+        namespace = {'SubClass': SubClass, 'obj': obj}
+        index = get_callable_index(namespace)
+        self.assertEqual(index.get('a_generator', namespace), [a_generator])
+        self.assertTrue(method in index.get('method', namespace))
+        obj.attribute = a_function
+        del SomeClass.method
+        namespace['obj'] = SomeClass()
+        self.assertTrue(get_callable_index(namespace) is index)
+        self.assertEqual(index.get('a_generator', namespace), [])
+        self.assertEqual(index.get('method', namespace),
+                         [SubClass.__dict__['method']])
+
+    def test_cache_no_strong_reference(self):
+        """Indexed callables are not kept alive by the cache."""
+        def func():
+            pass
+        namespace = {'func': func}
+        self.assertEqual(
+            get_callable_index(namespace).get('func', namespace), [func])
+        ref = weakref.ref(func)
+        del func, namespace['func']
+        gc.collect()
+        self.assertTrue(ref() is None)
+
+
+class KeywordParametersTests(unittest_module.TestCase):
+    """Tests about the parameters from the signatures (and their cache)."""
+
+    @unittest_module.skipIf(not hasattr(inspect, 'signature'),
+                            "inspect.signature is not available")
+    def test_parameters(self):
+        """Only parameters usable as keywords are retrieved."""
+        def func(a, b=1, *args, **kwargs):
+            c = 2
+            return c
+
+        class Klass(object):
+            def __init__(self, foo, bar=None):
+                pass
+
+            def method(self, baz):
+                pass
+        self.assertEqual(get_keyword_parameters(func), ('a', 'b'))
+        self.assertEqual(get_keyword_parameters(Klass), ('foo', 'bar'))
+        self.assertEqual(get_keyword_parameters(Klass(0).method),
+                         ('self', 'baz'))
+        self.assertEqual(get_keyword_parameters(
+            functools.partial(func, b=2)), ('a', 'b'))
+        self.assertEqual(get_keyword_parameters(sorted), ('key', 'reverse'))
+
+    def test_without_inspect_signature(self):
+        """Parameters are retrieved from the code without signatures."""
+        def func(a, b=1, *args, **kwargs):
+            c = 2
+            return c
+        signature = getattr(inspect, 'signature', None)
+        if signature is not None:
+            del inspect.signature
+        try:
+            self.assertEqual(
+                get_keyword_parameters_from_signature(func), ('a', 'b'))
+            self.assertEqual(
+                get_keyword_parameters_from_signature(len), None)
+        finally:
+            if signature is not None:
+                inspect.signature = signature
+
+    @unittest_module.skipIf(not hasattr(inspect, 'signature'),
+                            "inspect.signature is not available")
+    def test_no_signature(self):
+        """None is returned when there is no signature."""
+        class NoSignature(object):
+            __signature__ = 'not a signature'
+
+            def __call__(self):
+                pass
+        self.assertEqual(get_keyword_parameters(NoSignature()), None)
+
+    def test_cache(self):
+        """Parameters are cached per callable, weakly if possible."""
+        def func(abc):
+            pass
+
+        def other(defg):
+            pass
+
+        class NoWeakRef(object):
+            __slots__ = ()
+
+            def __call__(self, key=None, reverse=False):
+                pass
+        self.assertEqual(get_keyword_parameters(func), ('abc',))
+        self.assertTrue(func in internal._PARAMETERS)
+        func.__code__ = other.__code__
+        self.assertEqual(get_keyword_parameters(func), ('defg',))
+        no_weak_ref = NoWeakRef()
+        self.assertRaises(TypeError, weakref.ref, no_weak_ref)
+        self.assertEqual(get_keyword_parameters(no_weak_ref),
+                         ('key', 'reverse')
+                         if hasattr(inspect, 'signature') else None)
+        self.assertTrue(id(no_weak_ref) in internal._STRONG_PARAMETERS)
+        ref = weakref.ref(func)
+        del func
+        gc.collect()
+        self.assertTrue(ref() is None)
+
+
+class ScoredSuggestionTests(unittest_module.TestCase):
+    """Tests about ScoredSuggestion."""
+
+    def test_is_string(self):
+        """Scored suggestions behave like the corresponding strings."""
+        sugg = ScoredSuggestion("'foo'", 0.5)
+        self.assertEqual(sugg, "'foo'")
+        self.assertEqual(sugg.score, 0.5)
+        self.assertEqual(get_suggestion_string([sugg]),
+                         ". Did you mean 'foo'?")
+
+    def test_pickle(self):
+        """Scored suggestions can be pickled with their score."""
+        sugg = pickle.loads(pickle.dumps(ScoredSuggestion('foo', 0.25)))
+        self.assertTrue(isinstance(sugg, ScoredSuggestion))
+        self.assertEqual(sugg, 'foo')
+        self.assertEqual(sugg.score, 0.25)
+
+    def test_typos_are_scored(self):
+        """Suggestions for typos are scored with the similarity ratio."""
+        type_, value, traceback = common.get_exception(
+            'babar = 0\nbabaar = 0\nbaba')
+        suggestions = list(get_suggestions_for_exception(value, traceback))
+        self.assertEqual(suggestions, ["'babar' (local)", "'babaar' (local)"])
+        self.assertTrue(1.0 > suggestions[0].score > suggestions[1].score)
+
+
+class ScanDirectoryTests(unittest_module.TestCase):
+    """Tests about the scan of directories to suggest files."""
+
+    def setUp(self):
+        """Create a temporary directory with files."""
+        self.directory = tempfile.mkdtemp()
+        self.names = ['file{0:02d}'.format(i) for i in range(20)]
+        for name in reversed(self.names):
+            open(os.path.join(self.directory, name), 'a').close()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        rmtree(self.directory)
+
+    def get_suggestions(self):
+        """Get the suggestions for opening the directory."""
+        value = IOError(errno.EISDIR, 'Is a directory', self.directory)
+        return list(suggest_if_file_is_dir(value))
+
+    def test_complete(self):
+        """All entries are counted and the first names are kept."""
+        self.assertEqual(scan_directory(self.directory, 3, 100, 10),
+                         (20, True, self.names[:3]))
+        self.assertEqual(scan_directory(self.directory, 30, 20, 10),
+                         (20, True, self.names))
+        self.assertEqual(scan_directory(self.directory, 0, 20, 10),
+                         (20, True, []))
+
+    def test_max_entries(self):
+        """Scan stops after the maximum number of entries."""
+        count, complete, names = scan_directory(self.directory, 3, 10, 10)
+        self.assertEqual((count, complete, len(names)), (10, False, 3))
+        self.assertEqual(sorted(names), names)
+        self.assertTrue(set(names) <= set(self.names))
+
+    def test_time_budget(self):
+        """Scan stops once the time budget is exhausted."""
+        self.assertEqual(scan_directory(self.directory, 3, 100, -1),
+                         (0, False, []))
+
+    def test_suggestion(self):
+        """Number of files is reported as a lower bound above the ceiling."""
+        self.assertEqual(
+            self.get_suggestions(),
+            ["any of the 20 files in directory "
+             "('file00', 'file01', 'file02', 'file03', etc)"])
+        previous = internal.MAX_NB_FILES_COUNTED
+        internal.MAX_NB_FILES_COUNTED = 10
+        try:
+            suggestions = self.get_suggestions()
+        finally:
+            internal.MAX_NB_FILES_COUNTED = previous
+        self.assertEqual(len(suggestions), 1)
+        self.assertTrue(suggestions[0].startswith(
+            "any of the more than 10 files in directory ('file"))
+        self.assertTrue(suggestions[0].endswith(", etc)"))
+
+    def test_nothing_read(self):
+        """No suggestion if no entry could be read within the limits."""
+        previous = internal.MAX_NB_FILES_COUNTED
+        internal.MAX_NB_FILES_COUNTED = 0
+        try:
+            self.assertEqual(self.get_suggestions(), [])
+        finally:
+            internal.MAX_NB_FILES_COUNTED = previous
+
+    @unittest_module.skipIf(not hasattr(os, 'scandir'),
+                            "os.scandir is not available anyway")
+    def test_without_scandir(self):
+        """Entries are listed all at once without os.scandir."""
+        scandir = os.scandir
+        del os.scandir
+        try:
+            self.assertEqual(scan_directory(self.directory, 3, 100, 10),
+                             (20, True, self.names[:3]))
+        finally:
+            os.scandir = scandir
+
+
+class DirectoryListingCacheTests(unittest_module.TestCase):
+    """Tests about DirectoryListingCache and the lookup of missing files."""
+
+    def setUp(self):
+        """Create a temporary directory with a file."""
+        self.directory = tempfile.mkdtemp()
+        self.add_file('foo')
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        rmtree(self.directory)
+
+    def add_file(self, name):
+        """Add a file to the temporary directory."""
+        open(os.path.join(self.directory, name), 'a').close()
+
+    def test_cached(self):
+        """Listings are read once and retrieved from the cache."""
+        cache = DirectoryListingCache(2, 60)
+        for _ in range(3):
+            self.assertEqual(cache.get(self.directory), ['foo'])
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (2, 1, 1))
+        cache.get(os.curdir)
+        cache.get(os.path.dirname(self.directory))
+        self.assertEqual(len(cache), 2)
+        self.assertRaises(OSError, cache.get,
+                          os.path.join(self.directory, 'bar'))
+
+    def test_modified_directory(self):
+        """Listings are read again when the directory is modified."""
+        cache = DirectoryListingCache(2, 60)
+        cache.get(self.directory)
+        self.add_file('bar')
+        mtime = os.stat(self.directory).st_mtime
+        os.utime(self.directory, (mtime + 10, mtime + 10))
+        self.assertEqual(sorted(cache.get(self.directory)), ['bar', 'foo'])
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def test_expired(self):
+        """Listings are read again after the time to live."""
+        cache = DirectoryListingCache(2, -1)
+        cache.get(self.directory)
+        cache.get(self.directory)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        cache = DirectoryListingCache(0, 60)
+        cache.get(self.directory)
+        self.assertEqual(len(cache), 0)
+
+    def test_split_missing_path(self):
+        """Paths are split at their first missing component."""
+        join = os.path.join
+        self.assertEqual(split_missing_path(join(self.directory, 'bar')),
+                         (self.directory, ['bar']))
+        self.assertEqual(
+            split_missing_path(join(self.directory, 'bar', 'baz')),
+            (self.directory, ['bar', 'baz']))
+        self.assertEqual(split_missing_path('doesnotexist'),
+                         ('', ['doesnotexist']))
+        self.assertEqual(split_missing_path(self.directory + os.sep),
+                         (self.directory, []))
+
+
+class LazySuggestionsTests(unittest_module.TestCase):
+    """Tests about the lazy computation of suggestions."""
+
+    def setUp(self):
+        """Register a suggestion function counting its calls."""
+        class CustomError(Exception):
+            pass
+        self.calls = []
+        self.error_type = CustomError
+
+        @register_context_suggestion_for(CustomError, r"^custom (\w+)$")
+        def context_func(context, groups):
+            self.calls.append(groups)
+            local_var = context.get_objects()['local_var'][0].obj
+            yield 'sugg' + local_var
+
+    def tearDown(self):
+        """Unregister the suggestion function."""
+        unregister_suggestions_for(self.error_type)
+        re.DISPATCHER.remove(r"^custom (\w+)$")
+
+    def get_exception(self, *args):
+        """Get an exception with lazy suggestions."""
+        local_var = '1'
+        try:
+            raise self.error_type(*args)
+        except self.error_type:
+            type_, value, tb = sys.exc_info()
+            add_suggestions_to_exception(type_, value, tb, lazy=True)
+        local_var = '2'  # not visible in the suggestions
+        del local_var
+        return value
+
+    def test_computed_when_needed(self):
+        """Suggestions are computed only once, when needed."""
+        value = self.get_exception('custom message')
+        self.assertEqual(self.calls, [])
+        self.assertEqual(value.args, ('custom message',))
+        self.assertEqual(self.calls, [])
+        expected_msg = 'custom message. Did you mean sugg1?'
+        self.assertEqual(str(value), expected_msg)
+        self.assertEqual(self.calls, [('message',)])
+        self.assertEqual(repr(value), repr(self.error_type(expected_msg)))
+        self.assertEqual(self.calls, [('message',)])
+
+    def test_traceback_and_pickle(self):
+        """Suggestions are used when the exception is displayed/pickled."""
+        value = self.get_exception('custom message', 42)
+        self.assertTrue(isinstance(value.args[0], LazySuggestionString))
+        self.assertEqual(self.calls, [])
+        lines = traceback.format_exception_only(type(value), value)
+        self.assertTrue('Did you mean sugg1?' in lines[-1])
+        arg = pickle.loads(pickle.dumps(value.args[0]))
+        self.assertEqual(arg, 'custom message. Did you mean sugg1?')
+        self.assertEqual(type(arg), str)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_no_string(self):
+        """Suggestions are computed immediately if there is no string."""
+        value = self.get_exception(42)
+        self.assertEqual(value.args, (42,))
+        value = self.get_exception()
+        self.assertEqual(value.args, ())
+        self.assertEqual(self.calls, [])
+
+
 class GetSuggStringTests(unittest_module.TestCase):
     """Tests about get_suggestion_string."""
 
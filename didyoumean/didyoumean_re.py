@@ -1,6 +1,11 @@
 # -*- coding: utf-8
-"""Regular expressions to parse error messages."""
-import re
+"""Regular expressions to parse error messages.
+
+The re module is imported when a pattern is first compiled or processed so
+that importing this module is cheap.
+"""
+from collections import OrderedDict
+import threading
 
 # https://docs.python.org/3/reference/grammar.html
 IDENTIFIER = r"[^\d\W]\w*"
@@ -155,13 +160,176 @@ ALL_REGEXPS = dict((k, v)
                    if k.endswith('_RE'))
 
 
+#: Maximum number of compiled patterns kept in cache (more than the number
+# of patterns in ALL_REGEXPS so that they are all kept)
+COMPILED_CACHE_SIZE = 512
+
+# Mapping pattern -> compiled pattern (most recently used last)
+_COMPILED = OrderedDict()
+
+# Lock for _COMPILED (not held while compiling a pattern)
+_COMPILED_LOCK = threading.Lock()
+
+# Mapping pattern -> name in ALL_REGEXPS
+PATTERN_NAMES = dict((v, k) for k, v in ALL_REGEXPS.items())
+
+
+def compile(pattern):
+    """Get the compiled version of a pattern (cached).
+
+    The cache keeps the COMPILED_CACHE_SIZE patterns used most recently.
+    """
+    with _COMPILED_LOCK:
+        compiled = _COMPILED.pop(pattern, None)
+        if compiled is not None:
+            _COMPILED[pattern] = compiled
+            return compiled
+    import re
+    compiled = re.compile(pattern)
+    with _COMPILED_LOCK:
+        _COMPILED.pop(pattern, None)
+        while len(_COMPILED) >= COMPILED_CACHE_SIZE:
+            _COMPILED.popitem(last=False)
+        _COMPILED[pattern] = compiled
+    return compiled
+
+
 def match(pattern, string):
     """Wrap function from the re module.
 
     Wrapper around re.match to be able to import this module as re
-    without having name collisions.
+    without having name collisions. Patterns are compiled only once.
+    """
+    return compile(pattern).match(string)
+
+
+def get_pattern_name(pattern):
+    """Get the name of a pattern from ALL_REGEXPS (or the pattern itself)."""
+    return PATTERN_NAMES.get(pattern, pattern)
+
+
+def get_keyword(pattern):
+    """Get a word which must be in any string matched by the pattern.
+
+    Only the literals at the top level of the pattern are considered. A word
+    must be delimited by non-word literals (or by the beginning/end of the
+    pattern) to be sure that it appears as a full word in matched strings.
+    The longest such word is returned (None if there is no such word).
     """
-    return re.match(pattern, string)
+    try:
+        import re._parser as sre_parse  # Python 3.11+
+    except ImportError:
+        import sre_parse
+    chars = []
+    for op, arg in sre_parse.parse(pattern):
+        if op == sre_parse.LITERAL:
+            chars.append(chr(arg))
+        elif op == sre_parse.AT and \
+                arg in (sre_parse.AT_BEGINNING, sre_parse.AT_END):
+            chars.append(' ')
+        else:
+            chars.append('\0')  # unknown content
+    # String is always matched from the beginning but not to the end
+    chars.append('\0')
+    words = compile(r"(?<![\w\0])\w+(?![\w\0])").findall(''.join(chars))
+    return max(words, key=len) if words else None
+
+
+def get_words(string):
+    """Get the set of words in a string."""
+    return set(compile(r"\w+").findall(string))
+
+
+class Dispatcher(object):
+    """Match a string against many patterns, running only relevant ones.
+
+    Each pattern is associated to a keyword (see get_keyword) so that it
+    is run only on strings containing it. Patterns without keyword are
+    always run. Patterns are processed lazily, when a string is matched.
+    Containers are never modified in place (copy-on-write) so that strings
+    can be matched without lock while patterns are added.
+    """
+
+    def __init__(self, patterns=()):
+        """Init a Dispatcher with an optional iterable of patterns."""
+        self.patterns = []
+        self.pending = list(patterns)
+        self.by_keyword = dict()
+        self.unfiltered = []
+        self.lock = threading.Lock()
+
+    def add(self, pattern):
+        """Add a pattern (ignored when processed if already added)."""
+        with self.lock:
+            self.pending = self.pending + [pattern]
+
+    def remove(self, pattern):
+        """Remove a pattern (nothing is done if it was not added)."""
+        with self.lock:
+            self.pending = [p for p in self.pending if p != pattern]
+            if pattern not in self.patterns:
+                return
+            by_keyword = dict()
+            for keyword, patterns in self.by_keyword.items():
+                patterns = [p for p in patterns if p != pattern]
+                if patterns:
+                    by_keyword[keyword] = patterns
+            self.by_keyword = by_keyword
+            self.unfiltered = [p for p in self.unfiltered if p != pattern]
+            self.patterns = [p for p in self.patterns if p != pattern]
+
+    def process_pending(self):
+        """Compute keywords for the patterns added since the last call."""
+        with self.lock:
+            if not self.pending:
+                return
+            by_keyword = dict(self.by_keyword)
+            unfiltered = list(self.unfiltered)
+            known = set(self.patterns)
+            new = []
+            for pattern in self.pending:
+                if pattern in known:
+                    continue
+                known.add(pattern)
+                new.append(pattern)
+                keyword = get_keyword(pattern)
+                if keyword is None:
+                    unfiltered.append(pattern)
+                else:
+                    by_keyword[keyword] = \
+                        by_keyword.get(keyword, []) + [pattern]
+            self.by_keyword = by_keyword
+            self.unfiltered = unfiltered
+            self.patterns = self.patterns + new
+            # Reset last so that processed patterns are visible once
+            # there is no pending pattern
+            self.pending = []
+
+    def get_candidates(self, string):
+        """Get the patterns which may match a string."""
+        if self.pending:
+            self.process_pending()
+        by_keyword = self.by_keyword
+        candidates = list(self.unfiltered)
+        for word in get_words(string):
+            candidates.extend(by_keyword.get(word, []))
+        return candidates
+
+    def match_all(self, string):
+        """Get the matches for a string as a dict pattern -> match object.
+
+        Only the patterns which do match are in the dict.
+        """
+        matches = dict()
+        for pattern in self.get_candidates(string):
+            match_obj = match(pattern, string)
+            if match_obj:
+                matches[pattern] = match_obj
+        return matches
+
+
+#: Dispatcher for the regexps in ALL_REGEXPS (and the ones registered later)
+DISPATCHER = Dispatcher(sorted(ALL_REGEXPS.values()))
 
 
 if __name__ == '__main__':
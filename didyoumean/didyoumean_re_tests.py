@@ -19,6 +19,9 @@ CHECK_RE_NAME = True
 # Flag to check that the regex does match a few conventions such as:
 # starts with ^, ends with $.
 CHECK_RE_VALUE = True
+# Flag to check that the dispatcher finds the same matches as a plain
+# match on each regexp.
+CHECK_DISPATCHER = True
 
 
 class RegexTests(unittest_module.TestCase):
@@ -76,6 +79,10 @@ class RegexTests(unittest_module.TestCase):
                 self.assertEqual(no_match, None, details)
         if CHECK_RE_LISTED:
             self.assertTrue(found)
+        if CHECK_DISPATCHER:
+            expected = set(r for r in re.ALL_REGEXPS.values()
+                           if re.match(r, text))
+            self.assertEqual(set(re.DISPATCHER.match_all(text)), expected)
 
     def test_var_name(self):
         """Test VAR_NAME."""
@@ -931,6 +938,78 @@ class RegexTests(unittest_module.TestCase):
             self.re_matches(msg, re.SIZE_CHANGED_DURING_ITER_RE, results)
 
 
+class DispatcherTests(unittest_module.TestCase):
+    """Tests about the Dispatcher and the keywords it relies on."""
+
+    def test_get_keyword(self):
+        """Test get_keyword on various patterns."""
+        self.assertEqual(re.get_keyword(r"^abc def$"), 'abc')
+        self.assertEqual(re.get_keyword(r"^abc defg$"), 'defg')
+        self.assertEqual(re.get_keyword(r"^abc (\w+) d$"), 'abc')
+        self.assertEqual(re.get_keyword(r"^(\w+)abc def$"), 'def')
+        self.assertEqual(re.get_keyword(r"^abc defg"), 'abc')
+        self.assertEqual(re.get_keyword(r"^abc|defg$"), None)
+        self.assertEqual(re.get_keyword(r"^(?:abc)?$"), None)
+        self.assertEqual(re.get_keyword(r"^'abc'$"), 'abc')
+
+    def test_keyword_in_matched_strings(self):
+        """Keywords appear in the strings matched by the patterns."""
+        self.assertEqual(
+            re.get_keyword(re.NOT_CALLABLE_RE), 'callable')
+        self.assertEqual(
+            re.get_keyword(re.UNEXPECTED_KEYWORDARG_RE), 'unexpected')
+        self.assertEqual(
+            re.get_keyword(re.INDICES_MUST_BE_INT_RE), 'must')
+
+    def test_candidates(self):
+        """Only the relevant patterns are candidates."""
+        dispatcher = re.Dispatcher([r"^a (\w+) b$", r"^c (\w+)$", r"^d|e$"])
+        self.assertEqual(
+            dispatcher.get_candidates('a x b'), [r"^d|e$", r"^a (\w+) b$"])
+        self.assertEqual(dispatcher.get_candidates('x y'), [r"^d|e$"])
+        self.assertEqual(
+            list(dispatcher.match_all('c x')), [r"^c (\w+)$"])
+        dispatcher.add(r"^x (\w+)$")
+        self.assertEqual(
+            list(dispatcher.match_all('x y')), [r"^x (\w+)$"])
+
+    def test_remove(self):
+        """Patterns can be removed (processed or not)."""
+        dispatcher = re.Dispatcher([r"^a (\w+) b$", r"^d|e$"])
+        dispatcher.remove(r"^d|e$")
+        dispatcher.remove(r"^unknown$")
+        self.assertEqual(
+            dispatcher.get_candidates('a x b'), [r"^a (\w+) b$"])
+        dispatcher.remove(r"^a (\w+) b$")
+        self.assertEqual(dispatcher.get_candidates('a x b'), [])
+        self.assertEqual(dispatcher.by_keyword, {})
+        self.assertEqual(dispatcher.patterns, [])
+        dispatcher.add(r"^a (\w+) b$")
+        self.assertEqual(list(dispatcher.match_all('a x b')),
+                         [r"^a (\w+) b$"])
+
+    def test_compile_cache_size(self):
+        """Compiled patterns kept in cache are bounded."""
+        previous = re.COMPILED_CACHE_SIZE
+        re.COMPILED_CACHE_SIZE = 2
+        try:
+            compiled = re.compile(r"^cached 0$")
+            self.assertTrue(re.compile(r"^cached 0$") is compiled)
+            for i in range(1, 4):
+                re.compile(r"^cached {0}$".format(i))
+            self.assertEqual(len(re._COMPILED), 2)
+            self.assertEqual(list(re._COMPILED),
+                             [r"^cached 2$", r"^cached 3$"])
+        finally:
+            re.COMPILED_CACHE_SIZE = previous
+
+    def test_pattern_name(self):
+        """Test get_pattern_name."""
+        self.assertEqual(
+            re.get_pattern_name(re.NOT_CALLABLE_RE), 'NOT_CALLABLE_RE')
+        self.assertEqual(re.get_pattern_name(r"^abc$"), r"^abc$")
+
+
 if __name__ == '__main__':
     print(sys.version_info)
     unittest_module.main()
@@ -617,12 +617,11 @@ class NameErrorTests(GetSuggestionsTests):
 
     def test_enclosing_scope(self):
         """Test that variables from enclosing scope are suggested."""
-        # NICE_TO_HAVE
         typo, good = 'foob', 'foo'
         inner = func_gen('g', body='{0}', args='')
         code = func_gen('f', body='foo = 0\n' + inner, args='')
         bad_code, good_code = format_str(code, typo, good)
-        self.throws(bad_code, NAMEERROR)
+        self.throws(bad_code, NAMEERROR, "'foo' (enclosing)")
         self.runs(good_code)
 
     def test_no_sugg(self):
@@ -933,12 +932,11 @@ class UnboundLocalErrorTests(GetSuggestionsTests):
 
     def test_unbound_nonlocal(self):
         """Shoud be nonlocal nb."""
-        # NICE_TO_HAVE
         inner = func_gen('bar', body="{0}\nnb += 1", args='')
         code = func_gen('foo', body='nb = 0\n' + inner, args='')
         sugg = 'nonlocal nb'
         bad_code, good_code = format_str(code, "", sugg)
-        self.throws(bad_code, UNBOUNDLOCAL)
+        self.throws(bad_code, UNBOUNDLOCAL, quote(sugg))
         before, after = before_and_after((3, 0))
         self.throws(good_code, INVALIDSYNTAX, [], before)
         self.runs(good_code, after)
@@ -950,7 +948,7 @@ class UnboundLocalErrorTests(GetSuggestionsTests):
                '\n\t\t{0}\n\t\tnb +=1\n\tbar()\nfoo()'
         sugg1, sugg2 = 'nonlocal nb', 'global nb'
         bad_code, good_code1, good_code2 = format_str(code, "", sugg1, sugg2)
-        self.throws(bad_code, UNBOUNDLOCAL)
+        self.throws(bad_code, UNBOUNDLOCAL, quote(sugg1))
         self.runs(good_code2)
         before, after = before_and_after((3, 0))
         self.throws(good_code1, INVALIDSYNTAX, [], before)
@@ -1569,6 +1567,14 @@ class TypeErrorTests(GetSuggestionsTests):
         self.throws(bad_code, UNEXPECTEDKWARGSUGG, [], after)
         self.runs(good_code)
 
+    def test_keyword_arg_local_variable(self):
+        """Local variables are not parameters."""
+        before, after = before_and_after((3, 13))
+        code = 'def func(a):\n\tabcdef = a\nfunc({0}=1)'
+        bad_code, good_code = format_str(code, 'abcdf', 'a')
+        self.throws(bad_code, UNEXPECTEDKWARG, [], before)
+        self.runs(good_code)
+
     def test_keyword_arg_method(self):
         """Should be the same as previous test but on a method."""
         code = 'class MyClass:\n\tdef func(self, a):' \
@@ -1682,9 +1688,11 @@ class TypeErrorTests(GetSuggestionsTests):
 
     def test_keyword_builtin_print(self):
         """Builtin "print" has a different error message."""
-        # It would be NICE_TO_HAVE suggestions on keyword arguments
-        before, mid1, mid2, mid3, after = ranges_between(
-            (3, 0), (3, 7), (3, 8), (3, 13, 0, 'alpha', 4)
+        # It would be NICE_TO_HAVE suggestions on keyword arguments for
+        # all versions (they rely on the signature of the builtin which is
+        # exposed from Python 3.11)
+        before, mid1, mid2, mid3, mid4, after = ranges_between(
+            (3, 0), (3, 7), (3, 8), (3, 11), (3, 13, 0, 'alpha', 4)
         )
         code = "c = 'string'\nb = print(c, end_='toto')"
         sugg = quote('end')
@@ -1692,10 +1700,12 @@ class TypeErrorTests(GetSuggestionsTests):
         self.throws(code, UNEXPECTEDKWARG2, [], mid1, 'cpython')
         self.throws(code, UNEXPECTEDKWARG4, [], mid2, 'cpython')
         self.throws(code, UNEXPECTEDKWARG4, [], mid3, 'cpython')
+        self.throws(code, UNEXPECTEDKWARG4, sugg, mid4, 'cpython')
         self.throws(code, UNEXPECTEDKWARGSUGG, [], after, 'cpython')
         self.throws(code, UNEXPECTEDKWARG3, [], mid1, 'pypy')
         self.throws(code, UNEXPECTEDKWARG3, [], mid2, 'pypy')
         self.throws(code, UNEXPECTEDKWARG, sugg, mid3, 'pypy')
+        self.throws(code, UNEXPECTEDKWARG, sugg, mid4, 'pypy')
         self.throws(code, UNEXPECTEDKWARG, sugg, after, 'pypy')
 
     def test_keyword_sort_cmpkey(self):
@@ -2163,13 +2173,23 @@ class ImportErrorTests(GetSuggestionsTests):
 
     def test_module_removed(self):
         """Sometimes, modules are deleted/moved/renamed."""
-        # NICE_TO_HAVE
         # result for 2.6 seems to vary
         _, mid, after = before_mid_and_after((2, 7), (3, 0))
+        # Tkinter is not always installed, ConfigParser is pure Python
         code = 'import {0}'
-        lower, upper = format_str(code, 'tkinter', 'Tkinter')
-        self.throws(lower, NOMODULE, [], mid)
-        self.throws(upper, NOMODULE, [], after)
+        lower, upper = format_str(code, 'configparser', 'ConfigParser')
+        self.throws(lower, NOMODULE, quote('ConfigParser'), mid)
+        self.throws(upper, NOMODULE, quote('configparser'), after)
+
+    def test_no_module_not_standard(self):
+        """Should be a module available even if not a standard one."""
+        code = 'import {0}'
+        typo, good = 'pkgutill', 'pkgutil'
+        self.assertFalse(good in STAND_MODULES)
+        bad_code, good_code = format_str(code, typo, good)
+        sugg = quote(good)
+        self.throws(bad_code, NOMODULE, sugg)
+        self.runs(good_code)
 
 
 class LookupErrorTests(GetSuggestionsTests):
@@ -2632,6 +2652,24 @@ class IOErrorTests(GetSuggestionsTests):
         code = 'os.listdir("doesnotexist")'
         self.throws(code, NOFILE_OS)
 
+    def test_no_such_file_typo(self):
+        """Suggestion when the name of a file is misspelled."""
+        tmpdir, absfiles = self.create_tmp_dir_with_files(
+            ['config.yaml', 'other.txt'])
+        os.mkdir(os.path.join(tmpdir, 'subdir'))
+        nested = os.path.join(tmpdir, 'subdir', 'file.txt')
+        open(nested, 'a').close()
+        code = 'with open("{0}") as f:\n\tpass'
+        for typo, good in (
+                (os.path.join(tmpdir, 'confg.yaml'), absfiles[0]),
+                (os.path.join(tmpdir, 'subdr', 'file.txt'), nested)):
+            bad_code, good_code = format_str(code, typo, good)
+            self.throws(bad_code, NOFILE_IO, "'{0}'".format(good))
+            self.runs(good_code)
+        code = os.path.join(tmpdir, 'subdr', 'nofile.txt')
+        self.throws('open("{0}")'.format(code), NOFILE_IO)
+        rmtree(tmpdir)
+
     def test_no_such_file_user(self):
         """Suggestion when one needs to expanduser."""
         code = 'os.listdir("{0}")'
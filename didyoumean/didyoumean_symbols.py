@@ -0,0 +1,289 @@
+# -*- coding: utf-8
+"""Persistent index of the modules available and of their attributes.
+
+The index is stored on disk in a versioned file whose name depends on the
+interpreter version and on a fingerprint of the installation (see
+get_search_path) so that it is built only once and reused by the next
+processes. A file is kept for each fingerprint (different virtualenvs or
+options such as -S can be used alternately with the same interpreter) and
+only the most recently used files are kept. It is memory-mapped and looked
+up with binary searches so that no import is needed on the hot path
+(modules only needed to build the index are imported when first needed).
+
+The file is made of sorted lines (encoded in UTF-8) after a header line:
+ - 'a <attribute> <module>' for each attribute of the indexed modules
+ - 'm <module>' for each module available.
+"""
+import os
+import site
+import sys
+import threading
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+#: Version of the format of the file (to be changed when the format changes)
+FORMAT_VERSION = 1
+
+#: Maximum number of index files kept in the cache directory (the least
+# recently used ones are removed when a new file is written)
+MAX_INDEX_FILES = 16
+
+# Mapping frozenset of indexed modules -> SymbolIndex
+_INDEXES = dict()
+
+# Lock for _INDEXES (so that an index is opened only once)
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_cache_dir():
+    """Get the directory where index files are stored.
+
+    It can be set with the DIDYOUMEAN_CACHE_DIR environment variable.
+    """
+    directory = os.environ.get('DIDYOUMEAN_CACHE_DIR')
+    if directory:
+        return directory
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'didyoumean')
+
+
+def get_interpreter_name():
+    """Get a string identifying the interpreter and its version."""
+    impl = getattr(sys, 'implementation', None)
+    name = impl.name if impl is not None else 'python'
+    return '{0}{1}'.format(name, '.'.join(str(v) for v in sys.version_info))
+
+
+def get_search_path():
+    """Get the entries of sys.path corresponding to the installation.
+
+    Only the entries in the installation prefixes (standard library,
+    site-packages, user site-packages, etc) are considered so that the index
+    does not depend on the directory Python is run from.
+    """
+    prefixes = set(os.path.abspath(p) for p in (
+        sys.prefix, sys.exec_prefix,
+        getattr(sys, 'base_prefix', sys.prefix),
+        getattr(sys, 'base_exec_prefix', sys.exec_prefix),
+        getattr(site, 'USER_BASE', None) or sys.prefix))
+    return [path for path in sys.path
+            if path and any(os.path.abspath(path) == prefix
+                            or os.path.abspath(path).startswith(prefix + os.sep)
+                            for prefix in prefixes)]
+
+
+def get_fingerprint(modules):
+    """Get a fingerprint of the search path and of the modules to index.
+
+    Modification times of the directories are taken into account so that
+    installing or removing a package invalidates the index.
+    """
+    import hashlib
+    hasher = hashlib.sha1()
+    for path in [sys.executable] + get_search_path():
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        hasher.update('{0}\0{1}\n'.format(path, mtime).encode('utf-8'))
+    hasher.update(' '.join(sorted(modules)).encode('utf-8'))
+    return hasher.hexdigest()[:16]
+
+
+def get_index_path(modules, directory=None):
+    """Get the path of the index file for the current interpreter."""
+    if directory is None:
+        directory = get_cache_dir()
+    return os.path.join(directory, 'symbols-{0}-v{1}-{2}.idx'.format(
+        get_interpreter_name(), FORMAT_VERSION, get_fingerprint(modules)))
+
+
+def get_header(path):
+    """Get the header line expected for an index file."""
+    return 'didyoumean-symbols {0}\n'.format(
+        os.path.basename(path)).encode('utf-8')
+
+
+def import_module(module_name):
+    """Import a module by name (None if it can not be imported)."""
+    try:
+        __import__(module_name)
+    except Exception:
+        return None
+    return sys.modules.get(module_name)
+
+
+def build_index_data(modules):
+    """Get the content of the index (without header) as bytes.
+
+    Attributes are retrieved only for the `modules` provided as importing
+    other modules could be slow and have side-effects.
+    """
+    import pkgutil
+    names = set(sys.builtin_module_names)
+    names.update(m[1] for m in pkgutil.iter_modules(get_search_path()))
+    names.update(modules)
+    lines = set('m ' + n for n in names if n.split() == [n])
+    for module_name in modules:
+        mod = import_module(module_name)
+        if mod is not None:
+            lines.update('a {0} {1}'.format(attr, module_name)
+                         for attr in dir(mod) if attr.split() == [attr])
+    return ''.join(line + '\n' for line in sorted(lines)).encode('utf-8')
+
+
+def write_index(path, data):
+    """Write an index file (atomically) and remove the least used ones."""
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as index_file:
+        index_file.write(data)
+    os.rename(tmp_path, path)
+    prune_index_files(directory, path)
+
+
+def prune_index_files(directory, kept_path):
+    """Remove the index files beyond the MAX_INDEX_FILES most recent ones.
+
+    Modification times are updated when the files are loaded so that the
+    least recently used files are removed. The file at `kept_path` is
+    never removed.
+    """
+    files = []
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        if filename.startswith('symbols-') and filename.endswith('.idx') \
+                and path != kept_path:
+            try:
+                files.append((os.stat(path).st_mtime, path))
+            except OSError:
+                pass
+    files.sort(reverse=True)
+    for _, path in files[max(0, MAX_INDEX_FILES - 1):]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def touch_index(path):
+    """Update the modification time of an index file (when it is used)."""
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def load_index(path):
+    """Load an index file (None if it does not exist or is invalid)."""
+    header = get_header(path)
+    try:
+        with open(path, 'rb') as index_file:
+            if index_file.read(len(header)) != header:
+                return None
+            if mmap is None:
+                data, begin = index_file.read(), 0
+            else:
+                data = mmap.mmap(index_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+                begin = len(header)
+    except (IOError, OSError, ValueError):
+        return None
+    touch_index(path)
+    return SymbolIndex(data, begin, len(data))
+
+
+def open_index(modules, directory=None):
+    """Get the SymbolIndex from the file, building the file if needed.
+
+    If the file can not be written, the index is kept in memory.
+    """
+    path = get_index_path(modules, directory)
+    index = load_index(path)
+    if index is None:
+        data = build_index_data(modules)
+        try:
+            write_index(path, get_header(path) + data)
+        except (IOError, OSError):
+            return SymbolIndex(data, 0, len(data))
+        index = load_index(path)
+        if index is None:
+            return SymbolIndex(data, 0, len(data))
+    return index
+
+
+def get_symbol_index(modules):
+    """Get the SymbolIndex for a collection of indexed modules (cached)."""
+    key = frozenset(modules)
+    index = _INDEXES.get(key)
+    if index is None:
+        with _INDEXES_LOCK:
+            index = _INDEXES.get(key)
+            if index is None:
+                index = _INDEXES[key] = open_index(key)
+    return index
+
+
+def find_first_line(data, key, low, high):
+    """Get the offset of the first line greater or equal to key.
+
+    Lines in data[low:high] are expected to be sorted, to end with a newline
+    and `low` to be the beginning of a line.
+    """
+    while low < high:
+        mid = (low + high) // 2
+        start = max(low, data.rfind(b'\n', low, mid) + 1)
+        end = data.find(b'\n', start, high)
+        if data[start:end] < key:
+            low = end + 1
+        else:
+            high = start
+    return low
+
+
+class SymbolIndex(object):
+    """Lookups on the content of an index file (as bytes or mmap)."""
+
+    def __init__(self, data, begin, end):
+        """Init a SymbolIndex from the lines in data[begin:end]."""
+        self.data = data
+        self.begin = begin
+        self.end = end
+        self.module_names = None
+        self.public_module_names = None
+
+    def get_lines(self, prefix):
+        """Yield the lines starting with a prefix (without the prefix)."""
+        prefix = prefix.encode('utf-8')
+        data, end = self.data, self.end
+        pos = find_first_line(data, prefix, self.begin, end)
+        while pos < end and data[pos:pos + len(prefix)] == prefix:
+            line_end = data.find(b'\n', pos, end)
+            yield data[pos + len(prefix):line_end].decode('utf-8')
+            pos = line_end + 1
+
+    def get_module_names(self):
+        """Get the names of the modules available."""
+        if self.module_names is None:
+            self.module_names = list(self.get_lines('m '))
+        return self.module_names
+
+    def get_public_module_names(self):
+        """Get the names of the modules available not starting with '_'.
+
+        The same tuple is returned each time so that the matchers can reuse
+        what they computed for it (see didyoumean_fuzzy.get_words_key).
+        """
+        if self.public_module_names is None:
+            self.public_module_names = tuple(
+                m for m in self.get_module_names() if not m.startswith('_'))
+        return self.public_module_names
+
+    def get_modules_with_attribute(self, name):
+        """Get the set of indexed modules having an attribute."""
+        return set(self.get_lines('a {0} '.format(name)))
@@ -0,0 +1,138 @@
+# -*- coding: utf-8
+"""Unit tests for code in didyoumean_symbols.py."""
+from didyoumean_symbols import SymbolIndex, find_first_line, open_index,\
+    get_index_path, build_index_data, load_index, write_index,\
+    MAX_INDEX_FILES
+from didyoumean_common_tests import unittest_module
+from shutil import rmtree
+import os
+import sys
+import tempfile
+
+
+class FindFirstLineTests(unittest_module.TestCase):
+    """Tests about find_first_line and SymbolIndex lookups."""
+
+    def test_find_first_line(self):
+        """Test find_first_line against a linear scan."""
+        lines = [b'a', b'ab', b'abc', b'b', b'bb', b'c']
+        data = b''.join(line + b'\n' for line in lines)
+        for key in [b'', b'a', b'aa', b'abc', b'abd', b'bb', b'c', b'd']:
+            expected = sum(len(line) + 1 for line in lines if line < key)
+            self.assertEqual(
+                find_first_line(data, key, 0, len(data)), expected, key)
+
+    def test_get_lines(self):
+        """Test SymbolIndex on some data."""
+        data = b'header\na e os\na pi cmath\na pi math\na pi2 math\n' \
+            b'm math\nm os\n'
+        index = SymbolIndex(data, len(b'header\n'), len(data))
+        self.assertEqual(index.get_module_names(), ['math', 'os'])
+        self.assertEqual(index.get_public_module_names(), ('math', 'os'))
+        self.assertTrue(index.get_public_module_names()
+                        is index.get_public_module_names())
+        self.assertEqual(index.get_modules_with_attribute('pi'),
+                         set(['math', 'cmath']))
+        self.assertEqual(index.get_modules_with_attribute('p'), set())
+        self.assertEqual(index.get_modules_with_attribute('zzz'), set())
+
+
+class SymbolIndexFileTests(unittest_module.TestCase):
+    """Tests about the index file."""
+
+    def setUp(self):
+        """Create a temporary directory for the index files."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        rmtree(self.directory)
+
+    def test_build_and_reload(self):
+        """Index file is written and reused."""
+        modules = ['math', 'os']
+        path = get_index_path(modules, self.directory)
+        self.assertEqual(load_index(path), None)
+        index = open_index(modules, self.directory)
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue('math' in index.get_module_names())
+        self.assertTrue('sys' in index.get_module_names())
+        self.assertEqual(index.get_modules_with_attribute('pi'),
+                         set(['math']))
+        self.assertEqual(index.get_modules_with_attribute('sep'),
+                         set(['os']))
+        index2 = load_index(path)
+        self.assertEqual(index2.get_module_names(), index.get_module_names())
+
+    def test_key_changes(self):
+        """Index file depends on the modules and on the interpreter."""
+        path = get_index_path(['math'], self.directory)
+        self.assertNotEqual(path, get_index_path(['os'], self.directory))
+        self.assertTrue(str(sys.version_info[0]) in os.path.basename(path))
+
+    def test_invalid_file(self):
+        """Invalid files are rebuilt."""
+        modules = ['math']
+        path = get_index_path(modules, self.directory)
+        with open(path, 'wb') as index_file:
+            index_file.write(b'something else\n')
+        self.assertEqual(load_index(path), None)
+        index = open_index(modules, self.directory)
+        self.assertEqual(index.get_modules_with_attribute('pi'),
+                         set(['math']))
+        self.assertFalse(load_index(path) is None)
+
+    def test_files_for_other_fingerprints_kept(self):
+        """Files for other fingerprints of the interpreter are kept."""
+        modules = ['math']
+        path = get_index_path(modules, self.directory)
+        other_fingerprint = path.rsplit('-', 1)[0] + '-0123456789abcdef.idx'
+        other = os.path.join(self.directory, 'other.idx')
+        for filename in (other_fingerprint, other):
+            with open(filename, 'wb') as index_file:
+                index_file.write(b'')
+        open_index(modules, self.directory)
+        for filename in (path, other_fingerprint, other):
+            self.assertTrue(os.path.exists(filename))
+
+    def test_least_recently_used_files_removed(self):
+        """Only the most recently used index files are kept."""
+        paths = [os.path.join(self.directory, 'symbols-{0}.idx'.format(i))
+                 for i in range(MAX_INDEX_FILES + 2)]
+        for i, path in enumerate(paths):
+            with open(path, 'wb') as index_file:
+                index_file.write(b'')
+            os.utime(path, (i, i))
+        os.utime(paths[0], None)  # as if it was loaded
+        write_index(paths[1], b'')
+        self.assertEqual(
+            sorted(filename for filename in os.listdir(self.directory)),
+            sorted(os.path.basename(path) for path in
+                   paths[:2] + paths[-(MAX_INDEX_FILES - 2):]))
+
+    def test_not_writable(self):
+        """Index is kept in memory when the file can not be written."""
+        modules = ['math']
+        directory = os.path.join(self.directory, 'file')
+        with open(directory, 'wb') as not_a_dir:
+            not_a_dir.write(b'')
+        index = open_index(modules, directory)
+        self.assertEqual(index.get_modules_with_attribute('pi'),
+                         set(['math']))
+        self.assertEqual(index.get_module_names(),
+                         open_index(modules, self.directory)
+                         .get_module_names())
+
+    def test_build_index_data(self):
+        """Lines are sorted and attributes are only for given modules."""
+        lines = build_index_data(['math']).decode('utf-8').splitlines()
+        self.assertEqual(lines, sorted(lines))
+        self.assertTrue('a pi math' in lines)
+        self.assertTrue('m math' in lines)
+        self.assertFalse(any(line.startswith('a ') and line.endswith(' os')
+                             for line in lines))
+
+
+if __name__ == '__main__':
+    print(sys.version_info)
+    unittest_module.main()